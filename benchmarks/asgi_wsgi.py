@@ -0,0 +1,140 @@
+"""
+Compara as páginas públicas servidas de forma síncrona (WSGI, uma thread por
+requisição) e assíncrona (ASGI, views de crm/views_async.py em um único loop
+de eventos), com alta concorrência e um banco local.
+
+As requisições passam pela pilha completa do Django (middlewares, URLs,
+views e templates) através do Client e do AsyncClient de teste, sem rede.
+Por padrão o cache é desligado (DummyCache), para que toda requisição vá ao
+banco; use --com-cache para medir o caso com o catálogo em cache.
+
+Uso:
+    python -m benchmarks.asgi_wsgi --requisicoes 2000 --concorrencia 64
+"""
+import argparse
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.comum import banco_de_teste, configurar_django, percentis
+
+
+def semear(quantidade_planos):
+    from crm.models import Plano
+
+    Plano.objects.bulk_create([
+        Plano(nome_plano=f'Plano {i}', valor=10 + i, descricao='Plano de carga')
+        for i in range(quantidade_planos)
+    ])
+    return list(Plano.objects.values_list('id', flat=True))
+
+
+def urlconf(modulo):
+    """As rotas de crm/urls.py, com as páginas públicas apontando para as views de 'modulo'."""
+    from django.urls import URLPattern
+
+    from crm import urls
+
+    class Urls:
+        urlpatterns = []
+
+    for rota in urls.urlpatterns:
+        if isinstance(rota, URLPattern):
+            view = getattr(modulo, rota.callback.__name__, None)
+            if view is not None and view.__module__ == modulo.__name__:
+                rota = URLPattern(rota.pattern, view, rota.default_args, rota.name)
+        Urls.urlpatterns.append(rota)
+    return Urls
+
+
+def caminhos(planos, total):
+    """Metade home, metade checkout, alternando os planos."""
+    return ['/' if i % 2 else f'/checkout/{planos[i % len(planos)]}/' for i in range(total)]
+
+
+def medir_wsgi(urls, concorrencia):
+    from django.db import connections
+    from django.test import Client
+
+    locais = threading.local()
+
+    def requisitar(url):
+        if not hasattr(locais, 'cliente'):
+            locais.cliente = Client()
+        inicio = time.perf_counter()
+        resposta = locais.cliente.get(url)
+        assert resposta.status_code == 200, resposta.status_code
+        return time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concorrencia, initializer=connections.close_all) as pool:
+        latencias = list(pool.map(requisitar, urls))
+    return latencias, time.perf_counter() - inicio
+
+
+def medir_asgi(urls, concorrencia):
+    from django.test import AsyncClient
+
+    async def executar():
+        cliente = AsyncClient()
+        semaforo = asyncio.Semaphore(concorrencia)
+
+        async def requisitar(url):
+            async with semaforo:
+                inicio = time.perf_counter()
+                resposta = await cliente.get(url)
+                assert resposta.status_code == 200, resposta.status_code
+                return time.perf_counter() - inicio
+
+        return await asyncio.gather(*(requisitar(url) for url in urls))
+
+    inicio = time.perf_counter()
+    latencias = asyncio.run(executar())
+    return latencias, time.perf_counter() - inicio
+
+
+def resumo(latencias, duracao):
+    return {
+        'requisicoes': len(latencias),
+        'duracao_s': round(duracao, 3),
+        'req_por_s': round(len(latencias) / duracao, 1),
+        **percentis(latencias),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requisicoes', type=int, default=2000)
+    parser.add_argument('--concorrencia', type=int, default=64)
+    parser.add_argument('--planos', type=int, default=6)
+    parser.add_argument('--com-cache', action='store_true', help='Mantém o cache configurado.')
+    args = parser.parse_args()
+
+    configurar_django()
+    from django.test.utils import override_settings
+
+    from crm import views, views_async
+
+    ajustes = {'DEBUG': False, 'ALLOWED_HOSTS': ['testserver']}
+    if not args.com_cache:
+        ajustes['CACHES'] = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+    with banco_de_teste(), override_settings(**ajustes):
+        urls = caminhos(semear(args.planos), args.requisicoes)
+        resultados = {}
+        with override_settings(ROOT_URLCONF=urlconf(views)):
+            resultados['wsgi_sync'] = resumo(*medir_wsgi(urls, args.concorrencia))
+        with override_settings(ROOT_URLCONF=urlconf(views_async)):
+            resultados['asgi_async'] = resumo(*medir_asgi(urls, args.concorrencia))
+
+    print(json.dumps({
+        'concorrencia': args.concorrencia,
+        'cache': args.com_cache,
+        **resultados,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
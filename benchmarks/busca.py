@@ -0,0 +1,94 @@
+"""
+Latência do autocomplete da equipe (crm/busca.py) numa tabela grande.
+
+Cria um banco de teste com --usuarios usuários (nomes, e-mails e telefones
+sorteados de listas fixas) e mede, para cada termo de TERMOS, duas formas de
+achar os primeiros 10:
+
+- contem: o "contém" do admin antigo, um LIKE '%...%' por campo;
+- indice: busca.autocompletar(), que usa o índice de texto da coluna 'busca'
+  (FULLTEXT no MySQL, FTS5 no SQLite).
+
+Imprime em JSON, por forma e termo, p50/p95/p99 em milissegundos:
+
+    python -m benchmarks.busca --usuarios 1000000 --repeticoes 50
+    DB_ENGINE=mysql python -m benchmarks.busca --usuarios 1000000
+"""
+import argparse
+import json
+import random
+import time
+
+from benchmarks.comum import banco_de_teste, configurar_django, percentis
+
+NOMES = ['Ana', 'Bruno', 'Carla', 'Diego', 'Eduarda', 'Fábio', 'Gabriela', 'Heitor', 'Íris', 'João']
+SOBRENOMES = ['Silva', 'Souza', 'Conceição', 'Oliveira', 'Pereira', 'Lima', 'Araújo', 'Gonçalves']
+# Prefixo comum, nome e sobrenome, e-mail e telefone.
+TERMOS = ['an', 'joao sil', 'gabriela.araujo', '81 9876']
+
+
+def semear(quantidade, lote=5000):
+    from crm import busca
+    from crm.models import Usuario
+
+    sorteio = random.Random(42)
+    for inicio in range(0, quantidade, lote):
+        usuarios = []
+        for numero in range(inicio, min(inicio + lote, quantidade)):
+            nome, sobrenome = sorteio.choice(NOMES), sorteio.choice(SOBRENOMES)
+            usuarios.append(Usuario(
+                nome_completo=f'{nome} {sobrenome}',
+                email=f'{busca.normalizar(nome)}.{busca.normalizar(sobrenome)}{numero}@exemplo.com',
+                telefone=f'(81) 9{sorteio.randrange(10 ** 8):08d}',
+            ))
+        Usuario.objects.bulk_create(usuarios)
+
+
+def contem(texto):
+    from django.db.models import Q
+
+    from crm.models import Usuario
+
+    filtro = Q()
+    for campo in ('nome_completo', 'email', 'telefone'):
+        filtro |= Q(**{f'{campo}__icontains': texto})
+    return list(Usuario.objects.filter(filtro).values_list('pk', 'nome_completo', 'email')[:10])
+
+
+def indice(texto):
+    from crm import busca
+
+    return busca.autocompletar(texto, ['usuario'])
+
+
+def medir(funcao, texto, repeticoes):
+    funcao(texto)  # aquecimento
+    latencias = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao(texto)
+        latencias.append(time.perf_counter() - inicio)
+    return percentis(latencias)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--usuarios', type=int, default=100000)
+    parser.add_argument('--repeticoes', type=int, default=50)
+    args = parser.parse_args()
+
+    configurar_django()
+    with banco_de_teste():
+        inicio = time.monotonic()
+        semear(args.usuarios)
+        semeadura = round(time.monotonic() - inicio, 1)
+        resultados = {
+            nome: {texto: medir(funcao, texto, args.repeticoes) for texto in TERMOS}
+            for nome, funcao in (('contem', contem), ('indice', indice))
+        }
+
+    print(json.dumps({'usuarios': args.usuarios, 'semeadura_s': semeadura, **resultados}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
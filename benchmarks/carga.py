@@ -0,0 +1,233 @@
+"""
+Benchmark das rotas do crm: home, checkout, criar_plano e changelists do admin.
+
+Cria um banco de teste com volumes configuráveis de Plano, Usuario,
+Barbearia e Assinatura, dispara as requisições de cada cenário pelo Client de
+teste (a pilha completa do Django, sem rede), a partir de várias threads, e
+imprime em JSON, por cenário: vazão, p50/p95/p99 e consultas SQL por
+requisição.
+
+Roda contra o banco configurado em setup/settings.py (SQLite ou um MySQL
+local); nada é gravado no banco de desenvolvimento.
+
+Para comparar versões, salve o resultado de uma e compare a outra com ele:
+
+    python -m benchmarks.carga --saida base.json
+    python -m benchmarks.carga --comparar base.json --tolerancia 0.2
+
+Com --comparar, o comando termina com código 1 se algum cenário ficou mais
+lento (p95) ou passou a fazer mais consultas que a base, além da tolerância.
+
+Uso:
+    python -m benchmarks.carga --assinaturas 100000 --requisicoes 500 --concorrencia 8
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.comum import banco_de_teste, configurar_django, percentis
+
+SENHA_ADMIN = 'benchmark'
+
+
+def semear(planos, usuarios, barbearias, assinaturas, lote=5000):
+    """Cria os registros com bulk_create e retorna os ids dos planos."""
+    from django.contrib.auth.models import User
+
+    from crm.models import Assinatura, Barbearia, Plano, Usuario
+
+    aleatorio = random.Random(42)  # mesma massa de dados a cada execução
+    Plano.objects.bulk_create([
+        Plano(nome_plano=f'Plano {i}', valor=20 + 10 * i, descricao='Plano de carga', duracao_dias=30)
+        for i in range(planos)
+    ])
+    # O bulk_create do manager preenche a coluna de busca (crm/busca.py).
+    Usuario.objects.bulk_create((
+        Usuario(nome_completo=f'Usuário {i}', email=f'usuario{i}@carga.test', telefone='81 99999-0000')
+        for i in range(usuarios)
+    ), batch_size=lote)
+    estados = ['PE', 'SP', 'RJ', 'MG', 'BA', 'RS']
+    Barbearia.objects.bulk_create((
+        Barbearia(
+            nome_barbearia=f'Barbearia {i}', endereco=f'Rua {i}', cidade='Recife',
+            estado=estados[i % len(estados)], cep='50000-000',
+        )
+        for i in range(barbearias)
+    ), batch_size=lote)
+
+    ids_planos = list(Plano.objects.values_list('id', flat=True))
+    ids_usuarios = list(Usuario.objects.values_list('id', flat=True))
+    ids_barbearias = list(Barbearia.objects.values_list('id', flat=True))
+
+    def nova_assinatura(i):
+        status = aleatorio.choices(['pendente', 'pago', 'cancelado'], weights=[2, 7, 1])[0]
+        return Assinatura(
+            usuario_id=aleatorio.choice(ids_usuarios),
+            barbearia_id=aleatorio.choice(ids_barbearias),
+            plano_id=aleatorio.choice(ids_planos),
+            status_pagamento=status,
+            id_transacao_pagamento=f'carga-{i}' if status != 'pendente' else None,
+        )
+
+    Assinatura.objects.bulk_create((nova_assinatura(i) for i in range(assinaturas)), batch_size=lote)
+    User.objects.create_superuser('benchmark', 'benchmark@carga.test', SENHA_ADMIN)
+    return ids_planos
+
+
+def changelists():
+    """Changelists do admin dos modelos do crm que estiverem registrados."""
+    from django.contrib import admin
+    from django.urls import reverse
+
+    from crm.models import Assinatura, Barbearia, Plano, Usuario
+
+    return {
+        f'admin_{modelo._meta.model_name}': reverse(
+            f'admin:{modelo._meta.app_label}_{modelo._meta.model_name}_changelist'
+        )
+        for modelo in (Plano, Usuario, Barbearia, Assinatura)
+        if admin.site.is_registered(modelo)
+    }
+
+
+def cenarios(ids_planos):
+    """
+    Cada cenário é (nome, função que recebe o índice da requisição e devolve
+    (método, url, dados), se precisa de login, status esperado).
+    """
+    from django.urls import reverse
+
+    lista = [
+        ('home', lambda i: ('get', reverse('home'), None), False, 200),
+        ('checkout', lambda i: ('get', reverse('checkout', args=[ids_planos[i % len(ids_planos)]]), None), False, 200),
+        ('criar_plano', lambda i: ('post', reverse('criar_plano'), {
+            'nome_plano': f'Novo {i}', 'valor': '99.90', 'descricao': 'Criado no benchmark', 'duracao_dias': '30',
+        }), False, 302),
+    ]
+    for nome, url in changelists().items():
+        lista.append((nome, lambda i, url=url: ('get', url, None), True, 200))
+    return lista
+
+
+def medir(cenario, requisicoes, concorrencia):
+    from django.db import connection, connections
+    from django.test import Client
+
+    nome, montar, com_login, esperado = cenario
+    locais = threading.local()
+
+    def contar(execute, sql, params, many, context):
+        locais.consultas += 1
+        return execute(sql, params, many, context)
+
+    def requisitar(i):
+        if not hasattr(locais, 'cliente'):
+            locais.cliente = Client()
+            if com_login:
+                locais.cliente.login(username='benchmark', password=SENHA_ADMIN)
+        metodo, url, dados = montar(i)
+        locais.consultas = 0
+        inicio = time.perf_counter()
+        with connection.execute_wrapper(contar):
+            resposta = getattr(locais.cliente, metodo)(url, dados)
+        decorrido = time.perf_counter() - inicio
+        assert resposta.status_code == esperado, (nome, url, resposta.status_code)
+        return decorrido, locais.consultas
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concorrencia, initializer=connections.close_all) as pool:
+        medidas = list(pool.map(requisitar, range(requisicoes)))
+    duracao = time.perf_counter() - inicio
+
+    latencias = [latencia for latencia, _ in medidas]
+    consultas = [quantidade for _, quantidade in medidas]
+    return {
+        'requisicoes': requisicoes,
+        'duracao_s': round(duracao, 3),
+        'req_por_s': round(requisicoes / duracao, 1),
+        **percentis(latencias),
+        'consultas_por_requisicao': round(sum(consultas) / len(consultas), 2),
+        'consultas_max': max(consultas),
+    }
+
+
+def comparar(atual, base, tolerancia):
+    """Lista as regressões de 'atual' em relação a 'base'."""
+    regressoes = []
+    for nome, medida in atual['cenarios'].items():
+        anterior = base.get('cenarios', {}).get(nome)
+        if not anterior:
+            continue
+        if medida['p95_ms'] > anterior['p95_ms'] * (1 + tolerancia):
+            regressoes.append(f"{nome}: p95 {anterior['p95_ms']} ms -> {medida['p95_ms']} ms")
+        if medida['consultas_por_requisicao'] > anterior['consultas_por_requisicao']:
+            regressoes.append(
+                f"{nome}: consultas por requisição "
+                f"{anterior['consultas_por_requisicao']} -> {medida['consultas_por_requisicao']}"
+            )
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--planos', type=int, default=6)
+    parser.add_argument('--usuarios', type=int, default=2000)
+    parser.add_argument('--barbearias', type=int, default=2000)
+    parser.add_argument('--assinaturas', type=int, default=20000)
+    parser.add_argument('--requisicoes', type=int, default=300, help='Requisições por cenário.')
+    parser.add_argument('--concorrencia', type=int, default=4)
+    parser.add_argument('--cenario', action='append', help='Roda só os cenários indicados (pode repetir).')
+    parser.add_argument('--sem-cache', action='store_true', help='Troca o cache por DummyCache.')
+    parser.add_argument('--saida', help='Também grava o resultado neste arquivo JSON.')
+    parser.add_argument('--comparar', help='Arquivo JSON de uma execução anterior, usado como base.')
+    parser.add_argument('--tolerancia', type=float, default=0.2, help='Piora aceita no p95 (0.2 = 20%%).')
+    args = parser.parse_args()
+
+    configurar_django()
+    from django.db import connection
+    from django.test.utils import override_settings
+
+    # Sem limite de requisições (crm/limites.py): todas vêm do mesmo IP, e o
+    # cenário criar_plano passaria a medir respostas 429.
+    ajustes = {'DEBUG': False, 'ALLOWED_HOSTS': ['testserver'], 'CRM_LIMITES': {}}
+    if args.sem_cache:
+        ajustes['CACHES'] = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+    with banco_de_teste(), override_settings(**ajustes):
+        inicio = time.perf_counter()
+        ids_planos = semear(args.planos, args.usuarios, args.barbearias, args.assinaturas)
+        resultado = {
+            'banco': connection.vendor,
+            'volumes': {
+                'planos': args.planos, 'usuarios': args.usuarios,
+                'barbearias': args.barbearias, 'assinaturas': args.assinaturas,
+            },
+            'semeadura_s': round(time.perf_counter() - inicio, 3),
+            'concorrencia': args.concorrencia,
+            'cache': not args.sem_cache,
+            'cenarios': {},
+        }
+        for cenario in cenarios(ids_planos):
+            if args.cenario and cenario[0] not in args.cenario:
+                continue
+            resultado['cenarios'][cenario[0]] = medir(cenario, args.requisicoes, args.concorrencia)
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as arquivo:
+            resultado['regressoes'] = comparar(resultado, json.load(arquivo), args.tolerancia)
+
+    texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+    print(texto)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as arquivo:
+            arquivo.write(texto + '\n')
+    if resultado.get('regressoes'):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Utilitários compartilhados pelos benchmarks.
+
+Os benchmarks rodam fora do manage.py test, então cuidam eles mesmos de
+configurar o Django e de criar (e depois apagar) um banco de teste, usando
+as mesmas configurações de TEST do banco 'default'. Nada é gravado no banco
+de desenvolvimento.
+"""
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+
+def configurar_django():
+    raiz = str(Path(__file__).resolve().parent.parent)
+    if raiz not in sys.path:
+        sys.path.insert(0, raiz)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'setup.settings')
+    import django
+    django.setup()
+
+
+def _ajustar_sqlite(sender, connection, **kwargs):
+    # Sem fsync a cada commit: o banco de benchmark é descartável e, em discos
+    # lentos, o fsync dominaria o tempo medido.
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous=OFF')
+
+
+@contextmanager
+def banco_de_teste():
+    """Cria o banco de teste (com as migrações aplicadas) e o apaga no fim."""
+    from django.db import connection
+    from django.db.backends.signals import connection_created
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    nome_original = connection.settings_dict['NAME']
+    if connection.vendor == 'sqlite' and not connection.settings_dict['TEST'].get('NAME'):
+        # O SQLite de teste padrão fica em memória e não aguenta várias
+        # threads escrevendo; usamos um arquivo temporário.
+        connection.settings_dict['TEST']['NAME'] = os.path.join(tempfile.gettempdir(), 'barbersites_benchmark.sqlite3')
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    if connection.vendor == 'sqlite':
+        # Modo WAL: leitores não bloqueiam o escritor (o padrão do SQLite bloqueia).
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode=WAL')
+        _ajustar_sqlite(None, connection)
+        connection_created.connect(_ajustar_sqlite)
+    try:
+        yield
+    finally:
+        connection_created.disconnect(_ajustar_sqlite)
+        connection.creation.destroy_test_db(nome_original, verbosity=0)
+        teardown_test_environment()
+
+
+def percentis(latencias):
+    """p50, p95 e p99 em milissegundos a partir de latências em segundos."""
+    if not latencias:
+        return {'p50_ms': None, 'p95_ms': None, 'p99_ms': None}
+    if len(latencias) == 1:
+        valor = round(latencias[0] * 1000, 3)
+        return {'p50_ms': valor, 'p95_ms': valor, 'p99_ms': valor}
+    cortes = statistics.quantiles(latencias, n=100, method='inclusive')
+    return {
+        'p50_ms': round(cortes[49] * 1000, 3),
+        'p95_ms': round(cortes[94] * 1000, 3),
+        'p99_ms': round(cortes[98] * 1000, 3),
+    }
+
+
+def subir_servidor():
+    """Sobe a aplicação em um servidor WSGI local, com uma thread por conexão."""
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+
+    class Silencioso(WSGIRequestHandler):
+        def setup(self):
+            super().setup()
+            # Sem o atraso do algoritmo de Nagle entre cabeçalhos e corpo.
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        def log_message(self, *args):
+            pass
+
+    servidor = ThreadedWSGIServer(('127.0.0.1', 0), Silencioso, allow_reuse_address=True)
+    servidor.set_app(WSGIHandler())
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
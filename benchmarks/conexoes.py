@@ -0,0 +1,120 @@
+"""
+Latência por requisição com e sem reaproveitamento da conexão com o banco.
+
+Sobe a aplicação em um servidor WSGI local e, de várias threads com conexões
+HTTP keep-alive, pede a página inicial com o cache desligado (DummyCache),
+para que toda requisição consulte o banco. Mede duas vezes:
+
+- sem_reuso: CONN_MAX_AGE = 0, uma conexão nova com o banco por requisição;
+- com_reuso: CONN_MAX_AGE > 0 e CONN_HEALTH_CHECKS, como em setup/settings.py.
+
+Imprime em JSON, por modo, vazão, p50/p95/p99 e quantas conexões com o banco
+foram abertas. No SQLite abrir uma conexão é barato; a diferença de verdade
+aparece contra o MySQL (rede, autenticação, init_command):
+
+    DB_ENGINE=mysql python -m benchmarks.conexoes --requisicoes 2000 --concorrencia 8
+"""
+import argparse
+import http.client
+import json
+import threading
+import time
+
+from benchmarks.comum import banco_de_teste, configurar_django, percentis, subir_servidor
+
+
+def semear(quantidade_planos):
+    from crm.models import Plano
+
+    Plano.objects.bulk_create([
+        Plano(nome_plano=f'Plano {i}', valor=10 + i, descricao='Plano de carga')
+        for i in range(quantidade_planos)
+    ])
+
+
+def cliente(porta, restantes, latencias, trava):
+    """Uma thread cliente: reaproveita a mesma conexão HTTP (keep-alive)."""
+    conexao = http.client.HTTPConnection('127.0.0.1', porta)
+    while True:
+        with trava:
+            if restantes[0] <= 0:
+                break
+            restantes[0] -= 1
+        inicio = time.perf_counter()
+        conexao.request('GET', '/')
+        resposta = conexao.getresponse()
+        resposta.read()
+        decorrido = time.perf_counter() - inicio
+        assert resposta.status == 200, resposta.status
+        with trava:
+            latencias.append(decorrido)
+    conexao.close()
+
+
+def medir(conn_max_age, requisicoes, concorrencia):
+    from django.db import DEFAULT_DB_ALIAS, connections
+    from django.db.backends.signals import connection_created
+
+    # As conexões de cada thread do servidor são criadas a partir deste dicionário.
+    configuracao = connections.settings[DEFAULT_DB_ALIAS]
+    configuracao['CONN_MAX_AGE'] = conn_max_age
+    configuracao['CONN_HEALTH_CHECKS'] = conn_max_age != 0
+
+    abertas, trava = [0], threading.Lock()
+
+    def contar(sender, connection, **kwargs):
+        with trava:
+            abertas[0] += 1
+
+    connection_created.connect(contar)
+    servidor = subir_servidor()
+    latencias, restantes = [], [requisicoes]
+    threads = [
+        threading.Thread(target=cliente, args=(servidor.server_port, restantes, latencias, trava))
+        for _ in range(concorrencia)
+    ]
+    inicio = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duracao = time.perf_counter() - inicio
+    servidor.shutdown()
+    servidor.server_close()
+    connection_created.disconnect(contar)
+
+    return {
+        'conn_max_age': conn_max_age,
+        'requisicoes': len(latencias),
+        'req_por_s': round(len(latencias) / duracao, 1),
+        **percentis(latencias),
+        'conexoes_abertas': abertas[0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requisicoes', type=int, default=1000)
+    parser.add_argument('--concorrencia', type=int, default=8)
+    parser.add_argument('--planos', type=int, default=6)
+    parser.add_argument('--conn-max-age', type=int, default=60, help='CONN_MAX_AGE do modo com reuso.')
+    args = parser.parse_args()
+
+    configurar_django()
+    from django.test.utils import override_settings
+
+    with banco_de_teste(), override_settings(
+        DEBUG=False, ALLOWED_HOSTS=['127.0.0.1'],
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+    ):
+        semear(args.planos)
+        resultados = {
+            'sem_reuso': medir(0, args.requisicoes, args.concorrencia),
+            'com_reuso': medir(args.conn_max_age, args.requisicoes, args.concorrencia),
+        }
+
+    print(json.dumps({'concorrencia': args.concorrencia, **resultados}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
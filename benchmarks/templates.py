@@ -0,0 +1,109 @@
+"""
+Tempo de renderização da home e do checkout, por configuração de templates.
+
+Renderiza cada página direto pelo motor de templates, sem passar pela view
+nem pelo cache de páginas (crm/cache_paginas.py), que esconderia o custo que
+interessa aqui: o que sobra quando a página inteira não está em cache (um
+visitante logado, uma URL nova, o checkout depois de um erro no formulário).
+Os planos são montados em memória; nenhum banco é usado. Três modos:
+
+- sem_cache: os templates são lidos e compilados a cada renderização (como
+  com DEBUG) e os fragmentos {% cache %} nunca acertam (DummyCache);
+- carregador_em_cache: cached.Loader, como fora do DEBUG, sem fragmentos;
+- com_fragmentos: cached.Loader e os fragmentos dos planos em cache.
+
+Imprime em JSON, por modo e página, a média e p50/p95/p99 em milissegundos:
+
+    python -m benchmarks.templates --planos 12 --repeticoes 2000
+"""
+import argparse
+import json
+import statistics
+import time
+from decimal import Decimal
+
+from benchmarks.comum import configurar_django, percentis
+
+CARREGADORES = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+MODOS = {
+    'sem_cache': (CARREGADORES, 'django.core.cache.backends.dummy.DummyCache'),
+    'carregador_em_cache': (
+        [('django.template.loaders.cached.Loader', CARREGADORES)],
+        'django.core.cache.backends.dummy.DummyCache',
+    ),
+    'com_fragmentos': (
+        [('django.template.loaders.cached.Loader', CARREGADORES)],
+        'django.core.cache.backends.locmem.LocMemCache',
+    ),
+}
+VERSAO = 1  # versão do catálogo fixa: os fragmentos são reaproveitados
+
+
+def paginas(quantidade_planos):
+    """(nome, template, contexto, caminho) de cada página medida."""
+    from crm.forms import CheckoutForm
+    from crm.models import Plano
+    from crm.views import contexto_checkout
+
+    planos = [
+        Plano(id=i, nome_plano=f'Plano {i}', valor=Decimal(20 + 10 * i),
+              descricao='Plano de carga com uma descrição de tamanho médio.', duracao_dias=30)
+        for i in range(1, quantidade_planos + 1)
+    ]
+    selecionado = planos[0]
+    form = CheckoutForm(initial={'plano': selecionado.id}, planos=planos)
+    return [
+        ('home', 'crm/index.html', {'planos': planos, 'versao_catalogo': VERSAO}, '/'),
+        ('checkout', 'crm/checkout.html',
+         contexto_checkout(selecionado, planos, form, VERSAO), f'/checkout/{selecionado.id}/'),
+    ]
+
+
+def medir(template, contexto, caminho, repeticoes):
+    from django.template.loader import render_to_string
+    from django.test import RequestFactory
+
+    request = RequestFactory().get(caminho)
+    render_to_string(template, contexto, request)  # aquecimento
+    latencias = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        render_to_string(template, contexto, request)
+        latencias.append(time.perf_counter() - inicio)
+    return {'media_ms': round(statistics.fmean(latencias) * 1000, 3), **percentis(latencias)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--planos', type=int, default=6)
+    parser.add_argument('--repeticoes', type=int, default=1000)
+    args = parser.parse_args()
+
+    configurar_django()
+    from django.conf import settings
+    from django.test.utils import override_settings
+
+    resultados = {}
+    for modo, (carregadores, backend) in MODOS.items():
+        templates = [{
+            **settings.TEMPLATES[0],
+            'APP_DIRS': False,
+            'OPTIONS': {**settings.TEMPLATES[0]['OPTIONS'], 'loaders': carregadores},
+        }]
+        with override_settings(
+            TEMPLATES=templates, ALLOWED_HOSTS=['testserver'],
+            CACHES={'default': {'BACKEND': backend, 'LOCATION': 'benchmark-templates'}},
+        ):
+            resultados[modo] = {
+                nome: medir(template, contexto, caminho, args.repeticoes)
+                for nome, template, contexto, caminho in paginas(args.planos)
+            }
+
+    print(json.dumps({'planos': args.planos, 'repeticoes': args.repeticoes, **resultados}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
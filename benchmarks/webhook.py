@@ -0,0 +1,124 @@
+"""
+Teste de carga do webhook de pagamento com um gateway falso local.
+
+Cria um banco de teste com N assinaturas pendentes, sobe a aplicação em um
+servidor WSGI local (com threads) e dispara, a partir de várias threads, um
+evento 'pago' por assinatura mais uma fração de reenvios do mesmo evento,
+como os gateways fazem. No fim, confere que cada assinatura foi paga
+exatamente uma vez e imprime as métricas em JSON.
+
+Uso:
+    python -m benchmarks.webhook --assinaturas 5000 --concorrencia 32 --reenvios 0.2
+"""
+import argparse
+import hashlib
+import hmac
+import http.client
+import json
+import random
+import threading
+import time
+from collections import Counter
+
+from benchmarks.comum import banco_de_teste, configurar_django, percentis, subir_servidor
+
+SEGREDO = 'segredo-do-benchmark'
+
+
+def semear(quantidade):
+    from crm.models import Assinatura, Barbearia, Plano, Usuario
+
+    plano = Plano.objects.create(nome_plano='Mensal', valor=49, duracao_dias=30)
+    usuario = Usuario.objects.create(nome_completo='Carga', email='carga@x.com', telefone='11')
+    barbearia = Barbearia.objects.create(
+        nome_barbearia='Carga', endereco='Rua 1', cidade='Recife', estado='PE', cep='50000-000'
+    )
+    Assinatura.objects.bulk_create(
+        [Assinatura(usuario=usuario, plano=plano, barbearia=barbearia) for _ in range(quantidade)],
+        batch_size=1000,
+    )
+    return list(Assinatura.objects.values_list('id', flat=True))
+
+
+def gateway(porta, eventos, latencias, resultados, trava):
+    """Uma thread do gateway falso: envia eventos da fila compartilhada."""
+    conexao = http.client.HTTPConnection('127.0.0.1', porta)
+    while True:
+        with trava:
+            if not eventos:
+                break
+            corpo = eventos.pop()
+        assinatura = hmac.new(SEGREDO.encode(), corpo, hashlib.sha256).hexdigest()
+        inicio = time.perf_counter()
+        try:
+            conexao.request('POST', '/webhooks/pagamento/', corpo, {
+                'Content-Type': 'application/json', 'X-Webhook-Assinatura': assinatura,
+            })
+            resposta = conexao.getresponse()
+            conteudo = resposta.read()
+            resultado = json.loads(conteudo)['resultado'] if resposta.status == 200 else f'http_{resposta.status}'
+        except (OSError, http.client.HTTPException, ValueError):
+            conexao.close()
+            conexao = http.client.HTTPConnection('127.0.0.1', porta)
+            resultado = 'erro'
+        decorrido = time.perf_counter() - inicio
+        with trava:
+            latencias.append(decorrido)
+            resultados[resultado] += 1
+    conexao.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--assinaturas', type=int, default=2000)
+    parser.add_argument('--concorrencia', type=int, default=16)
+    parser.add_argument('--reenvios', type=float, default=0.2, help='Fração de eventos reenviados.')
+    args = parser.parse_args()
+
+    configurar_django()
+    from django.test.utils import override_settings
+
+    with banco_de_teste(), override_settings(
+        PAGAMENTO_WEBHOOK_SEGREDO=SEGREDO, DEBUG=False, ALLOWED_HOSTS=['127.0.0.1'],
+    ):
+        from crm.models import Assinatura
+
+        ids = semear(args.assinaturas)
+        eventos = [
+            json.dumps({'assinatura_id': i, 'id_transacao': f'tx-{i}', 'status': 'pago'}).encode()
+            for i in ids
+        ]
+        eventos += random.sample(eventos, int(len(eventos) * args.reenvios))
+        random.shuffle(eventos)
+        total = len(eventos)
+
+        servidor = subir_servidor()
+        latencias, resultados, trava = [], Counter(), threading.Lock()
+        threads = [
+            threading.Thread(target=gateway, args=(servidor.server_port, eventos, latencias, resultados, trava))
+            for _ in range(args.concorrencia)
+        ]
+        inicio = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duracao = time.perf_counter() - inicio
+        servidor.shutdown()
+
+        pagas = Assinatura.objects.filter(status_pagamento='pago')
+        print(json.dumps({
+            'eventos': total,
+            'concorrencia': args.concorrencia,
+            'duracao_s': round(duracao, 3),
+            'eventos_por_s': round(total / duracao, 1),
+            **percentis(latencias),
+            'resultados': dict(resultados),
+            'assinaturas_pagas': pagas.count(),
+            'pagas_sem_expiracao': pagas.filter(data_expiracao__isnull=True).count(),
+            'esperado': len(ids),
+        }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
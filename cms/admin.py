@@ -1,3 +1,25 @@
 from django.contrib import admin
+from django.urls import reverse
+from django.utils.html import format_html
 
-# Register your models here.
+from crm.paginacao import ContagemEstimadaPaginator
+
+from .models import SiteBarbearia
+
+
+@admin.register(SiteBarbearia)
+class SiteBarbeariaAdmin(admin.ModelAdmin):
+    list_display = ('slug', 'barbearia', 'dominio', 'template', 'atualizado_em', 'link_site')
+    list_filter = ('template',)
+    list_select_related = ('barbearia',)
+    # Mesmas regras dos admins de crm/admin.py: nada de "contém" nem COUNT(*).
+    search_fields = ('^slug', '=dominio')
+    search_help_text = 'Início do endereço ou o domínio completo.'
+    autocomplete_fields = ('barbearia',)
+    ordering = ('-id',)
+    paginator = ContagemEstimadaPaginator
+    show_full_result_count = False
+
+    def link_site(self, obj):
+        return format_html('<a href="{}" target="_blank">abrir</a>', reverse('site', args=[obj.slug]))
+    link_site.short_description = 'Site'
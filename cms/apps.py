@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CmsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'cms'
+
+    def ready(self):
+        # Registra os sinais (cache dos sites das barbearias).
+        from cms import signals  # noqa: F401
@@ -0,0 +1,173 @@
+"""
+Geração estática dos sites das barbearias (manage.py build_sites).
+
+Os sites mudam pouco, e cada um é uma única página. Em vez de passar pelo
+Django a cada visita, eles podem ser gerados em disco e servidos direto pelo
+servidor web:
+
+    <saída>/manifesto.json
+    <saída>/<slug>/index.html   (mais index.html.gz e, com brotli, .br)
+
+Só entram os sites com assinatura paga e vigente (cms/tenants.py). O HTML é o
+mesmo de cms/paginas.py; os arquivos de /static/ são os do collectstatic,
+comuns a todos os sites, e não são copiados para cada um.
+
+A geração é incremental. Para cada site calculamos um hash do que vai na
+página: os campos do site e da barbearia e o código dos templates usados. O
+manifesto guarda o hash de cada site gerado; na próxima execução, só são
+renderizados os sites cujo hash mudou, e as pastas dos sites que saíram do
+ar (ou trocaram de endereço) são apagadas. A renderização e a compressão
+rodam em paralelo, num processo por núcleo.
+
+Um exemplo com nginx, com o Django por trás para o que não foi gerado:
+
+    server_name ~^(?<slug>[a-z0-9-]+)\\.barbersites\\.com\\.br$;
+    root /srv/barbersites/sites_estaticos/$slug;
+    gzip_static on;
+    location = / { try_files /index.html @django; }
+
+O manifesto também traz o domínio próprio de cada site, para montar o 'map'
+de domínio para pasta.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from django.db import connections
+from django.template.loader import get_template
+from django.utils import timezone
+from django.utils._os import safe_join
+
+from cms import paginas, tenants
+from cms.models import SiteBarbearia
+from crm.estaticos import comprimir
+from crm.lotes import iterar_por_chave
+from crm.roteamento import leitura_em_replica
+
+MANIFESTO = 'manifesto.json'
+PAGINA = 'index.html'
+# Mude quando o formato da saída mudar: força a geração de todos os sites.
+VERSAO = 1
+# Campos que não aparecem na página e mudam sozinhos.
+IGNORADOS = {'atualizado_em', 'busca'}
+
+
+def _campos(objeto):
+    return {
+        campo.attname: getattr(objeto, campo.attname)
+        for campo in objeto._meta.concrete_fields
+        if campo.attname not in IGNORADOS
+    }
+
+
+def impressao_templates():
+    """Hash do código dos templates de cada opção de SiteBarbearia.template."""
+    base = get_template('cms/site_base.html').template.source
+    return {
+        nome: hashlib.sha256((base + get_template(f'cms/site_{nome}.html').template.source).encode()).hexdigest()
+        for nome, _ in SiteBarbearia.TEMPLATES
+    }
+
+
+def hash_site(site, impressoes):
+    """Hash de tudo que a página do site mostra (site com a barbearia carregada)."""
+    dados = {
+        'versao': VERSAO,
+        'template': impressoes[site.template],
+        'site': _campos(site),
+        'barbearia': _campos(site.barbearia),
+    }
+    return hashlib.sha256(json.dumps(dados, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def ler_manifesto(saida):
+    try:
+        with open(os.path.join(saida, MANIFESTO), encoding='utf-8') as arquivo:
+            return json.load(arquivo)['sites']
+    except FileNotFoundError:
+        return {}
+
+
+def _gravar(caminho, dados):
+    """Grava ao lado e troca de uma vez: o servidor web nunca vê um arquivo pela metade."""
+    descritor, temporario = tempfile.mkstemp(dir=os.path.dirname(caminho), suffix='.tmp')
+    try:
+        with os.fdopen(descritor, 'wb') as arquivo:
+            arquivo.write(dados)
+        os.chmod(temporario, 0o644)
+        os.replace(temporario, caminho)
+    except BaseException:
+        os.unlink(temporario)
+        raise
+
+
+def gerar_site(site, saida):
+    """Renderiza o site em <saida>/<slug>/ e retorna os nomes dos arquivos gravados."""
+    pasta = safe_join(saida, site.slug)
+    os.makedirs(pasta, exist_ok=True)
+    conteudo = paginas.renderizar(site).encode()
+    arquivos = [(PAGINA, conteudo)] + [(PAGINA + extensao, dados) for extensao, dados in comprimir(conteudo)]
+    for nome, dados in arquivos:
+        _gravar(os.path.join(pasta, nome), dados)
+    # Uma cópia comprimida que deixou de valer a pena não pode ficar velha.
+    for nome in set(os.listdir(pasta)) - {nome for nome, _ in arquivos}:
+        if nome.startswith(PAGINA):
+            os.unlink(os.path.join(pasta, nome))
+    return [nome for nome, _ in arquivos]
+
+
+def _gerar_no_filho(argumentos):
+    return gerar_site(*argumentos)
+
+
+def sites_ativos(tamanho_lote=2000):
+    """Os sites no ar agora, com a barbearia carregada, lidos em lotes."""
+    with leitura_em_replica():
+        consulta = tenants.com_vencimento().filter(ativo_ate__gt=timezone.now()).select_related('barbearia')
+        yield from iterar_por_chave(consulta, tamanho_lote)
+
+
+def construir(saida, processos=1, todos=False, tamanho_lote=2000):
+    """
+    Gera os sites que mudaram desde a última execução e apaga os que saíram
+    do ar. Retorna (gerados, inalterados, removidos).
+    """
+    saida = os.path.abspath(saida)
+    os.makedirs(saida, exist_ok=True)
+    anteriores = {} if todos else ler_manifesto(saida)
+    impressoes = impressao_templates()
+
+    atuais, pendentes = {}, []
+    for site in sites_ativos(tamanho_lote):
+        hash_atual = hash_site(site, impressoes)
+        atuais[site.slug] = {'hash': hash_atual, 'barbearia_id': site.barbearia_id, 'dominio': site.dominio}
+        anterior = anteriores.get(site.slug)
+        if anterior is None or anterior['hash'] != hash_atual:
+            pendentes.append(site)
+
+    if processos > 1 and len(pendentes) > 1:
+        # Os filhos não usam o banco e não podem herdar as conexões abertas do pai.
+        connections.close_all()
+        contexto = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(max_workers=processos, mp_context=contexto) as executor:
+            lote = max(1, len(pendentes) // (processos * 4))
+            gerados = list(executor.map(_gerar_no_filho, [(site, saida) for site in pendentes], chunksize=lote))
+    else:
+        gerados = [gerar_site(site, saida) for site in pendentes]
+    for site, arquivos in zip(pendentes, gerados):
+        atuais[site.slug]['arquivos'] = arquivos
+    for slug, dados in atuais.items():
+        dados.setdefault('arquivos', anteriores.get(slug, {}).get('arquivos', [PAGINA]))
+
+    removidos = 0
+    for slug in set(ler_manifesto(saida)) - set(atuais):
+        shutil.rmtree(safe_join(saida, slug), ignore_errors=True)
+        removidos += 1
+
+    manifesto = {'versao': VERSAO, 'gerado_em': timezone.now().isoformat(), 'sites': atuais}
+    _gravar(os.path.join(saida, MANIFESTO), json.dumps(manifesto, indent=1, sort_keys=True).encode())
+    return len(pendentes), len(atuais) - len(pendentes), removidos
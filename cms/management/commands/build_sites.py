@@ -0,0 +1,53 @@
+"""
+Gera em disco os sites das barbearias com assinatura paga (cms/geracao.py).
+
+Pensado para rodar periodicamente, como o expirar_assinaturas; só os sites
+que mudaram são gerados de novo:
+
+    */10 * * * * cd /caminho/do/projeto && python manage.py build_sites
+
+Com --todos, ignora o manifesto e gera tudo (ex.: depois de um deploy que
+mudou algo fora dos templates dos sites).
+"""
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from cms.geracao import construir
+
+
+class Command(BaseCommand):
+    help = 'Gera o HTML estático dos sites das barbearias com assinatura paga.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--saida', default=None,
+            help='Pasta de saída (padrão: CMS_SITES_ESTATICOS).'
+        )
+        parser.add_argument(
+            '--processos', type=int, default=os.cpu_count() or 1,
+            help='Processos renderizando em paralelo (padrão: um por núcleo).'
+        )
+        parser.add_argument(
+            '--todos', action='store_true',
+            help='Gera todos os sites, mesmo os que não mudaram.'
+        )
+        parser.add_argument(
+            '--lote', type=int, default=2000,
+            help='Sites lidos do banco por vez (padrão: 2000).'
+        )
+
+    def handle(self, *args, **options):
+        if options['processos'] < 1 or options['lote'] < 1:
+            raise CommandError('--processos e --lote devem ser maiores que zero.')
+        saida = options['saida'] or settings.CMS_SITES_ESTATICOS
+        inicio = time.monotonic()
+        gerados, inalterados, removidos = construir(
+            saida, processos=options['processos'], todos=options['todos'], tamanho_lote=options['lote']
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'{gerados} site(s) gerado(s), {inalterados} sem mudanças e {removidos} removido(s) '
+            f'em {saida}, em {time.monotonic() - inicio:.1f}s.'
+        ))
@@ -0,0 +1,48 @@
+"""
+Sites das barbearias pelo host: barbeariadoze.barbersites.com.br ou o
+domínio próprio da barbearia (cms/tenants.py).
+
+Quando o host é o de um site no ar, a requisição passa a usar as rotas de
+cms/urls_site.py em vez de setup/urls.py (request.urlconf) e leva o tenant
+em request.site_barbearia. Os hosts da própria aplicação
+(CMS_HOSTS_PRINCIPAIS) seguem direto, sem consulta nenhuma.
+
+Um subdomínio de CMS_DOMINIO_SITES ou o domínio de um site fora do ar (sem
+assinatura paga vigente) também usa as rotas do site, com
+request.site_barbearia = None, e recebe 404. Qualquer outro host segue para
+as rotas normais; o ALLOWED_HOSTS já barrou antes os hosts que não são nossos.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from cms import tenants
+
+URLCONF_SITE = 'cms.urls_site'
+
+
+class SiteBarbeariaMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        chave = tenants.chave_do_host(request.get_host())
+        if chave is not None:
+            self._aplicar(request, chave, tenants.buscar(chave))
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        chave = tenants.chave_do_host(request.get_host())
+        if chave is not None:
+            self._aplicar(request, chave, await tenants.abuscar(chave))
+        return await self.get_response(request)
+
+    def _aplicar(self, request, chave, tenant):
+        if tenant is not None or chave[0] == 'slug':
+            request.urlconf = URLCONF_SITE
+            request.site_barbearia = tenant if tenant is not None and tenant.ativo else None
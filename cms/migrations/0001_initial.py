@@ -0,0 +1,36 @@
+# Generated by Django 4.1 on 2026-10-17 10:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('crm', '0007_busca'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SiteBarbearia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slug', models.SlugField(help_text='Vira <endereço>.CMS_DOMINIO_SITES e /sites/<endereço>/.', max_length=63, unique=True, verbose_name='Endereço')),
+                ('dominio', models.CharField(blank=True, help_text='Ex.: www.barbeariadoze.com.br. Precisa estar em ALLOWED_HOSTS.', max_length=253, null=True, unique=True, verbose_name='Domínio próprio')),
+                ('template', models.CharField(choices=[('premium', 'Barber Premium'), ('full', 'Barber Full'), ('flash', 'Barber Flash')], default='premium', max_length=20, verbose_name='Template')),
+                ('titulo', models.CharField(blank=True, help_text='Se ficar em branco, usa o nome da barbearia.', max_length=200, verbose_name='Título')),
+                ('descricao', models.TextField(blank=True, verbose_name='Descrição')),
+                ('whatsapp', models.CharField(blank=True, help_text='Só os números, com DDD. Ex.: 81999990000.', max_length=20, verbose_name='WhatsApp')),
+                ('instagram', models.CharField(blank=True, help_text='O usuário, sem o @.', max_length=100, verbose_name='Instagram')),
+                ('atualizado_em', models.DateTimeField(auto_now=True, verbose_name='Atualizado em')),
+                ('barbearia', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='site', to='crm.barbearia', verbose_name='Barbearia')),
+            ],
+            options={
+                'verbose_name': 'Site de Barbearia',
+                'verbose_name_plural': 'Sites de Barbearias',
+                'db_table': 'cms_site_barbearia',
+            },
+        ),
+    ]
@@ -1,3 +1,83 @@
 from django.db import models
 
-# Create your models here.
+from crm.models import Barbearia
+
+
+class SiteBarbearia(models.Model):
+    """
+    O site de uma barbearia: endereço (subdomínio ou domínio próprio), o
+    template escolhido e os textos. Só fica no ar enquanto a barbearia tiver
+    uma assinatura paga e vigente (veja cms/tenants.py).
+    """
+    TEMPLATES = [
+        ('premium', 'Barber Premium'),
+        ('full', 'Barber Full'),
+        ('flash', 'Barber Flash'),
+    ]
+
+    barbearia = models.OneToOneField(
+        Barbearia,
+        on_delete=models.CASCADE,
+        related_name='site',
+        verbose_name="Barbearia"
+    )
+    slug = models.SlugField(
+        max_length=63,  # limite de um rótulo de DNS
+        unique=True,
+        verbose_name="Endereço",
+        help_text="Vira <endereço>.CMS_DOMINIO_SITES e /sites/<endereço>/."
+    )
+    dominio = models.CharField(
+        max_length=253,
+        unique=True,
+        null=True,
+        blank=True,
+        verbose_name="Domínio próprio",
+        help_text="Ex.: www.barbeariadoze.com.br. Precisa estar em ALLOWED_HOSTS."
+    )
+    template = models.CharField(
+        max_length=20,
+        choices=TEMPLATES,
+        default='premium',
+        verbose_name="Template"
+    )
+    titulo = models.CharField(
+        max_length=200,
+        blank=True,
+        verbose_name="Título",
+        help_text="Se ficar em branco, usa o nome da barbearia."
+    )
+    descricao = models.TextField(
+        blank=True,
+        verbose_name="Descrição"
+    )
+    whatsapp = models.CharField(
+        max_length=20,
+        blank=True,
+        verbose_name="WhatsApp",
+        help_text="Só os números, com DDD. Ex.: 81999990000."
+    )
+    instagram = models.CharField(
+        max_length=100,
+        blank=True,
+        verbose_name="Instagram",
+        help_text="O usuário, sem o @."
+    )
+    atualizado_em = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Atualizado em"
+    )
+
+    class Meta:
+        db_table = 'cms_site_barbearia'
+        verbose_name = "Site de Barbearia"
+        verbose_name_plural = "Sites de Barbearias"
+
+    def __str__(self):
+        return self.slug
+
+    def save(self, *args, **kwargs):
+        # Hosts chegam em minúsculas (cms/tenants.py); vazio vira NULL, que
+        # não conflita com o unique.
+        self.dominio = (self.dominio or '').strip().lower() or None
+        super().save(*args, **kwargs)
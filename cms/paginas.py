@@ -0,0 +1,111 @@
+"""
+Cache das páginas dos sites das barbearias.
+
+A página de um site só muda quando a barbearia ou o site são editados, e é a
+mesma para qualquer visitante. O HTML pronto fica no cache do Django
+(alias settings.CMS_CACHE_PAGINAS), um por barbearia, junto com a "versão"
+da barbearia em que foi renderizado:
+
+    cms:barbearia:<id>:versao  ->  versão atual (carimbo de tempo em ns)
+    cms:barbearia:<id>:pagina  ->  (versão, HTML)
+
+As duas chaves vêm numa única ida ao cache (get_many). Se a página guardada
+for de uma versão anterior, ela é renderizada de novo e substituída. Os
+sinais de cms/signals.py trocam a versão (invalidar()) depois do commit de
+qualquer alteração no site ou na barbearia, como em crm/catalogo.py; por
+estar no cache compartilhado, isso vale para todos os processos. Como no
+catálogo, a página é renderizada com dados do banco principal: uma réplica
+atrasada deixaria a página antiga no cache sob a versão nova.
+
+A ETag é a própria versão, então um If-None-Match recebe 304 sem nem buscar
+a página. Os navegadores e CDNs podem guardar a resposta por
+CMS_PAGINA_MAX_AGE segundos.
+
+Quem decide se o site está no ar é cms/tenants.py; aqui a página é só
+renderizada.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+
+from cms.models import SiteBarbearia
+from crm import metricas
+
+TEMPO_EXPIRACAO = 60 * 60 * 24  # um dia; a versão garante que nada fique desatualizado
+
+ACESSOS = metricas.registrar(metricas.Contador(
+    'cms_paginas_total', 'Páginas de site servidas, por resultado do cache.',
+    rotulos=('resultado',),
+))
+
+
+def _cache():
+    return caches[getattr(settings, 'CMS_CACHE_PAGINAS', 'default')]
+
+
+def _chave_versao(barbearia_id):
+    return f'cms:barbearia:{barbearia_id}:versao'
+
+
+def _chave_pagina(barbearia_id):
+    return f'cms:barbearia:{barbearia_id}:pagina'
+
+
+def versao(barbearia_id, cache=None):
+    """Versão atual da página da barbearia (veja crm/catalogo.versao_catalogo)."""
+    cache = cache or _cache()
+    chave = _chave_versao(barbearia_id)
+    atual = cache.get(chave)
+    if atual is None:
+        atual = time.time_ns()
+        if not cache.add(chave, atual, None):
+            atual = cache.get(chave, atual)
+    return atual
+
+
+def invalidar(barbearia_id):
+    """Gera uma nova versão da página; chamado pelos sinais, depois do commit."""
+    _cache().set(_chave_versao(barbearia_id), time.time_ns(), None)
+
+
+def renderizar(site):
+    """HTML do site (um SiteBarbearia com a barbearia carregada), no template escolhido."""
+    return render_to_string(f'cms/site_{site.template}.html', {
+        'site': site,
+        'barbearia': site.barbearia,
+        'titulo': site.titulo or site.barbearia.nome_barbearia,
+    })
+
+
+def _html(tenant, versao_atual, entrada, cache):
+    if entrada is not None and entrada[0] == versao_atual:
+        ACESSOS.incrementar('acerto')
+        return entrada[1]
+    ACESSOS.incrementar('falha')
+    site = SiteBarbearia.objects.using(DEFAULT_DB_ALIAS).select_related('barbearia').get(pk=tenant.site_id)
+    html = renderizar(site)
+    cache.set(_chave_pagina(tenant.barbearia_id), (versao_atual, html), TEMPO_EXPIRACAO)
+    return html
+
+
+def responder(request, tenant):
+    """A resposta com a página do site do tenant (ou um 304)."""
+    cache = _cache()
+    chave_versao = _chave_versao(tenant.barbearia_id)
+    valores = cache.get_many([chave_versao, _chave_pagina(tenant.barbearia_id)])
+    versao_atual = valores.get(chave_versao) or versao(tenant.barbearia_id, cache)
+
+    etag = quote_etag(f'{tenant.site_id}-{versao_atual}')
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        html = _html(tenant, versao_atual, valores.get(_chave_pagina(tenant.barbearia_id)), cache)
+        response = HttpResponse(html)
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=settings.CMS_PAGINA_MAX_AGE)
+    return response
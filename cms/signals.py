@@ -0,0 +1,35 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from cms import paginas, tenants
+from cms.models import SiteBarbearia
+from crm.models import Assinatura, Barbearia
+
+
+# Slug, domínio ou template de um site mudou: qualquer endereço já resolvido
+# pode ter mudado de dono, inclusive os que antes não eram de ninguém. Como em
+# crm/signals.py, tudo espera o commit para ninguém guardar os dados antigos
+# sob a versão nova.
+@receiver(post_save, sender=SiteBarbearia)
+@receiver(post_delete, sender=SiteBarbearia)
+def site_alterado(sender, instance, **kwargs):
+    transaction.on_commit(tenants.limpar)
+    transaction.on_commit(partial(paginas.invalidar, instance.barbearia_id))
+
+
+# Nome, endereço etc. aparecem na página do site.
+@receiver(post_save, sender=Barbearia)
+def barbearia_alterada(sender, instance, **kwargs):
+    transaction.on_commit(partial(paginas.invalidar, instance.pk))
+
+
+# Uma assinatura paga, cancelada ou apagada liga ou desliga o site. As
+# transições em massa (Assinatura.objects.transicionar) não disparam sinais e
+# valem depois de CMS_TENANTS_SEGUNDOS (cms/tenants.py).
+@receiver(post_save, sender=Assinatura)
+@receiver(post_delete, sender=Assinatura)
+def assinatura_alterada(sender, instance, **kwargs):
+    transaction.on_commit(partial(tenants.invalidar, instance.barbearia_id))
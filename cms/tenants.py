@@ -0,0 +1,160 @@
+"""
+Qual barbearia uma requisição quer ver: o "tenant" dos sites.
+
+Cada SiteBarbearia (cms/models.py) responde por três endereços:
+
+- o subdomínio <slug>.CMS_DOMINIO_SITES (ex.: barbeariadoze.barbersites.com.br);
+- o domínio próprio, se cadastrado (ex.: www.barbeariadoze.com.br);
+- o caminho /sites/<slug>/ no domínio principal (cms/urls.py).
+
+Os hosts de CMS_HOSTS_PRINCIPAIS, o próprio CMS_DOMINIO_SITES e o www dele
+são a aplicação em si (home, checkout, admin) e nunca são procurados no banco.
+
+O site só fica no ar enquanto a barbearia tiver uma assinatura paga e não
+expirada. A consulta traz, junto com o site, a maior data_expiracao entre as
+assinaturas pagas ('ativo_ate'); o site está ativo enquanto ela estiver no
+futuro, então uma assinatura que vence apaga o site no instante certo, sem
+depender de invalidação.
+
+Como todo acesso a um site passa por aqui, o resultado fica num dicionário
+em memória do processo (LRU de CMS_TENANTS_MAXIMO entradas, cada uma válida
+por CMS_TENANTS_SEGUNDOS), inclusive para hosts que não são de ninguém, que
+de outra forma iriam ao banco a cada robô que testa um domínio. Os sinais de
+cms/signals.py limpam as entradas deste processo quando um site ou uma
+assinatura muda; nos outros processos (outros workers do gunicorn) e nas
+mudanças em massa sem sinais (Assinatura.objects.transicionar, usado pelo
+expirar_assinaturas e pelas ações do admin), a mudança aparece em até
+CMS_TENANTS_SEGUNDOS.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from cms.models import SiteBarbearia
+from crm import metricas
+from crm.roteamento import leitura_em_replica
+
+ACESSOS = metricas.registrar(metricas.Contador(
+    'cms_tenants_total', 'Resoluções de site por host ou endereço, por resultado do cache.',
+    rotulos=('resultado',),
+))
+
+
+class Tenant(NamedTuple):
+    site_id: int
+    barbearia_id: int
+    slug: str
+    template: str
+    # Fim da assinatura paga mais longa; None se não houver nenhuma.
+    ativo_ate: Optional[object]
+
+    @property
+    def ativo(self):
+        return self.ativo_ate is not None and self.ativo_ate > timezone.now()
+
+
+_entradas = OrderedDict()  # (campo, valor) -> (Tenant ou None, expira em)
+_trava = threading.Lock()
+
+
+def chave_do_host(host):
+    """
+    ('slug', ...) para um subdomínio de CMS_DOMINIO_SITES, ('dominio', ...)
+    para qualquer outro host, ou None para os hosts da própria aplicação.
+    """
+    host = host.rsplit(':', 1)[0].rstrip('.').lower() if host else ''
+    if not host or host in settings.CMS_HOSTS_PRINCIPAIS:
+        return None
+    dominio = settings.CMS_DOMINIO_SITES.lower()
+    if dominio and (host == dominio or host.endswith('.' + dominio)):
+        slug = host[:-len(dominio)].rstrip('.')
+        # 'barbersites.com.br', 'www.barbersites.com.br' e 'a.b.barbersites.com.br' não são sites.
+        return ('slug', slug) if slug and '.' not in slug and slug != 'www' else None
+    return ('dominio', host)
+
+
+def _do_cache(chave):
+    """(True, tenant) se a chave está no cache e não expirou; senão (False, None)."""
+    with _trava:
+        entrada = _entradas.get(chave)
+        if entrada is None:
+            return False, None
+        if entrada[1] <= time.monotonic():
+            del _entradas[chave]
+            return False, None
+        _entradas.move_to_end(chave)
+        return True, entrada[0]
+
+
+def _guardar(chave, tenant):
+    with _trava:
+        _entradas[chave] = (tenant, time.monotonic() + settings.CMS_TENANTS_SEGUNDOS)
+        _entradas.move_to_end(chave)
+        while len(_entradas) > settings.CMS_TENANTS_MAXIMO:
+            _entradas.popitem(last=False)
+
+
+def com_vencimento():
+    """Os SiteBarbearia com 'ativo_ate': o fim da assinatura paga mais longa."""
+    return SiteBarbearia.objects.annotate(ativo_ate=Max(
+        'barbearia__assinaturas__data_expiracao',
+        filter=Q(barbearia__assinaturas__status_pagamento='pago'),
+    ))
+
+
+def _consultar(chave):
+    campo, valor = chave
+    with leitura_em_replica():
+        linha = (
+            com_vencimento().filter(**{campo: valor})
+            .values_list('id', 'barbearia_id', 'slug', 'template', 'ativo_ate')
+            .first()
+        )
+    return Tenant(*linha) if linha else None
+
+
+def buscar(chave):
+    """O Tenant da chave ('slug' ou 'dominio', valor), ativo ou não; None se não existir."""
+    encontrado, tenant = _do_cache(chave)
+    ACESSOS.incrementar('acerto' if encontrado else 'falha')
+    if not encontrado:
+        tenant = _consultar(chave)
+        _guardar(chave, tenant)
+    return tenant
+
+
+async def abuscar(chave):
+    """Versão assíncrona de buscar(): só a consulta ao banco sai do loop de eventos."""
+    encontrado, tenant = _do_cache(chave)
+    ACESSOS.incrementar('acerto' if encontrado else 'falha')
+    if not encontrado:
+        tenant = await sync_to_async(_consultar)(chave)
+        _guardar(chave, tenant)
+    return tenant
+
+
+def site_ativo(chave):
+    """O Tenant da chave se o site estiver no ar; senão None."""
+    tenant = buscar(chave)
+    return tenant if tenant is not None and tenant.ativo else None
+
+
+def invalidar(barbearia_id):
+    """Esquece, neste processo, os endereços já resolvidos para a barbearia."""
+    with _trava:
+        for chave in [chave for chave, (tenant, _) in _entradas.items()
+                      if tenant is not None and tenant.barbearia_id == barbearia_id]:
+            del _entradas[chave]
+
+
+def limpar():
+    """Esquece tudo (inclusive os hosts sem site): um endereço pode ter mudado de dono."""
+    with _trava:
+        _entradas.clear()
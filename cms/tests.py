@@ -1,3 +1,193 @@
-from django.test import TestCase
+# cms/tests.py
+import json
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from cms import tenants
+from cms.models import SiteBarbearia
+from crm.models import Assinatura, Barbearia, Plano, Usuario
+
+HOST_SITE = 'doze.barbersites.test'
+HOST_PROPRIO = 'www.barbeariadoze.com.br'
+
+
+class ComSiteMixin:
+    """Um site no ar (assinatura paga por 30 dias) e os atalhos para criar outros."""
+
+    def setUp(self):
+        cache.clear()
+        tenants.limpar()
+        self.addCleanup(tenants.limpar)
+        self.plano = Plano.objects.create(nome_plano='Mensal', valor=30, duracao_dias=30)
+        self.usuario = Usuario.objects.create(nome_completo='Ana', email='ana@x.com', telefone='11')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.barbearia = self._barbearia('Barbearia do Zé')
+            self.site = SiteBarbearia.objects.create(
+                barbearia=self.barbearia, slug='doze', dominio='WWW.BarbeariaDoZe.com.br',
+                template='full', descricao='Corte e barba desde 1998.',
+            )
+            self.assinatura = self._assinatura(self.barbearia)
+
+    def _barbearia(self, nome):
+        return Barbearia.objects.create(
+            nome_barbearia=nome, endereco='Rua da Aurora, 10', cidade='Recife', estado='PE', cep='50030-230'
+        )
+
+    def _assinatura(self, barbearia, status='pago', dias=30):
+        return Assinatura.objects.create(
+            usuario=self.usuario, plano=self.plano, barbearia=barbearia, status_pagamento=status,
+            data_expiracao=timezone.now() + timedelta(days=dias),
+        )
+
+
+@override_settings(
+    CMS_DOMINIO_SITES='barbersites.test',
+    ALLOWED_HOSTS=['testserver', '.barbersites.test', HOST_PROPRIO],
+)
+class SiteBarbeariaTest(ComSiteMixin, TestCase):
+    def test_chave_do_host(self):
+        self.assertIsNone(tenants.chave_do_host('testserver'))
+        self.assertIsNone(tenants.chave_do_host('barbersites.test'))
+        self.assertIsNone(tenants.chave_do_host('WWW.barbersites.test:8000'))
+        self.assertIsNone(tenants.chave_do_host('a.b.barbersites.test'))
+        self.assertEqual(tenants.chave_do_host('Doze.barbersites.test:8000'), ('slug', 'doze'))
+        self.assertEqual(tenants.chave_do_host('WWW.BarbeariaDoZe.com.br'), ('dominio', HOST_PROPRIO))
+
+    def test_site_por_subdominio_dominio_proprio_e_endereco(self):
+        for host, caminho in ((HOST_SITE, '/'), (HOST_PROPRIO, '/'), ('testserver', reverse('site', args=['doze']))):
+            with self.subTest(host=host):
+                response = self.client.get(caminho, HTTP_HOST=host)
+                self.assertEqual(response.status_code, 200)
+                self.assertContains(response, 'Barbearia do Zé')
+                self.assertContains(response, 'Corte e barba desde 1998.')
+        self.assertEqual(self.site.dominio, HOST_PROPRIO)
+
+    def test_host_principal_continua_na_aplicacao(self):
+        response = self.client.get('/', HTTP_HOST=HOST_SITE)
+        self.assertTemplateUsed(response, 'cms/site_full.html')
+        response = self.client.get('/', HTTP_HOST='testserver')
+        self.assertTemplateUsed(response, 'crm/index.html')
+
+    def test_site_sem_assinatura_vigente_responde_404(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            pendente = self._barbearia('Barbearia Pendente')
+            SiteBarbearia.objects.create(barbearia=pendente, slug='pendente')
+            self._assinatura(pendente, status='pendente')
+            vencida = self._barbearia('Barbearia Vencida')
+            SiteBarbearia.objects.create(barbearia=vencida, slug='vencida')
+            self._assinatura(vencida, dias=-1)
+
+        for slug in ('pendente', 'vencida', 'inexistente'):
+            with self.subTest(slug=slug):
+                self.assertEqual(self.client.get('/', HTTP_HOST=f'{slug}.barbersites.test').status_code, 404)
+                self.assertEqual(self.client.get(reverse('site', args=[slug])).status_code, 404)
+
+    def test_pagina_em_cache_nao_consulta_o_banco(self):
+        primeira = self.client.get('/', HTTP_HOST=HOST_SITE)
+        with self.assertNumQueries(0):
+            segunda = self.client.get('/', HTTP_HOST=HOST_SITE)
+        self.assertEqual(segunda.content, primeira.content)
+        self.assertIn('public', segunda['Cache-Control'])
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/', HTTP_HOST=HOST_SITE, HTTP_IF_NONE_MATCH=primeira['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_alterar_barbearia_renova_a_pagina(self):
+        antes = self.client.get('/', HTTP_HOST=HOST_SITE)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.barbearia.nome_barbearia = 'Zé Barbearia'
+            self.barbearia.save()
+
+        depois = self.client.get('/', HTTP_HOST=HOST_SITE)
+        self.assertContains(depois, 'Zé Barbearia')
+        self.assertNotEqual(depois['ETag'], antes['ETag'])
+
+    def test_trocar_endereco_e_template(self):
+        self.client.get('/', HTTP_HOST=HOST_SITE)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.site.slug = 'ze'
+            self.site.template = 'flash'
+            self.site.save()
+
+        self.assertEqual(self.client.get('/', HTTP_HOST=HOST_SITE).status_code, 404)
+        response = self.client.get('/', HTTP_HOST='ze.barbersites.test')
+        self.assertTemplateUsed(response, 'cms/site_flash.html')
+
+    def test_cancelar_assinatura_tira_o_site_do_ar(self):
+        self.assertEqual(self.client.get('/', HTTP_HOST=HOST_SITE).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assinatura.marcar_como_cancelado()
+        self.assertEqual(self.client.get('/', HTTP_HOST=HOST_SITE).status_code, 404)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._assinatura(self.barbearia)
+        self.assertEqual(self.client.get('/', HTTP_HOST=HOST_SITE).status_code, 200)
+
+
+class BuildSitesTest(ComSiteMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        self.saida = diretorio.name
+
+    def _build(self, *argumentos):
+        saida = StringIO()
+        call_command('build_sites', '--saida', self.saida, '--processos', '1', *argumentos, stdout=saida)
+        return saida.getvalue()
+
+    def _pagina(self, slug):
+        with open(os.path.join(self.saida, slug, 'index.html'), encoding='utf-8') as arquivo:
+            return arquivo.read()
+
+    def test_gera_so_sites_no_ar(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            pendente = self._barbearia('Barbearia Pendente')
+            SiteBarbearia.objects.create(barbearia=pendente, slug='pendente')
+            self._assinatura(pendente, status='pendente')
+
+        self.assertIn('1 site(s) gerado(s)', self._build())
+        self.assertIn('Barbearia do Zé', self._pagina('doze'))
+        self.assertTrue(os.path.exists(os.path.join(self.saida, 'doze', 'index.html.gz')))
+        self.assertFalse(os.path.exists(os.path.join(self.saida, 'pendente')))
+        with open(os.path.join(self.saida, 'manifesto.json'), encoding='utf-8') as arquivo:
+            manifesto = json.load(arquivo)
+        self.assertEqual(manifesto['sites']['doze']['dominio'], HOST_PROPRIO)
+
+    def test_gera_de_novo_so_o_que_mudou(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            outra = self._barbearia('Barbearia Dois')
+            SiteBarbearia.objects.create(barbearia=outra, slug='dois', template='flash')
+            self._assinatura(outra)
+        self._build()
+        self.assertIn('0 site(s) gerado(s), 2 sem mudanças', self._build())
+
+        self.barbearia.nome_barbearia = 'Zé Barbearia'
+        self.barbearia.save()
+        self.assertIn('1 site(s) gerado(s), 1 sem mudanças', self._build())
+        self.assertIn('Zé Barbearia', self._pagina('doze'))
+        # Renovar a assinatura não muda a página.
+        self._assinatura(outra, dias=60)
+        self.assertIn('0 site(s) gerado(s)', self._build())
+        self.assertIn('2 site(s) gerado(s)', self._build('--todos'))
+
+    def test_remove_site_que_saiu_do_ar_ou_mudou_de_endereco(self):
+        self._build()
+        self.site.slug = 'ze'
+        self.site.save()
+        self.assertIn('1 removido(s)', self._build())
+        self.assertFalse(os.path.exists(os.path.join(self.saida, 'doze')))
+        self.assertIn('Barbearia do Zé', self._pagina('ze'))
+
+        self.assinatura.marcar_como_cancelado()
+        self.assertIn('0 site(s) gerado(s), 0 sem mudanças e 1 removido(s)', self._build())
+        self.assertFalse(os.path.exists(os.path.join(self.saida, 'ze')))
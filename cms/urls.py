@@ -1,7 +1,7 @@
-from django.contrib import admin
 from django.urls import path
-from cms.views import index
+
+from cms import views
 
 urlpatterns = [
-    path('/cms', index, name='index'),
+    path('<slug:slug>/', views.site_por_slug, name='site'),
 ]
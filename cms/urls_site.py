@@ -0,0 +1,13 @@
+# Rotas de um host de site de barbearia (cms/middleware.py).
+from django.conf import settings
+from django.urls import path, re_path
+
+from cms import views
+from crm.estaticos import servir_estatico
+
+urlpatterns = [
+    path('', views.site_por_host, name='site_por_host'),
+]
+
+if settings.CRM_SERVIR_ESTATICOS:
+    urlpatterns.insert(0, re_path(r'^%s(?P<caminho>.*)$' % settings.STATIC_URL.lstrip('/'), servir_estatico))
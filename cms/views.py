@@ -1,6 +1,21 @@
-from django.shortcuts import render
-from django.http import HttpResponse
+from django.http import Http404
+from django.views.decorators.http import require_safe
 
-def index(request):
-    return render(request,'index.html')
+from cms import paginas, tenants
 
+
+@require_safe
+def site_por_host(request):
+    """A página do site cujo host o SiteBarbeariaMiddleware já resolveu."""
+    if request.site_barbearia is None:
+        raise Http404('Site fora do ar.')
+    return paginas.responder(request, request.site_barbearia)
+
+
+@require_safe
+def site_por_slug(request, slug):
+    """A página do site em /sites/<slug>/, no domínio principal."""
+    tenant = tenants.site_ativo(('slug', slug))
+    if tenant is None:
+        raise Http404('Site não encontrado.')
+    return paginas.responder(request, tenant)
@@ -1,9 +1,17 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.html import format_html
+
+from . import busca
+from .forms import ESTADOS
+from .models import Assinatura, Barbearia, Plano, Tarefa, Usuario
+from .paginacao import ContagemEstimadaPaginator
+
 
-from .models import Plano # Importe o seu modelo Plano
 @admin.register(Plano)
 class PlanoAdmin(admin.ModelAdmin):
-    list_display = ('nome_plano', 'valor', 'descricao_curta') # Campos que aparecem na lista
+    list_display = ('nome_plano', 'valor', 'duracao_dias', 'descricao_curta') # Campos que aparecem na lista
     list_filter = ('nome_plano',) # Filtros na barra lateral
     search_fields = ('nome_plano', 'descricao') # Campos para pesquisa
     # fields = ('nome_plano', 'valor', 'descricao') # Ordem dos campos na página de edição/criação
@@ -13,3 +21,144 @@ class PlanoAdmin(admin.ModelAdmin):
         return (obj.descricao[:50] + '...') if len(obj.descricao) > 50 else obj.descricao
     descricao_curta.short_description = 'Descrição' # Nome da coluna no admin
 
+
+# As tabelas abaixo chegam a milhões de linhas. Regras seguidas nos admins:
+# - ContagemEstimadaPaginator e show_full_result_count = False: nada de
+#   COUNT(*) na tabela inteira a cada página;
+# - autocomplete no lugar de <select> com todas as linhas;
+# - buscas com '^' (começa com) ou '=' (igual), que usam índices, em vez do
+#   padrão "contém" (LIKE '%...%'), que percorre a tabela; usuários e
+#   barbearias usam o índice de texto da coluna 'busca' (BuscaTextoMixin);
+# - filtros com opções fixas, em vez de um SELECT DISTINCT na tabela.
+
+
+class EstadoFiltro(admin.SimpleListFilter):
+    title = 'estado'
+    parameter_name = 'estado'
+
+    def lookups(self, request, model_admin):
+        return [(uf, uf) for uf, nome in ESTADOS]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(estado=self.value())
+        return queryset
+
+
+class BarbeariaFiltro(admin.SimpleListFilter):
+    """
+    Filtra as assinaturas de uma barbearia (?barbearia=<id>).
+
+    Listar todas as barbearias na barra lateral seria inviável, então o filtro
+    só aparece quando já há uma escolhida, a partir do link "Assinaturas" da
+    lista de barbearias.
+    """
+    title = 'barbearia'
+    parameter_name = 'barbearia'
+
+    def lookups(self, request, model_admin):
+        if not self.value():
+            return []
+        return list(Barbearia.objects.filter(pk=self.value()).values_list('pk', 'nome_barbearia'))
+
+    def value(self):
+        valor = super().value()
+        return valor if valor and valor.isdigit() else None
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(barbearia_id=self.value())
+        return queryset
+
+
+class BuscaTextoMixin:
+    """
+    A caixa de busca (e o autocomplete de quem aponta para o modelo) usa a
+    coluna 'busca' e o índice de texto dela (crm/busca.py): cada palavra
+    digitada casa com o início de uma palavra de qualquer campo pesquisável.
+    """
+    search_fields = ('busca',)
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return busca.filtrar(queryset, search_term), False
+
+
+@admin.register(Assinatura)
+class AssinaturaAdmin(admin.ModelAdmin):
+    list_display = ('id', 'usuario', 'plano', 'barbearia', 'status_pagamento', 'data_inicio', 'data_expiracao')
+    # Usuário, plano e barbearia vêm no mesmo SELECT da listagem (JOIN),
+    # em vez de uma consulta por linha.
+    list_select_related = ('usuario', 'plano', 'barbearia')
+    # status_pagamento e barbearia têm índices (veja Assinatura.Meta.indexes).
+    list_filter = ('status_pagamento', BarbeariaFiltro, 'plano')
+    search_fields = ('=id_transacao_pagamento', '=usuario__email')
+    autocomplete_fields = ('usuario', 'barbearia')
+    readonly_fields = ('data_inicio',)
+    ordering = ('-id',)
+    paginator = ContagemEstimadaPaginator
+    show_full_result_count = False
+    actions = ('marcar_como_pago', 'marcar_como_cancelado')
+
+    # As ações usam os métodos de AssinaturaQuerySet: um único UPDATE para
+    # todas as selecionadas, em vez de um save() por assinatura.
+    @admin.action(description='Marcar selecionadas como pagas', permissions=['change'])
+    def marcar_como_pago(self, request, queryset):
+        alteradas = queryset.marcar_como_pago()
+        self.message_user(request, f'{alteradas} assinatura(s) marcada(s) como paga(s). '
+                                   'Só as pendentes são alteradas.', messages.SUCCESS)
+
+    @admin.action(description='Cancelar selecionadas', permissions=['change'])
+    def marcar_como_cancelado(self, request, queryset):
+        alteradas = queryset.marcar_como_cancelado()
+        self.message_user(request, f'{alteradas} assinatura(s) cancelada(s). '
+                                   'Só as pendentes ou pagas são alteradas.', messages.SUCCESS)
+
+
+@admin.register(Usuario)
+class UsuarioAdmin(BuscaTextoMixin, admin.ModelAdmin):
+    list_display = ('nome_completo', 'email', 'telefone', 'receber_notificacoes')
+    search_help_text = 'Nome, e-mail ou telefone (início das palavras, sem acentos).'
+    ordering = ('-id',)
+    paginator = ContagemEstimadaPaginator
+    show_full_result_count = False
+
+
+@admin.register(Barbearia)
+class BarbeariaAdmin(BuscaTextoMixin, admin.ModelAdmin):
+    list_display = ('nome_barbearia', 'cidade', 'estado', 'cep', 'link_assinaturas')
+    list_filter = (EstadoFiltro,)
+    search_help_text = 'Nome, cidade ou CEP (início das palavras, sem acentos).'
+    ordering = ('-id',)
+    paginator = ContagemEstimadaPaginator
+    show_full_result_count = False
+
+    # Link para as assinaturas da barbearia, sem contar quantas são.
+    def link_assinaturas(self, obj):
+        url = reverse('admin:crm_assinatura_changelist')
+        return format_html('<a href="{}?barbearia={}">Assinaturas</a>', url, obj.pk)
+    link_assinaturas.short_description = 'Assinaturas'
+
+
+@admin.register(Tarefa)
+class TarefaAdmin(admin.ModelAdmin):
+    """Acompanhamento da fila (crm/fila.py); as tarefas são criadas pelo código."""
+    list_display = ('id', 'tipo', 'status', 'tentativas', 'processados', 'executar_em', 'concluida_em')
+    list_filter = ('status', 'tipo')
+    ordering = ('-id',)
+    readonly_fields = [campo.name for campo in Tarefa._meta.fields]
+    paginator = ContagemEstimadaPaginator
+    show_full_result_count = False
+    actions = ('reenfileirar',)
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description='Executar de novo as selecionadas', permissions=['change'])
+    def reenfileirar(self, request, queryset):
+        alteradas = queryset.filter(status='falhou').update(
+            status='pendente', tentativas=0, executar_em=timezone.now()
+        )
+        self.message_user(request, f'{alteradas} tarefa(s) de volta à fila. '
+                                   'Só as que falharam são alteradas.', messages.SUCCESS)
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class CrmConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'crm'
+
+    def ready(self):
+        # Registra os sinais (invalidação do cache do catálogo de planos e
+        # resumo das assinaturas).
+        from crm import signals  # noqa: F401
@@ -0,0 +1,257 @@
+"""
+Busca da equipe por usuários e barbearias (admin e autocomplete em /busca/).
+
+Procurar um nome, e-mail, cidade ou CEP com "contém" (LIKE '%...%')
+percorre a tabela inteira. Em vez disso, Usuario e Barbearia têm uma coluna
+'busca' com o texto dos campos pesquisáveis (CAMPOS) normalizado: minúsculas,
+sem acentos, só letras e números separados por espaço, e o telefone e o CEP
+também só com os dígitos. Ela é preenchida no save(), e também no
+bulk_create, no bulk_update e no update() do manager (BuscaQuerySet, em
+crm/models.py), e coberta por um índice de texto, conforme o banco:
+
+- MySQL: FULLTEXT (busca), consultado com MATCH ... AGAINST em modo booleano;
+- SQLite: uma tabela FTS5 (<tabela>_fts) com o conteúdo da coluna, mantida
+  por gatilhos;
+- outros bancos: sem índice, cada termo vira um LIKE de início de palavra.
+
+Cada termo digitado casa com o início de uma palavra ("ana sil" acha "Ana
+Silva"), e todos precisam casar:
+
+    Usuario.objects.filter(busca__termos='ana sil')
+
+No MySQL, palavras com menos de CRM_BUSCA_MIN_TOKEN letras (o
+innodb_ft_min_token_size do servidor, 3 por padrão) ficam fora do índice:
+esses termos são conferidos com LIKE só nas linhas que os demais já
+selecionaram.
+
+Quem grava por fora do manager (SQL direto, migrações com o modelo
+histórico, loaddata) preenche a coluna com preencher() ou roda depois o
+comando reindexar_busca. No SQLite, uma migração que recrie uma dessas
+tabelas (alteração de coluna) perde os gatilhos: ela deve chamar
+criar_indices() de novo.
+"""
+import re
+import unicodedata
+
+from django.conf import settings
+from django.db import models
+from django.db.models import Lookup
+from django.urls import reverse
+
+# Tabela -> (campos pesquisáveis, campos que entram também só com os dígitos).
+CAMPOS = {
+    'crm_usuario': (('nome_completo', 'email', 'telefone'), ('telefone',)),
+    'crm_barbearia': (('nome_barbearia', 'cidade', 'cep'), ('cep',)),
+}
+# Termos considerados de uma busca; o resto é ignorado.
+MAX_TERMOS = 8
+
+_SEPARADORES = re.compile(r'[^a-z0-9]+')
+_NAO_DIGITOS = re.compile(r'\D+')
+
+
+def normalizar(texto):
+    """'São Paulo - SP' -> 'sao paulo sp'."""
+    sem_acentos = unicodedata.normalize('NFKD', texto or '').encode('ascii', 'ignore').decode()
+    return _SEPARADORES.sub(' ', sem_acentos.lower()).strip()
+
+
+def termos(texto):
+    return normalizar(texto).split()[:MAX_TERMOS]
+
+
+def texto_busca(objeto):
+    """Conteúdo da coluna 'busca' de um Usuario ou Barbearia."""
+    campos, digitos = CAMPOS[objeto._meta.db_table]
+    partes = [normalizar(str(getattr(objeto, campo) or '')) for campo in campos]
+    partes += [_NAO_DIGITOS.sub('', str(getattr(objeto, campo) or '')) for campo in digitos]
+    return ' '.join(parte for parte in partes if parte)
+
+
+def preencher(objeto):
+    objeto.busca = texto_busca(objeto)
+    return objeto
+
+
+def reindexar(modelo, tamanho_lote=2000, ids=None):
+    """
+    Recalcula a coluna 'busca' de todas as linhas de 'modelo' (ou só das de
+    'ids'), em lotes, e grava só as que mudaram. Retorna quantas foram
+    gravadas.
+    """
+    from crm.lotes import iterar_por_chave
+
+    linhas = modelo._base_manager.all() if ids is None else modelo._base_manager.filter(pk__in=ids)
+    alteradas, lote = 0, []
+    for objeto in iterar_por_chave(linhas, tamanho_lote):
+        if objeto.busca != texto_busca(objeto):
+            lote.append(preencher(objeto))
+        if len(lote) >= tamanho_lote:
+            alteradas += modelo.objects.bulk_update(lote, ['busca'])
+            lote = []
+    if lote:
+        alteradas += modelo.objects.bulk_update(lote, ['busca'])
+    return alteradas
+
+
+def _min_token():
+    return getattr(settings, 'CRM_BUSCA_MIN_TOKEN', 3)
+
+
+class Termos(Lookup):
+    """campo__termos='texto': todos os termos casam com o início de uma palavra."""
+    lookup_name = 'termos'
+    prepare_rhs = False
+
+    def _like(self, compiler, connection, lista):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        sql, params = [], []
+        for termo in lista:
+            # Os termos normalizados não têm % nem _: não há o que escapar.
+            sql.append(f"({lhs} LIKE %s OR {lhs} LIKE %s)")
+            params += [*lhs_params, f'{termo}%', *lhs_params, f'% {termo}%']
+        return sql, params
+
+    def _juntar(self, sql, params):
+        if not sql:
+            return '1 = 0', []
+        return ' AND '.join(sql), params
+
+    def as_sql(self, compiler, connection):
+        return self._juntar(*self._like(compiler, connection, termos(self.rhs)))
+
+    def as_mysql(self, compiler, connection):
+        lista = termos(self.rhs)
+        longos = [termo for termo in lista if len(termo) >= _min_token()]
+        if not longos:
+            return self.as_sql(compiler, connection)
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        sql = [f'MATCH ({lhs}) AGAINST (%s IN BOOLEAN MODE)']
+        params = [*lhs_params, ' '.join(f'+{termo}*' for termo in longos)]
+        curtos_sql, curtos_params = self._like(compiler, connection, [t for t in lista if t not in longos])
+        return self._juntar(sql + curtos_sql, params + curtos_params)
+
+    def as_sqlite(self, compiler, connection):
+        lista = termos(self.rhs)
+        if not lista:
+            return self._juntar([], [])
+        qn = compiler.quote_name_unless_alias
+        modelo = self.lhs.target.model
+        tabela = connection.ops.quote_name(f'{modelo._meta.db_table}_fts')
+        pk = f'{qn(self.lhs.alias)}.{qn(modelo._meta.pk.column)}'
+        return (
+            f'{pk} IN (SELECT rowid FROM {tabela} WHERE {tabela} MATCH %s)',
+            [' '.join(f'"{termo}"*' for termo in lista)],
+        )
+
+
+class CampoBusca(models.TextField):
+    """Coluna 'busca' (texto normalizado), com o lookup 'termos'."""
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('default', '')
+        kwargs.setdefault('editable', False)
+        super().__init__(*args, **kwargs)
+
+
+CampoBusca.register_lookup(Termos)
+
+
+def filtrar(queryset, texto):
+    """Objetos do queryset (de Usuario ou Barbearia) que casam com 'texto'."""
+    if not termos(texto):
+        return queryset.none()
+    return queryset.filter(busca__termos=texto)
+
+
+# Índices de texto. Usados pela migração 0007 e por migrações que precisem
+# recriá-los; podem rodar mais de uma vez.
+
+def _sqlite_fts(tabela):
+    fts = f'{tabela}_fts'
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"busca, content='{tabela}', content_rowid='id', prefix='2 3')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {tabela} BEGIN "
+        f"INSERT INTO {fts}(rowid, busca) VALUES (new.id, new.busca); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {tabela} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, busca) VALUES ('delete', old.id, old.busca); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF busca ON {tabela} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, busca) VALUES ('delete', old.id, old.busca); "
+        f"INSERT INTO {fts}(rowid, busca) VALUES (new.id, new.busca); END",
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+
+def criar_indices(schema_editor):
+    conexao = schema_editor.connection
+    for tabela in CAMPOS:
+        if conexao.vendor == 'mysql':
+            with conexao.cursor() as cursor:
+                indices = conexao.introspection.get_constraints(cursor, tabela)
+            if f'{tabela}_busca_ft' not in indices:
+                # Sem a lista de stopwords do InnoDB ('de', 'com'...), que
+                # deixaria de fora partes de nomes e de e-mails.
+                schema_editor.execute('SET SESSION innodb_ft_enable_stopword = OFF')
+                schema_editor.execute(f'CREATE FULLTEXT INDEX {tabela}_busca_ft ON {tabela} (busca)')
+        elif conexao.vendor == 'sqlite':
+            for sql in _sqlite_fts(tabela):
+                schema_editor.execute(sql)
+
+
+def remover_indices(schema_editor):
+    conexao = schema_editor.connection
+    for tabela in CAMPOS:
+        if conexao.vendor == 'mysql':
+            schema_editor.execute(f'DROP INDEX {tabela}_busca_ft ON {tabela}')
+        elif conexao.vendor == 'sqlite':
+            for gatilho in ('ai', 'ad', 'au'):
+                schema_editor.execute(f'DROP TRIGGER IF EXISTS {tabela}_fts_{gatilho}')
+            schema_editor.execute(f'DROP TABLE IF EXISTS {tabela}_fts')
+
+
+# Autocomplete (view crm.views.autocompletar).
+
+TIPOS = ('usuario', 'barbearia', 'plano')
+
+def _planos(texto, limite):
+    """O catálogo é pequeno e fica em cache: a busca é feita em memória."""
+    from crm.catalogo import listar_planos
+
+    procurados = termos(texto)
+    encontrados = []
+    for plano in listar_planos():
+        palavras = normalizar(f'{plano.nome_plano} {plano.descricao or ""}').split()
+        if all(any(palavra.startswith(termo) for palavra in palavras) for termo in procurados):
+            encontrados.append({
+                'tipo': 'plano', 'id': plano.pk, 'texto': plano.nome_plano,
+                'url': reverse('admin:crm_plano_change', args=[plano.pk]),
+            })
+    return encontrados[:limite]
+
+
+def autocompletar(texto, tipos, limite=10):
+    """Até 'limite' resultados de cada tipo ('usuario', 'barbearia', 'plano')."""
+    from crm.models import Barbearia, Usuario
+    from crm.roteamento import leitura_em_replica
+
+    consultas = {
+        'usuario': (Usuario, ('nome_completo', 'email'), '{} <{}>'),
+        'barbearia': (Barbearia, ('nome_barbearia', 'cidade', 'estado'), '{} ({}/{})'),
+    }
+    resultados = []
+    for tipo in tipos:
+        if tipo == 'plano':
+            resultados += _planos(texto, limite)
+            continue
+        modelo, campos, formato = consultas[tipo]
+        # Sem ORDER BY: o banco para nas primeiras 'limite' linhas do índice,
+        # em vez de ordenar todas as que casam.
+        with leitura_em_replica():
+            linhas = list(filtrar(modelo.objects.order_by(), texto).values_list('pk', *campos)[:limite])
+        url = f'admin:crm_{modelo._meta.model_name}_change'
+        resultados += [
+            {'tipo': tipo, 'id': pk, 'texto': formato.format(*valores), 'url': reverse(url, args=[pk])}
+            for pk, *valores in linhas
+        ]
+    return resultados
@@ -0,0 +1,183 @@
+"""
+Cache das páginas renderizadas (home e checkout).
+
+Para um mesmo conjunto de planos, essas páginas são idênticas para qualquer
+visitante anônimo. O decorador cache_pagina guarda o HTML pronto por caminho
+e o devolve sem executar a view nem renderizar o template. A query string
+fica fora da chave: as views em cache não a usam, e cada '?x=1', '?x=2'...
+viraria uma entrada nova, deixando qualquer visitante encher o cache.
+
+A chave inclui a versão do catálogo (crm/catalogo.py): quando um Plano muda,
+a versão muda e todas as páginas que listam planos deixam de ser
+encontradas, sem precisar apagar nada à mão.
+
+Cada página em cache tem ETag e Last-Modified, então o navegador pode
+revalidar com If-None-Match / If-Modified-Since e receber um 304 vazio.
+
+O token CSRF é de cada visitante e não pode ser compartilhado. Quando a
+página usa {% csrf_token %} (o formulário do checkout), o campo oculto é
+trocado por um marcador antes de guardar o HTML, e cada resposta recebe o
+token do próprio visitante; a ETag, nesse caso, também leva em conta o cookie
+CSRF. Respostas que usam o token de outra forma nunca são guardadas.
+"""
+import asyncio
+import hashlib
+import re
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from crm.catalogo import aversao_catalogo, versao_catalogo
+
+TEMPO_EXPIRACAO = 60 * 60  # uma hora
+
+# O campo gerado por {% csrf_token %} e o marcador que o substitui no cache.
+CAMPO_CSRF = re.compile(rb'<input type="hidden" name="csrfmiddlewaretoken" value="[^"]*">')
+MARCADOR_CSRF = b'<!--crm:csrf-->'
+
+
+def _cache():
+    return caches[getattr(settings, 'CRM_CACHE_PAGINAS', 'default')]
+
+
+def _chave(request, versao):
+    caminho = hashlib.md5(request.path.encode()).hexdigest()
+    return f'crm:pagina:{versao}:{caminho}'
+
+
+def _metodo_cacheavel(request):
+    return request.method in ('GET', 'HEAD')
+
+
+def _visitante_anonimo(request):
+    # Sem cookie de sessão não há ninguém logado: nem carregamos a sessão.
+    if settings.SESSION_COOKIE_NAME not in request.COOKIES:
+        return True
+    # Usuários logados (ex.: equipe no admin) sempre recebem a página renderizada.
+    usuario = getattr(request, 'user', None)
+    return not (usuario and usuario.is_authenticated)
+
+
+def _pode_guardar(request, response):
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+    )
+
+
+def _responder(request, conteudo, content_type, etag, ultima_modificacao):
+    com_csrf = MARCADOR_CSRF in conteudo
+    if com_csrf:
+        token = get_token(request)
+        # Cada visitante tem sua ETag: se o cookie CSRF mudar, a página também muda.
+        segredo = request.META['CSRF_COOKIE'].encode()
+        etag = quote_etag(hashlib.md5(etag.encode() + segredo).hexdigest())
+
+    response = get_conditional_response(
+        request, etag=etag, last_modified=ultima_modificacao
+    )
+    if response is None:
+        if com_csrf:
+            campo = f'<input type="hidden" name="csrfmiddlewaretoken" value="{token}">'
+            conteudo = conteudo.replace(MARCADOR_CSRF, campo.encode())
+        response = HttpResponse(conteudo, content_type=content_type)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(ultima_modificacao)
+    # O navegador pode guardar a página, mas deve revalidar a cada visita.
+    patch_cache_control(response, max_age=0, must_revalidate=True)
+    if com_csrf:
+        patch_vary_headers(response, ['Cookie'])
+    return response
+
+
+def _nova_entrada(request, response, versao):
+    """
+    Monta a entrada do cache, ou retorna None se a página não pode ser
+    compartilhada (usou o token CSRF fora do campo oculto do formulário).
+    """
+    conteudo = response.content
+    if request.META.get('CSRF_COOKIE_NEEDS_UPDATE'):
+        conteudo, trocas = CAMPO_CSRF.subn(MARCADOR_CSRF, conteudo)
+        if not trocas:
+            return None
+    # Last-Modified é o instante da última alteração do catálogo.
+    return (
+        conteudo,
+        response['Content-Type'],
+        quote_etag(hashlib.md5(conteudo).hexdigest()),
+        versao // 1_000_000_000,
+    )
+
+
+def cache_pagina(view):
+    """
+    Decorador que guarda em cache a resposta de uma view pública.
+    Só faz sentido para páginas que dependem apenas do caminho e do
+    catálogo (não de request.GET).
+    Aceita views comuns e views async.
+    """
+    if asyncio.iscoroutinefunction(view):
+        return _cache_pagina_async(view)
+
+    @wraps(view)
+    def _view(request, *args, **kwargs):
+        if not (_metodo_cacheavel(request) and _visitante_anonimo(request)):
+            return view(request, *args, **kwargs)
+
+        versao = versao_catalogo()
+        cache = _cache()
+        chave = _chave(request, versao)
+        entrada = cache.get(chave)
+        if entrada is not None:
+            return _responder(request, *entrada)
+
+        response = view(request, *args, **kwargs)
+        if not _pode_guardar(request, response):
+            return response
+
+        entrada = _nova_entrada(request, response, versao)
+        if entrada is None:
+            return response
+        cache.set(chave, entrada, TEMPO_EXPIRACAO)
+        return _responder(request, *entrada)
+
+    return _view
+
+
+def _cache_pagina_async(view):
+    @wraps(view)
+    async def _view(request, *args, **kwargs):
+        # Com cookie de sessão, verificar o usuário consulta o banco: isso
+        # precisa rodar fora do loop de eventos.
+        if not _metodo_cacheavel(request) or (
+            settings.SESSION_COOKIE_NAME in request.COOKIES
+            and not await sync_to_async(_visitante_anonimo)(request)
+        ):
+            return await view(request, *args, **kwargs)
+
+        versao = await aversao_catalogo()
+        cache = _cache()
+        chave = _chave(request, versao)
+        entrada = await cache.aget(chave)
+        if entrada is not None:
+            return _responder(request, *entrada)
+
+        response = await view(request, *args, **kwargs)
+        if not _pode_guardar(request, response):
+            return response
+
+        entrada = _nova_entrada(request, response, versao)
+        if entrada is None:
+            return response
+        await cache.aset(chave, entrada, TEMPO_EXPIRACAO)
+        return _responder(request, *entrada)
+
+    return _view
@@ -0,0 +1,133 @@
+"""
+Cache do catálogo de planos.
+
+A página inicial e o checkout listam sempre os mesmos planos, que mudam
+raramente. Em vez de consultar o banco a cada acesso, guardamos a lista
+pronta no cache do Django, sob uma chave que inclui a "versão" do catálogo.
+
+Sempre que um Plano é salvo ou apagado, os sinais em crm/signals.py chamam
+invalidar_catalogo(), que gera uma nova versão. As leituras seguintes passam
+a procurar uma chave nova, não a encontram e recarregam os planos do banco
+uma única vez. As entradas antigas simplesmente expiram. Essa leitura vai
+sempre ao banco principal, mesmo dentro de leitura_em_replica()
+(crm/roteamento.py): logo
+depois de uma alteração, uma réplica atrasada devolveria a lista antiga, que
+ficaria no cache, sob a versão nova, por um dia inteiro.
+
+O backend usado é configurado em settings.CRM_CACHE_CATALOGO (o alias de
+settings.CACHES); por padrão é o cache 'default' em memória local.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+
+from crm.models import Plano
+
+CHAVE_VERSAO = 'crm:catalogo:versao'
+TEMPO_EXPIRACAO = 60 * 60 * 24  # um dia; a versão garante que nada fique desatualizado
+
+_contadores = {'acertos': 0, 'falhas': 0}
+_trava_contadores = threading.Lock()
+
+
+def _cache():
+    return caches[getattr(settings, 'CRM_CACHE_CATALOGO', 'default')]
+
+
+def _contar(nome):
+    with _trava_contadores:
+        _contadores[nome] += 1
+
+
+def versao_catalogo():
+    """
+    Retorna a versão atual do catálogo.
+
+    A versão é um carimbo de tempo em nanossegundos. Se a chave sumir do
+    cache (reinício, despejo por falta de memória), a nova versão é sempre
+    maior que a anterior, então nunca reaproveitamos uma lista antiga.
+    """
+    cache = _cache()
+    versao = cache.get(CHAVE_VERSAO)
+    if versao is None:
+        versao = time.time_ns()
+        # add() não sobrescreve se outro processo criou a chave nesse meio tempo.
+        if not cache.add(CHAVE_VERSAO, versao, None):
+            versao = cache.get(CHAVE_VERSAO, versao)
+    return versao
+
+
+def invalidar_catalogo():
+    """Gera uma nova versão do catálogo; chamado pelos sinais de Plano."""
+    _cache().set(CHAVE_VERSAO, time.time_ns(), None)
+
+
+def listar_planos():
+    """
+    Retorna a lista de planos ordenada pelo valor, vinda do cache sempre
+    que possível. Só consulta o banco quando o catálogo mudou.
+    """
+    cache = _cache()
+    chave = f'crm:catalogo:{versao_catalogo()}'
+    planos = cache.get(chave)
+    if planos is not None:
+        _contar('acertos')
+        return planos
+
+    _contar('falhas')
+    planos = list(Plano.objects.using(DEFAULT_DB_ALIAS).order_by('valor'))
+    cache.set(chave, planos, TEMPO_EXPIRACAO)
+    return planos
+
+
+async def aversao_catalogo():
+    """Versão assíncrona de versao_catalogo(), para as views async."""
+    cache = _cache()
+    versao = await cache.aget(CHAVE_VERSAO)
+    if versao is None:
+        versao = time.time_ns()
+        if not await cache.aadd(CHAVE_VERSAO, versao, None):
+            versao = await cache.aget(CHAVE_VERSAO, versao)
+    return versao
+
+
+async def alistar_planos():
+    """Versão assíncrona de listar_planos(), sem bloquear o loop de eventos."""
+    cache = _cache()
+    chave = f'crm:catalogo:{await aversao_catalogo()}'
+    planos = await cache.aget(chave)
+    if planos is not None:
+        _contar('acertos')
+        return planos
+
+    _contar('falhas')
+    planos = [plano async for plano in Plano.objects.using(DEFAULT_DB_ALIAS).order_by('valor')]
+    await cache.aset(chave, planos, TEMPO_EXPIRACAO)
+    return planos
+
+
+def obter_plano(plano_id, planos=None):
+    """
+    Retorna o plano com o id informado, ou None se ele não existir.
+    Quem já tem a lista em mãos pode passá-la em 'planos' e evitar outra
+    leitura do cache.
+    """
+    for plano in planos if planos is not None else listar_planos():
+        if plano.id == plano_id:
+            return plano
+    return None
+
+
+def estatisticas():
+    """Contadores de acertos e falhas do cache deste processo."""
+    with _trava_contadores:
+        return dict(_contadores)
+
+
+def zerar_estatisticas():
+    with _trava_contadores:
+        for nome in _contadores:
+            _contadores[nome] = 0
@@ -0,0 +1,218 @@
+"""
+Consulta de CEP local, para preencher o endereço no checkout.
+
+Nenhuma API externa: os CEPs vêm de uma base pública (Correios, IBGE etc.)
+carregada com o comando importar_ceps, que grava um índice compacto em
+settings.CRM_CEP_INDICE:
+
+    python manage.py importar_ceps logradouros.csv localidades.csv
+
+O arquivo é mapeado em memória (mmap) e consultado por busca binária, sem
+ser lido inteiro: o sistema operacional carrega só as páginas tocadas, e os
+processos da mesma máquina compartilham essas páginas. As respostas mais
+pedidas ficam num LRU de CRM_CEP_CACHE entradas por processo.
+
+Formato do índice (inteiros de 32 bits, little-endian):
+
+    cabeçalho   b'CEP1', nº de CEPs, nº de faixas, tamanho dos textos
+    CEPs        (cep, posição do texto), em ordem de cep
+    faixas      (cep inicial, cep final, posição do texto), em ordem, sem sobreposição
+    textos      'logradouro<TAB>bairro<TAB>cidade<TAB>UF<LF>', sem repetições
+
+Um CEP é procurado primeiro entre os CEPs de logradouro e, se não estiver lá,
+nas faixas (o CEP geral de uma cidade pequena, a faixa de um distrito).
+
+O índice é aberto na primeira consulta de cada processo. Um índice novo
+(importar_ceps grava outro arquivo e o troca de uma vez) vale para os
+processos iniciados depois, ou depois de recarregar(). Sem o arquivo, as
+consultas não encontram nada e ele é procurado de novo a cada
+ESPERA_SEM_INDICE segundos: o primeiro importar_ceps num servidor já no ar
+passa a valer sem reiniciar os processos.
+"""
+import functools
+import logging
+import mmap
+import os
+import re
+import struct
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+MAGICO = b'CEP1'
+CABECALHO = struct.Struct('<4sIII')
+REGISTRO = struct.Struct('<II')
+FAIXA = struct.Struct('<III')
+CAMPOS = ('logradouro', 'bairro', 'cidade', 'estado')
+# Segundos entre uma procura e outra pelo arquivo do índice, quando ele não existe.
+ESPERA_SEM_INDICE = 30
+
+_NAO_DIGITOS = re.compile(r'\D+')
+_SEPARADORES = re.compile(r'[\t\r\n]+')
+
+
+def numero(cep):
+    """'01001-000' -> 1001000; None se não tiver 8 dígitos."""
+    digitos = _NAO_DIGITOS.sub('', str(cep or ''))
+    return int(digitos) if len(digitos) == 8 else None
+
+
+def formatar(numero_cep):
+    texto = f'{numero_cep:08d}'
+    return f'{texto[:5]}-{texto[5:]}'
+
+
+class IndiceCep:
+    """Um arquivo de índice aberto. Pode ser consultado por várias threads."""
+
+    def __init__(self, caminho):
+        with open(caminho, 'rb') as arquivo:
+            self._mapa = mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ)
+        magico, self.ceps, self.faixas, _ = CABECALHO.unpack_from(self._mapa, 0)
+        if magico != MAGICO:
+            raise ValueError(f'{caminho} não é um índice de CEPs.')
+        self._inicio_ceps = CABECALHO.size
+        self._inicio_faixas = self._inicio_ceps + self.ceps * REGISTRO.size
+        self._inicio_textos = self._inicio_faixas + self.faixas * FAIXA.size
+
+    def _ultimo_ate(self, cep, inicio, quantidade, formato):
+        """Posição do último registro com chave <= cep, ou -1."""
+        baixo, alto = 0, quantidade
+        while baixo < alto:
+            meio = (baixo + alto) // 2
+            if formato.unpack_from(self._mapa, inicio + meio * formato.size)[0] <= cep:
+                baixo = meio + 1
+            else:
+                alto = meio
+        return baixo - 1
+
+    def _texto(self, posicao):
+        inicio = self._inicio_textos + posicao
+        return tuple(self._mapa[inicio:self._mapa.find(b'\n', inicio)].decode().split('\t'))
+
+    def buscar(self, cep):
+        """(logradouro, bairro, cidade, UF) do CEP (um inteiro), ou None."""
+        posicao = self._ultimo_ate(cep, self._inicio_ceps, self.ceps, REGISTRO)
+        if posicao >= 0:
+            chave, texto = REGISTRO.unpack_from(self._mapa, self._inicio_ceps + posicao * REGISTRO.size)
+            if chave == cep:
+                return self._texto(texto)
+        posicao = self._ultimo_ate(cep, self._inicio_faixas, self.faixas, FAIXA)
+        if posicao >= 0:
+            _, final, texto = FAIXA.unpack_from(self._mapa, self._inicio_faixas + posicao * FAIXA.size)
+            if cep <= final:
+                return self._texto(texto)
+        return None
+
+
+_indice = None
+_procurar_em = 0
+_trava = threading.Lock()
+
+
+def _disponivel():
+    return _indice is not None or time.monotonic() >= _procurar_em
+
+
+def indice():
+    """
+    O índice deste processo, aberto na primeira chamada; None se não houver
+    arquivo (procurado de novo depois de ESPERA_SEM_INDICE segundos).
+    """
+    global _indice, _procurar_em
+    if _indice is None and _disponivel():
+        with _trava:
+            if _indice is None and _disponivel():
+                caminho = settings.CRM_CEP_INDICE
+                if os.path.exists(caminho):
+                    _indice = IndiceCep(caminho)
+                else:
+                    logger.warning('Índice de CEPs %s não encontrado: rode manage.py importar_ceps.', caminho)
+                    _procurar_em = time.monotonic() + ESPERA_SEM_INDICE
+    return _indice
+
+
+def recarregar():
+    """Descarta o índice aberto e o LRU; a próxima consulta abre o arquivo de novo."""
+    global _indice, _procurar_em
+    with _trava:
+        _indice = None
+        _procurar_em = 0
+        _buscar.cache_clear()
+
+
+@functools.lru_cache(maxsize=getattr(settings, 'CRM_CEP_CACHE', 4096))
+def _buscar(numero_cep):
+    aberto = indice()
+    return aberto.buscar(numero_cep) if aberto else None
+
+
+def consultar(cep):
+    """
+    Endereço do CEP ('01001-000', '01001000'...), como um dicionário com
+    'cep' (formatado), logradouro, bairro, cidade e estado; None se o CEP for
+    inválido ou não estiver no índice.
+    """
+    numero_cep = numero(cep)
+    # Sem índice, nada vai para o LRU: os CEPs pedidos antes de ele existir
+    # não ficariam "não encontrados" depois.
+    if numero_cep is None or indice() is None:
+        return None
+    encontrado = _buscar(numero_cep)
+    if encontrado is None:
+        return None
+    return {'cep': formatar(numero_cep), **dict(zip(CAMPOS, encontrado))}
+
+
+def _limpar(valor):
+    return _SEPARADORES.sub(' ', (valor or '').strip())
+
+
+def gravar_indice(caminho, ceps, faixas):
+    """
+    Grava um índice novo em 'caminho' e retorna (nº de CEPs, nº de faixas).
+
+    'ceps' traz (cep, logradouro, bairro, cidade, UF) e 'faixas', (cep
+    inicial, cep final, logradouro, bairro, cidade, UF), com os CEPs como
+    inteiros. Um CEP repetido fica com a última ocorrência. O arquivo é
+    montado ao lado e trocado de uma vez (os.replace): quem já o tinha
+    aberto continua lendo o anterior.
+    """
+    textos, conteudo = {}, bytearray()
+
+    def posicao(campos):
+        linha = '\t'.join(_limpar(campo) for campo in campos)
+        if linha not in textos:
+            textos[linha] = len(conteudo)
+            conteudo.extend(linha.encode() + b'\n')
+        return textos[linha]
+
+    registros = sorted({cep: posicao(campos) for cep, *campos in ceps}.items())
+    intervalos = sorted((inicial, final, posicao(campos)) for inicial, final, *campos in faixas)
+    for (_, final_anterior, _), (inicial, final, _) in zip(intervalos, intervalos[1:]):
+        if inicial <= final_anterior:
+            raise ValueError(f'Faixas de CEP sobrepostas em {formatar(inicial)}.')
+    if any(inicial > final for inicial, final, _ in intervalos):
+        raise ValueError('Faixa de CEP com o início depois do fim.')
+
+    diretorio = os.path.dirname(os.path.abspath(caminho))
+    os.makedirs(diretorio, exist_ok=True)
+    descritor, temporario = tempfile.mkstemp(dir=diretorio, suffix='.tmp')
+    try:
+        with os.fdopen(descritor, 'wb') as arquivo:
+            arquivo.write(CABECALHO.pack(MAGICO, len(registros), len(intervalos), len(conteudo)))
+            for registro in registros:
+                arquivo.write(REGISTRO.pack(*registro))
+            for intervalo in intervalos:
+                arquivo.write(FAIXA.pack(*intervalo))
+            arquivo.write(conteudo)
+        os.chmod(temporario, 0o644)
+        os.replace(temporario, caminho)
+    except BaseException:
+        os.unlink(temporario)
+        raise
+    return len(registros), len(intervalos)
@@ -0,0 +1,134 @@
+"""
+Arquivos estáticos em produção.
+
+ArmazenamentoEstatico (settings.STATICFILES_STORAGE fora do DEBUG) faz, no
+collectstatic:
+
+- nomes com o hash do conteúdo (ex.: 'assets/logo.3f2a9c0d1e4b.png'), como o
+  ManifestStaticFilesStorage do Django. Como o nome muda quando o arquivo
+  muda, o navegador pode guardá-lo para sempre;
+- variantes WebP redimensionadas das imagens em CRM_IMAGENS_VARIANTES
+  (crm/imagens.py), também com hash e registradas no manifesto;
+- cópias pré-comprimidas (.gz e, com o pacote brotli instalado, .br) dos
+  arquivos de texto, para não comprimir a cada requisição.
+
+A view servir_estatico entrega esses arquivos quando não há um servidor web
+na frente (CRM_SERVIR_ESTATICOS): escolhe a cópia comprimida conforme o
+Accept-Encoding e, para os nomes com hash, responde com
+"Cache-Control: public, max-age=31536000, immutable".
+"""
+import gzip
+import mimetypes
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+from crm import imagens
+
+try:
+    import brotli
+except ImportError:  # opcional: sem ele, só gzip
+    brotli = None
+
+# Extensões que vale a pena comprimir (imagens já vêm comprimidas).
+COMPRIMIVEIS = {'.css', '.js', '.mjs', '.map', '.svg', '.json', '.txt', '.html', '.xml', '.ico', '.ttf', '.eot'}
+# Nome com o hash de 12 caracteres do ManifestStaticFilesStorage.
+NOME_COM_HASH = re.compile(r'\.[0-9a-f]{12}\.')
+CACHE_IMUTAVEL = 'public, max-age=31536000, immutable'
+CACHE_CURTO = 'public, max-age=300'
+
+
+def comprimir(conteudo):
+    """
+    As cópias comprimidas do conteúdo que valem a pena, como (extensão, bytes):
+    '.gz' e, com brotli, '.br'.
+    """
+    # Sem mtime, o .gz sai igual a cada geração.
+    comprimidos = [('.gz', gzip.compress(conteudo, 9, mtime=0))]
+    if brotli is not None:
+        comprimidos.append(('.br', brotli.compress(conteudo)))
+    # Arquivos pequenos podem até crescer: nesse caso não vale a cópia.
+    return [(extensao, dados) for extensao, dados in comprimidos if len(dados) < len(conteudo) * 0.95]
+
+
+class ArmazenamentoEstatico(ManifestStaticFilesStorage):
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+
+        yield from self._gerar_variantes(paths)
+        # O manifesto já foi gravado pelo super(); gravamos de novo com as variantes.
+        self.save_manifest()
+
+        for nome in sorted(set(paths) | set(self.hashed_files.values())):
+            if posixpath.splitext(nome)[1].lower() in COMPRIMIVEIS:
+                self._comprimir(nome)
+
+    def _gerar_variantes(self, paths):
+        # Variantes já geradas pelo comando gerar_variantes_imagens vêm nas
+        # pastas de origem e foram tratadas como qualquer outro arquivo.
+        prontas = {nome.rsplit('-', 1)[0] for nome in paths if imagens.e_variante(nome)}
+        for nome in sorted(paths):
+            if not imagens.tem_variantes(nome) or posixpath.splitext(nome)[0] in prontas:
+                continue
+            with self.open(nome) as arquivo:
+                variantes = imagens.gerar_variantes(arquivo)
+            for largura, conteudo in variantes:
+                logico = imagens.nome_variante(nome, largura)
+                com_hash = self.hashed_name(logico, ContentFile(conteudo))
+                self._gravar(com_hash, conteudo)
+                self.hashed_files[self.hash_key(logico)] = com_hash
+                yield logico, com_hash, True
+
+    def _comprimir(self, nome):
+        with self.open(nome) as arquivo:
+            conteudo = arquivo.read()
+        for extensao, dados in comprimir(conteudo):
+            self._gravar(nome + extensao, dados)
+
+    def _gravar(self, nome, dados):
+        if self.exists(nome):
+            self.delete(nome)
+        self._save(nome, ContentFile(dados))
+
+
+def servir_estatico(request, caminho):
+    """Entrega um arquivo de STATIC_ROOT, comprimido quando possível."""
+    try:
+        arquivo = safe_join(settings.STATIC_ROOT, caminho)
+    except SuspiciousFileOperation:
+        raise Http404('Arquivo não encontrado.')
+    if not os.path.isfile(arquivo) or arquivo.endswith(('.gz', '.br')):
+        raise Http404('Arquivo não encontrado.')
+
+    estado = os.stat(arquivo)
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), estado.st_mtime):
+        return HttpResponseNotModified()
+
+    entregue, codificacao = arquivo, None
+    aceitas = request.headers.get('Accept-Encoding', '')
+    for nome, extensao in (('br', '.br'), ('gzip', '.gz')):
+        if nome in aceitas and os.path.isfile(arquivo + extensao):
+            entregue, codificacao = arquivo + extensao, nome
+            break
+
+    tipo, _ = mimetypes.guess_type(arquivo)
+    response = FileResponse(open(entregue, 'rb'), content_type=tipo or 'application/octet-stream')
+    if codificacao:
+        response['Content-Encoding'] = codificacao
+    patch_vary_headers(response, ['Accept-Encoding'])
+    response['Last-Modified'] = http_date(estado.st_mtime)
+    response['Cache-Control'] = CACHE_IMUTAVEL if NOME_COM_HASH.search(posixpath.basename(caminho)) else CACHE_CURTO
+    return response
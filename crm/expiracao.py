@@ -0,0 +1,37 @@
+"""
+Expiração de assinaturas vencidas.
+
+Em vez de carregar e salvar cada Assinatura, cada lote vira um único
+UPDATE ... SET status_pagamento = 'expirado' WHERE id IN (...) AND ..., com
+lotes de tamanho limitado para não segurar travas por muito tempo.
+"""
+import time
+
+from django.utils import timezone
+
+from crm.lotes import ids_por_chave
+from crm.models import Assinatura
+
+
+def assinaturas_vencidas(agora=None):
+    """Assinaturas pagas cuja data de expiração já passou."""
+    return Assinatura.objects.filter(
+        status_pagamento='pago',
+        data_expiracao__lt=agora or timezone.now(),
+    )
+
+
+def expirar_vencidas(agora=None, tamanho_lote=1000):
+    """
+    Marca como 'expirado' as assinaturas vencidas até 'agora'.
+    Retorna (quantidade expirada, segundos decorridos).
+    """
+    agora = agora or timezone.now()
+    inicio = time.monotonic()
+    total = 0
+    vencidas = assinaturas_vencidas(agora)
+    for ids in ids_por_chave(vencidas, tamanho_lote):
+        # Repetimos o filtro no UPDATE: uma renovação paga entre a leitura dos
+        # ids e a escrita não pode ser expirada por engano.
+        total += vencidas.filter(pk__in=ids).marcar_como_expirado()
+    return total, time.monotonic() - inicio
@@ -0,0 +1,94 @@
+"""
+Exportação de assinaturas em CSV ou JSONL, usada pelo comando
+export_assinaturas e pela view exportar_assinaturas.
+
+As linhas são geradas uma a uma (geradores), e o banco é lido em lotes pela
+chave primária (crm/lotes.py), então o consumo de memória não depende do
+tamanho da tabela.
+"""
+import csv
+import json
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+from crm.lotes import iterar_por_chave
+from crm.models import Assinatura
+from crm.roteamento import banco_de_leitura
+
+COLUNAS = [
+    'id', 'status_pagamento', 'status_usuario', 'data_inicio', 'data_expiracao',
+    'id_transacao_pagamento',
+    'usuario_nome', 'usuario_email', 'usuario_telefone',
+    'plano_nome', 'plano_valor',
+    'barbearia_nome', 'barbearia_cidade', 'barbearia_estado', 'barbearia_cep',
+]
+
+FORMATOS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+
+def filtrar_assinaturas(status=None, desde=None, ate=None):
+    """
+    Assinaturas com usuário, plano e barbearia (um único JOIN), filtradas
+    pelos status informados e pela data de início entre 'desde' e 'ate'
+    (datas, ambas inclusivas).
+
+    O banco é escolhido aqui (uma réplica, se houver), e não na hora de ler,
+    porque a resposta é enviada aos poucos, depois que a view já retornou.
+    """
+    assinaturas = Assinatura.objects.using(banco_de_leitura()).select_related('usuario', 'plano', 'barbearia')
+    if status:
+        assinaturas = assinaturas.filter(status_pagamento__in=status)
+    # Comparamos com datetimes (e não com data_inicio__date) para o banco
+    # poder usar um índice na coluna.
+    if desde:
+        assinaturas = assinaturas.filter(
+            data_inicio__gte=timezone.make_aware(datetime.combine(desde, time.min))
+        )
+    if ate:
+        assinaturas = assinaturas.filter(
+            data_inicio__lt=timezone.make_aware(datetime.combine(ate + timedelta(days=1), time.min))
+        )
+    return assinaturas
+
+
+def _data(valor):
+    return timezone.localtime(valor).isoformat() if valor else ''
+
+
+def _valores(assinatura):
+    usuario, plano, barbearia = assinatura.usuario, assinatura.plano, assinatura.barbearia
+    return [
+        assinatura.id, assinatura.status_pagamento, assinatura.status_usuario,
+        _data(assinatura.data_inicio), _data(assinatura.data_expiracao),
+        assinatura.id_transacao_pagamento or '',
+        usuario.nome_completo, usuario.email, usuario.telefone,
+        plano.nome_plano, str(plano.valor),
+        barbearia.nome_barbearia, barbearia.cidade, barbearia.estado, barbearia.cep,
+    ]
+
+
+class _Eco:
+    """Pseudo-arquivo para o csv.writer: devolve a linha em vez de guardá-la."""
+    def write(self, valor):
+        return valor
+
+
+def gerar_csv(assinaturas, tamanho_lote=2000):
+    escritor = csv.writer(_Eco())
+    yield escritor.writerow(COLUNAS)
+    for assinatura in iterar_por_chave(assinaturas, tamanho_lote):
+        yield escritor.writerow(_valores(assinatura))
+
+
+def gerar_jsonl(assinaturas, tamanho_lote=2000):
+    for assinatura in iterar_por_chave(assinaturas, tamanho_lote):
+        yield json.dumps(dict(zip(COLUNAS, _valores(assinatura))), ensure_ascii=False) + '\n'
+
+
+def gerar(formato, assinaturas, tamanho_lote=2000):
+    geradores = {'csv': gerar_csv, 'jsonl': gerar_jsonl}
+    return geradores[formato](assinaturas, tamanho_lote)
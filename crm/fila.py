@@ -0,0 +1,270 @@
+"""
+Fila de tarefas em segundo plano, guardada no banco (tabela crm_tarefa).
+
+O que não precisa (ou não pode) acontecer dentro de uma requisição vai para
+esta fila e é executado pelo comando run_worker, em outro processo: desde o
+e-mail de confirmação de um pagamento, enfileirado pelo webhook na mesma
+transação que o registra (crm/pagamentos.py), até os envios para milhares
+de usuários (crm/notificacoes.py):
+
+    python manage.py run_worker --processos 2 --threads 4
+
+Cada tarefa tem um 'tipo', que aponta o executor em EXECUTORES: uma função
+executor(tarefa, trabalhador) que faz o trabalho e chama
+trabalhador.contar(tarefa) a cada item tratado. O progresso
+(tarefa.processados) vai para o banco a cada CRM_FILA_PROGRESSO itens, e não
+só no fim: se o processo morrer no meio de um lote grande, a tarefa é
+retomada perto de onde parou. Se o executor levantar uma exceção, a tarefa
+volta para a fila com espera exponencial (ATRASO_BASE_SEGUNDOS * 2^(tentativas - 1), até
+ATRASO_MAXIMO_SEGUNDOS) e, esgotadas as tentativas, fica como 'falhou' com o
+erro em ultimo_erro.
+
+Vários trabalhadores podem ler a fila ao mesmo tempo: cada um reserva
+tarefas com um UPDATE condicional (status 'pendente' -> 'executando'), e só
+executa as que o UPDATE de fato mudou para ele. No MySQL 8 e no PostgreSQL a
+leitura usa SELECT ... FOR UPDATE SKIP LOCKED, para que trabalhadores
+concorrentes nem disputem as mesmas linhas. Uma tarefa presa em 'executando'
+(o processo morreu no meio) volta para a fila depois de
+CRM_FILA_TEMPO_TRAVADA segundos. Se o banco falhar no laço do trabalhador
+(queda de conexão, failover), o erro vai para o log e ele tenta de novo com
+espera exponencial, até ESPERA_MAXIMA_ERRO_SEGUNDOS.
+
+Métricas (crm/metricas.py): tarefas por tipo e resultado, itens tratados e
+duração de cada tarefa.
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import mail
+from django.db import DatabaseError, InterfaceError, close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from crm import metricas
+from crm.models import Tarefa
+
+logger = logging.getLogger(__name__)
+
+# tipo -> caminho do executor.
+EXECUTORES = {
+    'campanha': 'crm.notificacoes.enviar_campanha',
+    'lembrete_expiracao': 'crm.notificacoes.enviar_lembretes',
+    'pagamento_confirmado': 'crm.notificacoes.enviar_confirmacoes_pagamento',
+}
+
+ATRASO_BASE_SEGUNDOS = 30
+ATRASO_MAXIMO_SEGUNDOS = 60 * 60
+ESPERA_MAXIMA_ERRO_SEGUNDOS = 60
+
+TAREFAS = metricas.registrar(metricas.Contador(
+    'crm_fila_tarefas_total', 'Tarefas executadas pela fila, por tipo e resultado.',
+    rotulos=('tipo', 'resultado'),
+))
+ITENS = metricas.registrar(metricas.Contador(
+    'crm_fila_itens_total', 'Itens tratados pelas tarefas da fila (ex.: e-mails enviados), por tipo.',
+    rotulos=('tipo',),
+))
+DURACAO = metricas.registrar(metricas.Histograma(
+    'crm_fila_tarefa_segundos', 'Duração de cada execução de tarefa da fila, por tipo.',
+    metricas.FAIXAS_SEGUNDOS + (10.0, 30.0, 60.0), rotulos=('tipo',),
+))
+
+
+def enfileirar(tipo, dados=None, executar_em=None):
+    if tipo not in EXECUTORES:
+        raise ValueError(f'Tipo de tarefa desconhecido: {tipo}')
+    return Tarefa.objects.create(tipo=tipo, dados=dados or {}, executar_em=executar_em or timezone.now())
+
+
+def enfileirar_lotes(tipo, lotes, dados=None, tamanho_insert=500):
+    """
+    Cria uma tarefa por lote de ids (dados['ids']), com os mesmos 'dados'
+    nas demais chaves. Retorna quantas tarefas foram criadas.
+    """
+    if tipo not in EXECUTORES:
+        raise ValueError(f'Tipo de tarefa desconhecido: {tipo}')
+    agora = timezone.now()
+    criadas = 0
+    pendentes = []
+    for ids in lotes:
+        pendentes.append(Tarefa(tipo=tipo, dados={**(dados or {}), 'ids': list(ids)}, executar_em=agora))
+        if len(pendentes) >= tamanho_insert:
+            criadas += len(Tarefa.objects.bulk_create(pendentes))
+            pendentes = []
+    if pendentes:
+        criadas += len(Tarefa.objects.bulk_create(pendentes))
+    return criadas
+
+
+def atraso(tentativas):
+    """Espera antes da próxima tentativa, com uma variação aleatória para os
+    trabalhadores não voltarem todos no mesmo instante."""
+    segundos = min(ATRASO_BASE_SEGUNDOS * 2 ** (tentativas - 1), ATRASO_MAXIMO_SEGUNDOS)
+    return timedelta(seconds=segundos * random.uniform(0.75, 1.0))
+
+
+def reservar(trabalhador, quantidade=1, agora=None):
+    """Reserva até 'quantidade' tarefas vencidas para 'trabalhador' e as retorna."""
+    agora = agora or timezone.now()
+    vencidas = Tarefa.objects.filter(status='pendente', executar_em__lte=agora).order_by('executar_em', 'pk')
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            vencidas = vencidas.select_for_update(skip_locked=True)
+        ids = list(vencidas.values_list('pk', flat=True)[:quantidade])
+        if not ids:
+            return []
+        # Sem SKIP LOCKED, outro trabalhador pode ter lido os mesmos ids: o
+        # filtro por status garante que cada tarefa vai para um só.
+        Tarefa.objects.filter(pk__in=ids, status='pendente').update(
+            status='executando', trabalhador=trabalhador, iniciada_em=agora,
+            tentativas=F('tentativas') + 1,
+        )
+    return list(Tarefa.objects.filter(pk__in=ids, status='executando', trabalhador=trabalhador))
+
+
+def liberar_travadas(agora=None):
+    """Devolve à fila as tarefas em 'executando' há mais de CRM_FILA_TEMPO_TRAVADA segundos."""
+    agora = agora or timezone.now()
+    limite = agora - timedelta(seconds=getattr(settings, 'CRM_FILA_TEMPO_TRAVADA', 15 * 60))
+    return Tarefa.objects.filter(status='executando', iniciada_em__lt=limite).update(
+        status='pendente', trabalhador='', executar_em=agora,
+    )
+
+
+def _renovar_conexoes():
+    """Como ao fim de cada requisição: descarta conexões vencidas ou com erro.
+    Dentro de uma transação (ex.: num TestCase) a conexão é mantida."""
+    if not connection.in_atomic_block:
+        close_old_connections()
+
+
+class Trabalhador:
+    """
+    Executa tarefas da fila numa thread. Mantém uma única conexão de e-mail
+    (SMTP) aberta entre uma tarefa e outra; executores que mandam e-mail a
+    pegam com conexao_email().
+    """
+
+    def __init__(self, nome=None):
+        self.nome = nome or f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+        self.tarefas = 0
+        self.itens = 0
+        self._conexao = None
+
+    def conexao_email(self):
+        if self._conexao is None:
+            self._conexao = mail.get_connection()
+            self._conexao.open()
+        return self._conexao
+
+    def fechar(self):
+        if self._conexao is not None:
+            try:
+                self._conexao.close()
+            except Exception:
+                logger.warning('Erro ao fechar a conexão de e-mail.', exc_info=True)
+            self._conexao = None
+
+    def contar(self, tarefa):
+        """Soma um item tratado à tarefa e, a cada CRM_FILA_PROGRESSO, grava o
+        progresso. Só grava se a tarefa ainda é deste trabalhador: uma que já
+        voltou para a fila por liberar_travadas() não é sobrescrita."""
+        tarefa.processados += 1
+        if tarefa.processados % getattr(settings, 'CRM_FILA_PROGRESSO', 100) == 0:
+            Tarefa.objects.filter(pk=tarefa.pk, status='executando', trabalhador=self.nome).update(
+                processados=tarefa.processados,
+            )
+
+    def executar(self, tarefa):
+        inicio = time.perf_counter()
+        processados_antes = tarefa.processados
+        try:
+            import_string(EXECUTORES[tarefa.tipo])(tarefa, self)
+        except Exception as erro:
+            # O estado da conexão SMTP é desconhecido: abre outra na próxima.
+            self.fechar()
+            resultado = self._falhou(tarefa, erro)
+        else:
+            resultado = 'concluida'
+            Tarefa.objects.filter(pk=tarefa.pk).update(
+                status='concluida', concluida_em=timezone.now(), processados=tarefa.processados, ultimo_erro='',
+            )
+        itens = tarefa.processados - processados_antes
+        self.tarefas += 1
+        self.itens += itens
+        TAREFAS.incrementar(tarefa.tipo, resultado)
+        ITENS.incrementar(tarefa.tipo, quantidade=itens)
+        DURACAO.observar(time.perf_counter() - inicio, tarefa.tipo)
+        return resultado
+
+    def _falhou(self, tarefa, erro):
+        mensagem = f'{type(erro).__name__}: {erro}'
+        campos = {'processados': tarefa.processados, 'ultimo_erro': mensagem, 'trabalhador': ''}
+        if tarefa.tentativas >= tarefa.max_tentativas:
+            logger.error('Tarefa %s falhou de vez após %s tentativas: %s', tarefa, tarefa.tentativas, mensagem)
+            Tarefa.objects.filter(pk=tarefa.pk).update(status='falhou', **campos)
+            return 'falhou'
+        logger.warning('Tarefa %s falhou (tentativa %s): %s', tarefa, tarefa.tentativas, mensagem)
+        Tarefa.objects.filter(pk=tarefa.pk).update(
+            status='pendente', executar_em=timezone.now() + atraso(tarefa.tentativas), **campos
+        )
+        return 'reagendada'
+
+    def executar_pendentes(self, quantidade=1, parar=None):
+        """Reserva e executa tarefas até a fila não ter nenhuma vencida (ou
+        'parar' ser sinalizado). Retorna quantas foram executadas."""
+        executadas = 0
+        while parar is None or not parar.is_set():
+            tarefas = reservar(self.nome, quantidade)
+            if not tarefas:
+                return executadas
+            for tarefa in tarefas:
+                self.executar(tarefa)
+                executadas += 1
+        return executadas
+
+    def rodar(self, parar, espera=1.0, uma_vez=False):
+        """
+        Laço do trabalhador: executa o que houver na fila e, com ela vazia,
+        espera 'espera' segundos antes de olhar de novo, até 'parar' (um
+        threading.Event, ou a Parada de run_worker entre processos) ser
+        sinalizado. Com 'uma_vez', termina assim que a fila esvaziar.
+
+        Um erro do banco não derruba a thread: vai para o log e o laço tenta
+        de novo depois de 1, 2, 4... segundos (até ESPERA_MAXIMA_ERRO_SEGUNDOS).
+        A tarefa que estava em andamento, se havia, volta para a fila por
+        liberar_travadas().
+        """
+        ultima_liberacao = 0
+        falhas = 0
+        try:
+            while not parar.is_set():
+                try:
+                    _renovar_conexoes()
+                    if time.monotonic() - ultima_liberacao > 60:
+                        liberar_travadas()
+                        ultima_liberacao = time.monotonic()
+                    self.executar_pendentes(parar=parar)
+                except (DatabaseError, InterfaceError):
+                    falhas += 1
+                    pausa = min(2 ** (falhas - 1), ESPERA_MAXIMA_ERRO_SEGUNDOS)
+                    logger.exception(
+                        'Erro no banco no trabalhador %s (%s seguido(s)); tentando de novo em %ss.',
+                        self.nome, falhas, pausa,
+                    )
+                    parar.wait(pausa)
+                    continue
+                falhas = 0
+                if uma_vez:
+                    break
+                parar.wait(espera)
+        finally:
+            self.fechar()
+            _renovar_conexoes()
@@ -24,23 +24,101 @@ Dentro podemos usar a nossa orientação a objetos para criar formulários que r
 
 
 
+"""
+
+# Orientação a Objetos 
+
+import copy
+
 from django import forms
-from .models import Barbearia, Usuario, Assinatura
+from django.db import transaction
+
+from . import ceps
+from .catalogo import listar_planos
+from .models import Assinatura, Barbearia, Plano, Usuario
+# Herança de classes
+class PlanoForms(forms.Form):
+    nome_plano = forms.CharField(
+        max_length=100, # quantidade de caracteres
+        required=True, # campo obrigatório
+        widget=forms.TextInput(attrs={'class': 'form-control'}),
+        label='Nome do Plano' # rótulo do campo
+    )
+    valor = forms.DecimalField(
+        max_digits=10, # número máximo de dígitos
+        decimal_places=2, # número de casas decimais
+        required=True, # campo obrigatório
+        widget=forms.NumberInput(attrs={'class': 'form-control'}),
+        label='Valor do Plano' # rótulo do campo
+    )
+    descricao = forms.CharField(
+        widget=forms.Textarea(attrs={'class': 'form-control', 'rows': 3}),
+        required=False, # campo opcional
+        label='Descrição do Plano' # rótulo do campo
+    )
+    duracao_dias = forms.IntegerField(
+        min_value=1, # pelo menos um dia de acesso
+        initial=30, # plano mensal por padrão
+        required=False, # se ficar em branco, usa 30 dias
+        widget=forms.NumberInput(attrs={'class': 'form-control'}),
+        label='Duração (dias)' # rótulo do campo
+    )
+
+
+# Unidades federativas aceitas em Barbearia.estado.
+ESTADOS = [
+    ('AC', 'Acre'), ('AL', 'Alagoas'), ('AP', 'Amapá'), ('AM', 'Amazonas'), ('BA', 'Bahia'),
+    ('CE', 'Ceará'), ('DF', 'Distrito Federal'), ('ES', 'Espírito Santo'), ('GO', 'Goiás'),
+    ('MA', 'Maranhão'), ('MT', 'Mato Grosso'), ('MS', 'Mato Grosso do Sul'), ('MG', 'Minas Gerais'),
+    ('PA', 'Pará'), ('PB', 'Paraíba'), ('PR', 'Paraná'), ('PE', 'Pernambuco'), ('PI', 'Piauí'),
+    ('RJ', 'Rio de Janeiro'), ('RN', 'Rio Grande do Norte'), ('RS', 'Rio Grande do Sul'),
+    ('RO', 'Rondônia'), ('RR', 'Roraima'), ('SC', 'Santa Catarina'), ('SP', 'São Paulo'),
+    ('SE', 'Sergipe'), ('TO', 'Tocantins'),
+]
+
+
+class CampoCep(forms.CharField):
+    """CEP com 8 dígitos, em qualquer formato; gravado como 00000-000."""
+
+    def to_python(self, value):
+        value = super().to_python(value)
+        if value in self.empty_values:
+            return value
+        numero = ceps.numero(value)
+        if numero is None:
+            raise forms.ValidationError('Informe um CEP com 8 dígitos.', code='invalid')
+        return ceps.formatar(numero)
+
 
 class BarbeariaForm(forms.ModelForm):
+    cep = CampoCep(
+        max_length=9,
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': '00000-000'}),
+        label='CEP'
+    )
+    estado = forms.ChoiceField(
+        choices=[('', 'Selecione')] + ESTADOS,
+        widget=forms.Select(attrs={'class': 'form-select'}),
+        label='Estado (UF)'
+    )
+
     class Meta:
         model = Barbearia
-        fields = ['nome_barbearia', 'endereco', 'cep']
+        fields = ['nome_barbearia', 'endereco', 'cidade', 'estado', 'cep']
         widgets = {
             'nome_barbearia': forms.TextInput(attrs={'class': 'form-control'}),
             'endereco': forms.TextInput(attrs={'class': 'form-control'}),
-            'cep': forms.TextInput(attrs={'class': 'form-control', 'placeholder': '00000-000'}),
+            'cidade': forms.TextInput(attrs={'class': 'form-control'}),
         }
         labels = {
             'nome_barbearia': 'Nome da Barbearia',
             'endereco': 'Endereço',
+            'cidade': 'Cidade',
+            'estado': 'Estado (UF)',
             'cep': 'CEP',
         }
+
+
 class UsuarioForm(forms.ModelForm):
     class Meta:
         model = Usuario
@@ -59,8 +137,10 @@ class UsuarioForm(forms.ModelForm):
             'aceite_termos': 'Aceitou os Termos de Uso',
             'receber_notificacoes': 'Deseja receber notificações?',
         }
-class AssinaturaForm(forms.ModelForm):  
-    class Meta: 
+
+
+class AssinaturaForm(forms.ModelForm):
+    class Meta:
         model = Assinatura
         fields = ['usuario', 'barbearia', 'plano']
         widgets = {
@@ -74,29 +154,65 @@ class AssinaturaForm(forms.ModelForm):
             'plano': 'Plano',
         }
 
-"""
 
-# Orientação a Objetos 
-
-from django import forms
-from .models import Plano
-# Herança de classes
-class PlanoForms(forms.Form):
-    nome_plano = forms.CharField(
-        max_length=100, # quantidade de caracteres
-        required=True, # campo obrigatório
-        widget=forms.TextInput(attrs={'class': 'form-control'}),
-        label='Nome do Plano' # rótulo do campo
+class ExportacaoForm(forms.Form):
+    """Filtros da exportação de assinaturas (view exportar_assinaturas)."""
+    formato = forms.ChoiceField(
+        choices=[('csv', 'CSV'), ('jsonl', 'JSONL')],
+        required=False,
+        label='Formato'
     )
-    valor = forms.DecimalField(
-        max_digits=10, # número máximo de dígitos
-        decimal_places=2, # número de casas decimais
-        required=True, # campo obrigatório
-        widget=forms.NumberInput(attrs={'class': 'form-control'}),
-        label='Valor do Plano' # rótulo do campo
+    status = forms.MultipleChoiceField(
+        choices=Assinatura.STATUS_PAGAMENTO_CHOICES,
+        required=False,
+        label='Status do Pagamento'
     )
-    descricao = forms.CharField(
-        widget=forms.Textarea(attrs={'class': 'form-control', 'rows': 3}),
-        required=False, # campo opcional
-        label='Descrição do Plano' # rótulo do campo
+    desde = forms.DateField(required=False, label='Início a partir de')
+    ate = forms.DateField(required=False, label='Início até')
+
+
+class CheckoutForm(forms.Form):
+    """
+    Formulário único do checkout: dados do usuário, da barbearia e o plano.
+
+    Reaproveita os campos de UsuarioForm e BarbeariaForm. Os planos vêm do
+    cache do catálogo, então validar o formulário não consulta o banco.
+    """
+    plano = forms.TypedChoiceField(
+        coerce=int,
+        widget=forms.Select(attrs={'class': 'form-select'}),
+        label='Plano'
     )
+
+    def __init__(self, *args, planos=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.planos = planos if planos is not None else listar_planos()
+        self.fields['plano'].choices = [(plano.id, str(plano)) for plano in self.planos]
+        for form_class in (UsuarioForm, BarbeariaForm):
+            for nome, campo in form_class.base_fields.items():
+                self.fields[nome] = copy.deepcopy(campo)
+        # No checkout, aceitar os termos é obrigatório.
+        self.fields['aceite_termos'].required = True
+
+    @property
+    def plano_escolhido(self):
+        plano_id = self.cleaned_data.get('plano')
+        return next((plano for plano in self.planos if plano.id == plano_id), None)
+
+    def save(self):
+        """
+        Cria Usuario (ou reaproveita o do mesmo email), Barbearia e Assinatura
+        numa única transação. Retorna a Assinatura criada.
+        """
+        dados = self.cleaned_data
+        with transaction.atomic():
+            usuario, _ = Usuario.objects.get_or_create(
+                email=dados['email'].lower(),
+                defaults={campo: dados[campo] for campo in UsuarioForm._meta.fields if campo != 'email'},
+            )
+            barbearia = Barbearia.objects.create(
+                **{campo: dados[campo] for campo in BarbeariaForm._meta.fields}
+            )
+            return Assinatura.objects.create(
+                usuario=usuario, barbearia=barbearia, plano=self.plano_escolhido
+            )
@@ -0,0 +1,132 @@
+"""
+Variantes das imagens estáticas grandes (banners e prévias dos templates).
+
+Os PNGs originais têm de centenas de KB a alguns MB. Para cada um geramos
+cópias em WebP em algumas larguras (nunca maiores que a original), com nomes
+como 'assets/banner1-960w.webp', para o navegador baixar só o tamanho de que
+precisa (atributo srcset).
+
+As variantes são geradas de duas formas, com o mesmo resultado:
+
+- pelo comando gerar_variantes_imagens, ao lado das originais (em
+  STATICFILES_DIRS), para usar em desenvolvimento e já entrar no collectstatic;
+- pelo próprio collectstatic (crm/estaticos.py), para as imagens que ainda não
+  têm variantes.
+
+A tag {% imagem_responsiva %} (crm/templatetags/imagens_responsivas.py) usa
+variantes() para montar o srcset com as que existirem.
+
+Depende do Pillow. Sem ele, nenhuma variante é gerada e as páginas continuam
+usando os originais.
+"""
+import fnmatch
+import functools
+import io
+import logging
+import posixpath
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+
+logger = logging.getLogger(__name__)
+
+LARGURAS_PADRAO = (480, 960, 1600)
+QUALIDADE_WEBP = 80
+# Nome gerado por nome_variante(), ex.: 'assets/banner1-960w.webp'.
+_VARIANTE = re.compile(r'-\d+w\.webp$')
+
+
+def larguras():
+    return tuple(sorted(getattr(settings, 'CRM_LARGURAS_IMAGENS', LARGURAS_PADRAO)))
+
+
+def tem_variantes(nome):
+    """Se a imagem estática 'nome' (ex.: 'assets/banner1.png') ganha variantes."""
+    padroes = getattr(settings, 'CRM_IMAGENS_VARIANTES', [])
+    return any(fnmatch.fnmatch(nome, padrao) for padrao in padroes)
+
+
+def nome_variante(nome, largura):
+    return f'{posixpath.splitext(nome)[0]}-{largura}w.webp'
+
+
+def e_variante(nome):
+    return _VARIANTE.search(nome) is not None
+
+
+def gerar_variantes(arquivo, larguras_desejadas=None):
+    """
+    Lê a imagem de 'arquivo' (caminho ou arquivo aberto) e retorna uma lista
+    de (largura, bytes em WebP): uma por largura menor que a original, mais a
+    largura original. Sem o Pillow, retorna uma lista vazia.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        logger.warning('Pillow não instalado: variantes de imagem não foram geradas.')
+        return []
+
+    with Image.open(arquivo) as imagem:
+        imagem.load()
+        if imagem.mode not in ('RGB', 'RGBA'):
+            imagem = imagem.convert('RGBA' if 'A' in imagem.getbands() else 'RGB')
+        original = imagem.width
+        alvo = [largura for largura in (larguras_desejadas or larguras()) if largura < original]
+        variantes = []
+        for largura in [*alvo, original]:
+            copia = imagem
+            if largura != original:
+                altura = max(1, round(imagem.height * largura / original))
+                copia = imagem.resize((largura, altura), Image.LANCZOS)
+            saida = io.BytesIO()
+            copia.save(saida, 'WEBP', quality=QUALIDADE_WEBP, method=6)
+            variantes.append((largura, saida.getvalue()))
+    return variantes
+
+
+def _abrir(nome):
+    """Abre uma imagem estática: das pastas de origem ou de STATIC_ROOT."""
+    caminho = finders.find(nome)
+    if caminho:
+        return open(caminho, 'rb')
+    return staticfiles_storage.open(nome)
+
+
+def _url_se_existir(nome):
+    if hasattr(staticfiles_storage, 'stored_name'):
+        # ArmazenamentoEstatico: existe se estiver no manifesto.
+        try:
+            return staticfiles_storage.url(nome)
+        except ValueError:
+            return None
+    return staticfiles_storage.url(nome) if finders.find(nome) else None
+
+
+@functools.lru_cache(maxsize=None)
+def variantes(nome):
+    """
+    (largura, altura, [(largura, url), ...]) da imagem estática 'nome', com as
+    variantes WebP que existirem, da menor para a maior; None se a imagem não
+    puder ser lida (sem Pillow ou arquivo ausente). Calculado uma vez por
+    processo, já que os estáticos só mudam num novo deploy.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    try:
+        with _abrir(nome) as arquivo, Image.open(arquivo) as imagem:
+            largura, altura = imagem.size
+    except (OSError, ValueError):
+        logger.warning('Imagem estática %s não encontrada.', nome)
+        return None
+
+    disponiveis = []
+    if tem_variantes(nome):
+        for candidata in [*(w for w in larguras() if w < largura), largura]:
+            url = _url_se_existir(nome_variante(nome, candidata))
+            if url:
+                disponiveis.append((candidata, url))
+    return largura, altura, disponiveis
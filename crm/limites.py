@@ -0,0 +1,176 @@
+"""
+Limite de tentativas nos formulários públicos (cadastro no checkout e
+criação de plano).
+
+Um robô mandando POSTs em sequência custaria, a cada um, a validação do
+formulário e consultas ao banco. O decorador limitar() conta as tentativas
+de cada IP (e, no cadastro, de cada e-mail) e responde 429 antes de a view
+rodar, quando o cliente passou do limite:
+
+    @limitar('criar_usuario')
+    def criar_usuario(request): ...
+
+Os limites de cada regra ficam em settings.CRM_LIMITES, como
+(tentativas, janela em segundos):
+
+    CRM_LIMITES = {'criar_usuario': {'ip': (10, 60), 'email': (3, 600)}}
+
+A contagem é uma janela deslizante aproximada: dois contadores no cache, o
+da janela atual e o da anterior, que entra com o peso da parte dela que
+ainda está dentro dos últimos 'janela' segundos. São no máximo três acessos
+ao cache por tentativa (um get_many, um add e um incr) e nenhum ao banco. As
+tentativas rejeitadas não contam, e o Retry-After é o tempo até a estimativa
+ficar abaixo do limite (que pode cair no meio da janela atual ou já na
+seguinte), então quem espera por ele volta a ser atendido.
+
+O cache usado é settings.CRM_CACHE_LIMITES. Com vários processos, ele
+precisa ser compartilhado (Redis, Memcached); no cache em memória local,
+cada processo conta só as suas tentativas.
+
+Atrás de um proxy reverso, REMOTE_ADDR é o do proxy: informe em
+CRM_LIMITE_PROXIES quantos proxies confiáveis acrescentam o
+X-Forwarded-For, e o IP do cliente é lido de lá.
+
+As rejeições aparecem em /metricas/ (crm_limite_rejeicoes_total).
+"""
+import asyncio
+import hashlib
+import math
+import time
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+from crm import metricas
+
+METODOS_LIMITADOS = ('POST',)
+
+REJEICOES = metricas.registrar(metricas.Contador(
+    'crm_limite_rejeicoes_total',
+    'Requisições rejeitadas pelo limite de tentativas, por regra e tipo de chave.',
+    rotulos=('regra', 'chave'),
+))
+
+
+def _cache():
+    return caches[getattr(settings, 'CRM_CACHE_LIMITES', 'default')]
+
+
+def ip_do_cliente(request):
+    proxies = getattr(settings, 'CRM_LIMITE_PROXIES', 0)
+    if proxies:
+        encaminhados = [
+            ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if ip.strip()
+        ]
+        if len(encaminhados) >= proxies:
+            return encaminhados[-proxies]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def _valor(request, tipo):
+    if tipo == 'ip':
+        return ip_do_cliente(request)
+    # Demais tipos são campos do formulário, como o e-mail.
+    return request.POST.get(tipo, '').strip().lower()
+
+
+def _espera(atual, anterior, tentativas, janela, agora):
+    """
+    Segundos até a estimativa atual + anterior * (1 - decorrido) ficar abaixo
+    de 'tentativas', sem novas tentativas aceitas no meio do caminho.
+    """
+    decorrido = agora % janela
+    if atual < tentativas:
+        # Cai ainda nesta janela, conforme o peso da anterior diminui.
+        liberado = janela * (1 - (tentativas - atual) / anterior)
+    else:
+        # Só na próxima, quando a janela atual passa a ser a anterior.
+        liberado = janela + janela * (1 - tentativas / atual)
+    # A estimativa precisa ficar estritamente abaixo do limite.
+    return math.floor(liberado - decorrido) + 1
+
+
+def verificar(request, regra, agora=None):
+    """
+    Conta uma tentativa de 'request' na regra. Retorna None se ela foi
+    aceita, ou (tipo da chave, segundos até liberar) se passou do limite.
+    Com mais de uma chave acima do limite, vale a que demora mais a liberar.
+    """
+    limites = getattr(settings, 'CRM_LIMITES', {}).get(regra)
+    if not limites:
+        return None
+    agora = time.time() if agora is None else agora
+
+    contadores = []
+    for tipo, (tentativas, janela) in limites.items():
+        valor = _valor(request, tipo)
+        if not valor:
+            continue
+        # O valor vai como hash: e-mails não ficam legíveis no cache.
+        base = f'crm:limite:{regra}:{tipo}:{hashlib.md5(valor.encode()).hexdigest()}'
+        numero = int(agora // janela)
+        contadores.append((tipo, tentativas, janela, f'{base}:{numero}', f'{base}:{numero - 1}'))
+    if not contadores:
+        return None
+
+    cache = _cache()
+    contagens = cache.get_many([chave for *_, atual, anterior in contadores for chave in (atual, anterior)])
+    rejeicao = None
+    for tipo, tentativas, janela, atual, anterior in contadores:
+        atual, anterior = contagens.get(atual, 0), contagens.get(anterior, 0)
+        decorrido = (agora % janela) / janela
+        if atual + anterior * (1 - decorrido) >= tentativas:
+            espera = _espera(atual, anterior, tentativas, janela, agora)
+            if rejeicao is None or espera > rejeicao[1]:
+                rejeicao = (tipo, espera)
+    if rejeicao:
+        REJEICOES.incrementar(regra, rejeicao[0])
+        return rejeicao
+
+    for tipo, tentativas, janela, atual, anterior in contadores:
+        # O contador vive duas janelas: a dele e a seguinte, em que é o "anterior".
+        cache.add(atual, 0, janela * 2)
+        try:
+            cache.incr(atual)
+        except ValueError:
+            # Expirou entre o add e o incr.
+            cache.set(atual, 1, janela * 2)
+    return None
+
+
+def _rejeitar(segundos):
+    response = HttpResponse(
+        f'Muitas tentativas. Tente de novo em {segundos} segundos.',
+        status=429, content_type='text/plain; charset=utf-8',
+    )
+    response['Retry-After'] = str(segundos)
+    return response
+
+
+def limitar(regra):
+    """Decorador que aplica a regra 'regra' de CRM_LIMITES aos POSTs da view."""
+    def decorador(view):
+        if asyncio.iscoroutinefunction(view):
+            @wraps(view)
+            async def _view_async(request, *args, **kwargs):
+                if request.method in METODOS_LIMITADOS:
+                    rejeicao = await sync_to_async(verificar)(request, regra)
+                    if rejeicao:
+                        return _rejeitar(rejeicao[1])
+                return await view(request, *args, **kwargs)
+            return _view_async
+
+        @wraps(view)
+        def _view(request, *args, **kwargs):
+            if request.method in METODOS_LIMITADOS:
+                rejeicao = verificar(request, regra)
+                if rejeicao:
+                    return _rejeitar(rejeicao[1])
+            return view(request, *args, **kwargs)
+        return _view
+
+    return decorador
@@ -0,0 +1,40 @@
+"""
+Percorre tabelas grandes em lotes, com memória constante.
+
+O driver do MySQL carrega o resultado inteiro de uma consulta na memória,
+mesmo usando queryset.iterator(). Para ler milhões de linhas, paginamos pela
+chave primária ("keyset pagination"): cada lote é uma consulta curta do tipo
+WHERE id > <último id do lote anterior> ORDER BY id LIMIT <tamanho>, que usa o
+índice da chave primária e não fica mais lenta conforme avançamos na tabela.
+"""
+
+
+def iterar_por_chave(queryset, tamanho_lote=2000):
+    """Gera os objetos do queryset, buscando 'tamanho_lote' por vez."""
+    ultimo_id = None
+    while True:
+        lote = queryset.order_by('pk')
+        if ultimo_id is not None:
+            lote = lote.filter(pk__gt=ultimo_id)
+        lote = list(lote[:tamanho_lote])
+        if not lote:
+            return
+        yield from lote
+        ultimo_id = lote[-1].pk
+
+
+def ids_por_chave(queryset, tamanho_lote=1000):
+    """
+    Gera listas com até 'tamanho_lote' chaves primárias do queryset, em ordem.
+    Útil para aplicar um UPDATE por lote sem carregar os objetos.
+    """
+    ultimo_id = None
+    while True:
+        lote = queryset.order_by('pk')
+        if ultimo_id is not None:
+            lote = lote.filter(pk__gt=ultimo_id)
+        ids = list(lote.values_list('pk', flat=True)[:tamanho_lote])
+        if not ids:
+            return
+        yield ids
+        ultimo_id = ids[-1]
@@ -0,0 +1,44 @@
+"""
+Enfileira e-mails de notificação (crm/notificacoes.py) para o run_worker.
+
+    # Lembrete para quem vence daqui a 7 dias (rodar uma vez por dia):
+    0 9 * * * cd /caminho/do/projeto && python manage.py enfileirar_notificacoes lembretes --dias 7
+
+    # Campanha para todos que aceitaram receber notificações:
+    python manage.py enfileirar_notificacoes campanha --assunto "Novidades" --mensagem "..."
+
+Só cria as tarefas, uma por lote de destinatários; o envio é do run_worker.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from crm import notificacoes
+
+
+class Command(BaseCommand):
+    help = 'Enfileira uma campanha ou os lembretes de vencimento para o run_worker enviar.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('tipo', choices=['campanha', 'lembretes'])
+        parser.add_argument('--assunto', help='Assunto da campanha.')
+        parser.add_argument('--mensagem', help='Texto da campanha.')
+        parser.add_argument(
+            '--dias', type=int, default=7,
+            help='Lembretes: avisar quem vence daqui a quantos dias (padrão: 7).'
+        )
+        parser.add_argument(
+            '--lote', type=int,
+            help='Destinatários por tarefa (padrão: CRM_NOTIFICACOES_LOTE).'
+        )
+
+    def handle(self, *args, **options):
+        if options['lote'] is not None and options['lote'] < 1:
+            raise CommandError('--lote deve ser maior que zero.')
+        if options['tipo'] == 'campanha':
+            if not options['assunto'] or not options['mensagem']:
+                raise CommandError('A campanha precisa de --assunto e --mensagem.')
+            criadas = notificacoes.enfileirar_campanha(
+                options['assunto'], options['mensagem'], tamanho_lote=options['lote']
+            )
+        else:
+            criadas = notificacoes.enfileirar_lembretes(options['dias'], tamanho_lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(f'{criadas} tarefa(s) enfileirada(s).'))
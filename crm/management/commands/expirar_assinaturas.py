@@ -0,0 +1,28 @@
+"""
+Expira as assinaturas pagas cujo vencimento já passou.
+
+Pensado para rodar periodicamente (cron, systemd timer, agendador do host):
+
+    */15 * * * * cd /caminho/do/projeto && python manage.py expirar_assinaturas
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.expiracao import expirar_vencidas
+
+
+class Command(BaseCommand):
+    help = "Marca como 'expirado' as assinaturas pagas com data de expiração no passado."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote', type=int, default=1000,
+            help='Quantidade máxima de assinaturas por UPDATE (padrão: 1000).'
+        )
+
+    def handle(self, *args, **options):
+        if options['lote'] < 1:
+            raise CommandError('--lote deve ser maior que zero.')
+        total, decorrido = expirar_vencidas(tamanho_lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} assinaturas expiradas em {decorrido:.2f}s.'
+        ))
@@ -0,0 +1,56 @@
+"""
+Exporta assinaturas (com usuário, plano e barbearia) em CSV ou JSONL.
+
+Uso:
+    python manage.py export_assinaturas --saida assinaturas.csv
+    python manage.py export_assinaturas --formato jsonl --status pago --desde 2025-07-01 --ate 2025-07-31
+
+Sem --saida, o resultado vai para a saída padrão.
+"""
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm import exportacao
+from crm.models import Assinatura
+
+
+def _data(valor):
+    try:
+        return date.fromisoformat(valor)
+    except ValueError:
+        raise CommandError(f'Data inválida: {valor} (use AAAA-MM-DD).')
+
+
+class Command(BaseCommand):
+    help = 'Exporta as assinaturas em CSV ou JSONL, lendo o banco em lotes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--formato', choices=list(exportacao.FORMATOS), default='csv')
+        parser.add_argument(
+            '--status', action='append',
+            choices=[valor for valor, _ in Assinatura.STATUS_PAGAMENTO_CHOICES],
+            help='Filtra pelo status do pagamento (pode ser repetido).'
+        )
+        parser.add_argument('--desde', type=_data, help='Data de início mínima (AAAA-MM-DD).')
+        parser.add_argument('--ate', type=_data, help='Data de início máxima (AAAA-MM-DD).')
+        parser.add_argument('--saida', help='Arquivo de destino (padrão: saída padrão).')
+        parser.add_argument('--lote', type=int, default=2000, help='Linhas lidas do banco por consulta.')
+
+    def handle(self, *args, **options):
+        assinaturas = exportacao.filtrar_assinaturas(
+            status=options['status'], desde=options['desde'], ate=options['ate']
+        )
+        linhas = exportacao.gerar(options['formato'], assinaturas, options['lote'])
+
+        if not options['saida']:
+            for linha in linhas:
+                self.stdout.write(linha, ending='')
+            return
+
+        total = -1 if options['formato'] == 'csv' else 0  # não conta o cabeçalho
+        with open(options['saida'], 'w', encoding='utf-8', newline='') as arquivo:
+            for linha in linhas:
+                arquivo.write(linha)
+                total += 1
+        self.stderr.write(f'{total} assinaturas exportadas para {options["saida"]}.')
@@ -0,0 +1,60 @@
+"""
+Gera as variantes WebP redimensionadas das imagens estáticas grandes.
+
+As imagens são as de CRM_IMAGENS_VARIANTES, nas larguras de
+CRM_LARGURAS_IMAGENS (crm/imagens.py). As variantes ficam ao lado de cada
+original, nas pastas de origem (ex.: setup/static/assets/banner1-960w.webp),
+e a tag {% imagem_responsiva %} passa a usá-las. Rode depois de trocar uma
+imagem; as que já estão em dia são puladas:
+
+    python manage.py gerar_variantes_imagens
+"""
+import glob
+import importlib.util
+import os
+
+from django.contrib.staticfiles import finders
+from django.core.management.base import BaseCommand, CommandError
+
+from crm import imagens
+
+
+class Command(BaseCommand):
+    help = 'Gera as variantes WebP (srcset) das imagens estáticas configuradas em CRM_IMAGENS_VARIANTES.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--forcar', action='store_true',
+            help='Gera de novo mesmo as variantes mais novas que a imagem original.'
+        )
+
+    def handle(self, *args, **options):
+        if importlib.util.find_spec('PIL') is None:
+            raise CommandError('Instale o Pillow para gerar as variantes (veja requirements.txt).')
+
+        geradas = puladas = 0
+        for nome, caminho in self._imagens():
+            base = os.path.splitext(caminho)[0]
+            prontas = glob.glob(f'{glob.escape(base)}-*w.webp')
+            if not options['forcar'] and prontas and min(map(os.path.getmtime, prontas)) >= os.path.getmtime(caminho):
+                puladas += 1
+                continue
+            for largura, conteudo in imagens.gerar_variantes(caminho):
+                with open(f'{base}-{largura}w.webp', 'wb') as arquivo:
+                    arquivo.write(conteudo)
+                self.stdout.write(f'{imagens.nome_variante(nome, largura)} ({len(conteudo) // 1024} KB)')
+                geradas += 1
+
+        imagens.variantes.cache_clear()
+        self.stdout.write(self.style.SUCCESS(f'{geradas} variante(s) gerada(s), {puladas} imagem(ns) em dia.'))
+
+    def _imagens(self):
+        """(nome, caminho) de cada imagem configurada, uma vez por nome."""
+        vistas = set()
+        for finder in finders.get_finders():
+            for nome, armazenamento in finder.list([]):
+                nome = nome.replace(os.sep, '/')
+                if nome in vistas or imagens.e_variante(nome) or not imagens.tem_variantes(nome):
+                    continue
+                vistas.add(nome)
+                yield nome, armazenamento.path(nome)
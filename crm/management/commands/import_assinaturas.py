@@ -0,0 +1,258 @@
+"""
+Importa assinaturas em massa a partir de um arquivo CSV ou JSONL.
+
+Uso:
+    python manage.py import_assinaturas revenda.csv
+    python manage.py import_assinaturas revenda.jsonl --lote 5000
+
+Cada linha descreve um dono de barbearia e a assinatura dele, com as colunas:
+
+    nome_completo, email, telefone, aceite_termos, receber_notificacoes,
+    nome_barbearia, endereco, cidade, estado, cep,
+    plano, status_pagamento, id_transacao_pagamento
+
+'plano' é o nome do plano (Plano.nome_plano). Os dados são validados pelas
+mesmas regras de campo de UsuarioForm e BarbeariaForm.
+
+O arquivo é lido em fluxo e gravado em lotes com bulk_create, cada lote em
+sua própria transação. Usuários já existentes (mesmo email) são reaproveitados
+e linhas cujo id_transacao_pagamento já existe são ignoradas. Se o comando for
+interrompido, basta executá-lo de novo: ele continua a partir do último lote
+confirmado (use --reiniciar para ler o arquivo desde o começo).
+"""
+import csv
+import json
+import time
+from collections import defaultdict
+from datetime import timedelta
+from pathlib import Path
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from crm import resumo
+from crm.forms import BarbeariaForm, UsuarioForm
+from crm.models import Assinatura, Barbearia, ImportacaoAssinaturas, Plano, Usuario
+
+CAMPOS_ASSINATURA = ('status_pagamento', 'id_transacao_pagamento')
+
+
+def ler_linhas(caminho, formato):
+    """Gera um dicionário por linha do arquivo, sem carregá-lo inteiro."""
+    with open(caminho, encoding='utf-8-sig', newline='') as arquivo:
+        if formato == 'csv':
+            yield from csv.DictReader(arquivo)
+        else:
+            for texto in arquivo:
+                if texto.strip():
+                    yield json.loads(texto)
+
+
+def limpar_campos(form_class, dados):
+    """
+    Aplica as regras de cada campo do formulário, sem as validações de
+    unicidade do ModelForm (que fariam uma consulta por linha).
+    Retorna (dados_limpos, erros).
+    """
+    limpos, erros = {}, {}
+    for nome, campo in form_class.base_fields.items():
+        try:
+            limpos[nome] = campo.clean(dados.get(nome))
+        except ValidationError as erro:
+            erros[nome] = erro.messages
+    return limpos, erros
+
+
+def limpar_assinatura(dados, planos):
+    limpos, erros = {}, {}
+    for nome in CAMPOS_ASSINATURA:
+        campo = Assinatura._meta.get_field(nome)
+        valor = dados.get(nome) or None
+        if valor is None and nome == 'status_pagamento':
+            valor = campo.default
+        try:
+            limpos[nome] = campo.clean(valor, None)
+        except ValidationError as erro:
+            erros[nome] = erro.messages
+
+    plano = planos.get((dados.get('plano') or '').strip())
+    if plano is None:
+        erros['plano'] = [f"Plano '{dados.get('plano')}' não encontrado."]
+    else:
+        limpos['plano_id'], duracao_dias = plano
+        # Assinaturas já pagas ganham um período completo a partir da importação.
+        if limpos.get('status_pagamento') == 'pago':
+            limpos['data_expiracao'] = timezone.now() + timedelta(days=duracao_dias)
+    return limpos, erros
+
+
+class Command(BaseCommand):
+    help = 'Importa usuários, barbearias e assinaturas em lotes a partir de um arquivo CSV ou JSONL.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help='Caminho do arquivo .csv ou .jsonl')
+        parser.add_argument(
+            '--formato', choices=['csv', 'jsonl'],
+            help='Formato do arquivo (padrão: deduzido pela extensão).'
+        )
+        parser.add_argument(
+            '--lote', type=int, default=1000,
+            help='Quantidade de linhas gravadas por transação (padrão: 1000).'
+        )
+        parser.add_argument(
+            '--reiniciar', action='store_true',
+            help='Ignora o ponto de retomada e lê o arquivo desde o começo.'
+        )
+
+    def handle(self, *args, **options):
+        caminho = Path(options['arquivo']).resolve()
+        if not caminho.exists():
+            raise CommandError(f'Arquivo não encontrado: {caminho}')
+        formato = options['formato'] or ('jsonl' if caminho.suffix in ('.jsonl', '.json') else 'csv')
+        tamanho_lote = options['lote']
+        if tamanho_lote < 1:
+            raise CommandError('--lote deve ser maior que zero.')
+
+        # Os planos são poucos: resolvemos nome -> (id, duração) uma única vez.
+        planos = {
+            nome: (plano_id, duracao_dias)
+            for nome, plano_id, duracao_dias in Plano.objects.values_list('nome_plano', 'id', 'duracao_dias')
+        }
+
+        retomada, _ = ImportacaoAssinaturas.objects.get_or_create(arquivo=str(caminho))
+        pular = 0 if options['reiniciar'] else retomada.linhas_confirmadas
+        if pular:
+            self.stdout.write(f'Retomando a partir da linha {pular + 1}.')
+
+        self.totais = defaultdict(int)
+        inicio = time.monotonic()
+        lote = []
+        numero = 0
+        for numero, dados in enumerate(ler_linhas(caminho, formato), start=1):
+            if numero <= pular:
+                continue
+            linha = self._validar(numero, dados, planos)
+            if linha is not None:
+                lote.append(linha)
+            if numero % tamanho_lote == 0:
+                self._gravar_lote(lote, retomada, numero, inicio)
+                lote = []
+        if numero > pular and numero % tamanho_lote:
+            self._gravar_lote(lote, retomada, numero, inicio)
+
+        decorrido = time.monotonic() - inicio
+        processadas = max(numero - pular, 0)
+        self.stdout.write(self.style.SUCCESS(
+            f"{processadas} linhas em {decorrido:.1f}s "
+            f"({processadas / decorrido if decorrido else 0:.0f} linhas/s): "
+            f"{self.totais['assinaturas']} assinaturas, {self.totais['usuarios']} usuários novos, "
+            f"{self.totais['duplicadas']} duplicadas, {self.totais['invalidas']} inválidas."
+        ))
+
+    def _validar(self, numero, dados, planos):
+        usuario, erros_usuario = limpar_campos(UsuarioForm, dados)
+        barbearia, erros_barbearia = limpar_campos(BarbeariaForm, dados)
+        assinatura, erros_assinatura = limpar_assinatura(dados, planos)
+        erros = {**erros_usuario, **erros_barbearia, **erros_assinatura}
+        if erros:
+            self.totais['invalidas'] += 1
+            detalhes = '; '.join(f'{campo}: {" ".join(msgs)}' for campo, msgs in erros.items())
+            self.stderr.write(f'Linha {numero} ignorada: {detalhes}')
+            return None
+        usuario['email'] = usuario['email'].lower()
+        return usuario, barbearia, assinatura
+
+    def _gravar_lote(self, lote, retomada, ultima_linha, inicio):
+        with transaction.atomic():
+            lote = self._remover_transacoes_existentes(lote)
+            usuarios = self._usuarios_por_email(lote)
+
+            # A coluna de busca é preenchida pelo bulk_create do manager.
+            barbearias = [Barbearia(**barbearia) for _, barbearia, _ in lote]
+            if connection.features.can_return_rows_from_bulk_insert:
+                Barbearia.objects.bulk_create(barbearias)
+            else:
+                maior_id = Barbearia.objects.order_by('-id').values_list('id', flat=True).first() or 0
+                Barbearia.objects.bulk_create(barbearias)
+                self._recuperar_ids(barbearias, maior_id)
+
+            Assinatura.objects.bulk_create([
+                Assinatura(
+                    usuario_id=usuarios[usuario['email']],
+                    barbearia=barbearia,
+                    **assinatura,
+                )
+                for (usuario, _, assinatura), barbearia in zip(lote, barbearias)
+            ])
+            # bulk_create não passa por save(): contamos no resumo do painel aqui.
+            resumo.registrar_criadas(
+                (assinatura['plano_id'], barbearia.estado, assinatura['status_pagamento'])
+                for (_, _, assinatura), barbearia in zip(lote, barbearias)
+            )
+
+            # O ponto de retomada avança na mesma transação do lote.
+            retomada.linhas_confirmadas = ultima_linha
+            retomada.save(update_fields=['linhas_confirmadas', 'atualizado_em'])
+
+        self.totais['assinaturas'] += len(lote)
+        decorrido = time.monotonic() - inicio
+        self.stdout.write(
+            f'Linha {ultima_linha}: {self.totais["assinaturas"]} assinaturas gravadas '
+            f'({self.totais["assinaturas"] / decorrido if decorrido else 0:.0f} linhas/s)'
+        )
+
+    def _remover_transacoes_existentes(self, lote):
+        """Descarta linhas cujo id de transação já está no banco ou repete no lote."""
+        transacoes = {a['id_transacao_pagamento'] for _, _, a in lote if a['id_transacao_pagamento']}
+        vistas = set(
+            Assinatura.objects
+            .filter(id_transacao_pagamento__in=transacoes)
+            .values_list('id_transacao_pagamento', flat=True)
+        )
+        restantes = []
+        for linha in lote:
+            transacao = linha[2]['id_transacao_pagamento']
+            if transacao in vistas:
+                self.totais['duplicadas'] += 1
+                continue
+            if transacao:
+                vistas.add(transacao)
+            restantes.append(linha)
+        return restantes
+
+    def _usuarios_por_email(self, lote):
+        """Retorna {email: id}, criando de uma vez os usuários que ainda não existem."""
+        emails = {usuario['email'] for usuario, _, _ in lote}
+        usuarios = dict(Usuario.objects.filter(email__in=emails).values_list('email', 'id'))
+
+        novos = {}
+        for usuario, _, _ in lote:
+            if usuario['email'] not in usuarios and usuario['email'] not in novos:
+                novos[usuario['email']] = Usuario(**usuario)
+        if novos:
+            Usuario.objects.bulk_create(novos.values())
+            self.totais['usuarios'] += len(novos)
+            if connection.features.can_return_rows_from_bulk_insert:
+                usuarios.update((email, obj.pk) for email, obj in novos.items())
+            else:
+                usuarios.update(
+                    Usuario.objects.filter(email__in=novos).values_list('email', 'id')
+                )
+        return usuarios
+
+    def _recuperar_ids(self, barbearias, maior_id):
+        """
+        O MySQL não devolve os ids gerados pelo bulk_create. Como Barbearia não
+        tem chave natural, buscamos as linhas inseridas depois de 'maior_id' e
+        as associamos pelo conteúdo, na ordem de inserção.
+        """
+        campos = ('nome_barbearia', 'endereco', 'cidade', 'estado', 'cep')
+        ids = defaultdict(list)
+        for pk, *valores in (
+            Barbearia.objects.filter(id__gt=maior_id).order_by('id').values_list('id', *campos)
+        ):
+            ids[tuple(valores)].append(pk)
+        for barbearia in barbearias:
+            barbearia.pk = ids[tuple(getattr(barbearia, campo) for campo in campos)].pop(0)
@@ -0,0 +1,84 @@
+"""
+Monta o índice de CEPs (crm/ceps.py) a partir de arquivos CSV.
+
+Uso:
+    python manage.py importar_ceps logradouros.csv localidades.csv
+
+Cada linha é um CEP de logradouro (coluna 'cep') ou uma faixa de CEPs
+('cep_inicial' e 'cep_final', como o CEP geral de uma cidade), com as
+colunas logradouro, bairro, cidade e uf (logradouro e bairro podem ficar
+vazios). Bases públicas como a dos Correios (e-DNE) ou a do IBGE podem ser
+convertidas para esse formato.
+
+O índice anterior é substituído de uma vez, ao final; os processos em
+execução passam a usar o novo ao reiniciar.
+"""
+import csv
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from crm import ceps
+from crm.forms import ESTADOS
+
+UFS = {uf for uf, _ in ESTADOS}
+
+
+class Command(BaseCommand):
+    help = 'Monta o índice local de CEPs usado para preencher o endereço no checkout.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivos', nargs='+', help='Arquivos .csv com CEPs ou faixas de CEP')
+        parser.add_argument('--delimitador', default=',', help="Separador das colunas (padrão: ',').")
+        parser.add_argument(
+            '--saida', default=None,
+            help='Onde gravar o índice (padrão: CRM_CEP_INDICE).'
+        )
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+        destino = options['saida'] or settings.CRM_CEP_INDICE
+        lidos, faixas, invalidas = [], [], 0
+        for caminho in options['arquivos']:
+            if not os.path.exists(caminho):
+                raise CommandError(f'Arquivo não encontrado: {caminho}')
+            with open(caminho, encoding='utf-8-sig', newline='') as arquivo:
+                for numero_linha, linha in enumerate(csv.DictReader(arquivo, delimiter=options['delimitador']), 2):
+                    registro = self._ler(linha)
+                    if registro is None:
+                        invalidas += 1
+                        self.stderr.write(f'{caminho}, linha {numero_linha} ignorada.')
+                    elif len(registro) == 6:
+                        faixas.append(registro)
+                    else:
+                        lidos.append(registro)
+
+        try:
+            total_ceps, total_faixas = ceps.gravar_indice(destino, lidos, faixas)
+        except ValueError as erro:
+            raise CommandError(str(erro))
+        if os.path.abspath(destino) == os.path.abspath(settings.CRM_CEP_INDICE):
+            ceps.recarregar()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{total_ceps} CEPs e {total_faixas} faixas em {destino} '
+            f'({os.path.getsize(destino) / 1024 / 1024:.1f} MB), {invalidas} linha(s) inválida(s), '
+            f'em {time.monotonic() - inicio:.1f}s.'
+        ))
+
+    def _ler(self, linha):
+        """(cep, ...) ou (cep inicial, cep final, ...) da linha; None se inválida."""
+        uf = (linha.get('uf') or '').strip().upper()
+        cidade = (linha.get('cidade') or '').strip()
+        if uf not in UFS or not cidade:
+            return None
+        textos = (linha.get('logradouro'), linha.get('bairro'), cidade, uf)
+        if linha.get('cep'):
+            cep = ceps.numero(linha['cep'])
+            return None if cep is None else (cep, *textos)
+        inicial, final = ceps.numero(linha.get('cep_inicial')), ceps.numero(linha.get('cep_final'))
+        if inicial is None or final is None or inicial > final:
+            return None
+        return (inicial, final, *textos)
@@ -0,0 +1,37 @@
+"""
+Recalcula do zero o resumo de assinaturas do painel e mostra as divergências.
+
+O resumo (crm/resumo.py) é mantido a cada mudança de status; este comando
+confere se ele continua batendo com crm_assinatura e corrige o que não bate.
+Pensado para rodar periodicamente, fora do horário de pico:
+
+    0 4 * * * cd /caminho/do/projeto && python manage.py reconciliar_resumo
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.resumo import reconciliar
+
+
+class Command(BaseCommand):
+    help = 'Confere o resumo de assinaturas do painel contra a tabela de assinaturas e corrige as divergências.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--somente-verificar', action='store_true',
+            help='Só mostra as divergências, sem corrigir; termina com erro se houver alguma.'
+        )
+
+    def handle(self, *args, **options):
+        corrigir = not options['somente_verificar']
+        divergencias = reconciliar(corrigir=corrigir)
+        for (plano_id, estado, status), registrada, real in divergencias:
+            self.stdout.write(
+                f'plano={plano_id} estado={estado} status={status}: '
+                f'resumo {registrada}, real {real} ({real - registrada:+d})'
+            )
+        if not divergencias:
+            self.stdout.write(self.style.SUCCESS('Resumo em dia: nenhuma divergência.'))
+        elif corrigir:
+            self.stdout.write(self.style.WARNING(f'{len(divergencias)} divergência(s) corrigida(s).'))
+        else:
+            raise CommandError(f'{len(divergencias)} divergência(s) no resumo.')
@@ -0,0 +1,35 @@
+"""
+Recalcula a coluna de busca (crm/busca.py) de usuários e barbearias.
+
+O save() já a mantém; rode depois de gravações que não passam por ele
+(update() em massa, SQL direto) ou de mudar a normalização:
+
+    python manage.py reindexar_busca
+
+Só as linhas cujo texto mudou são gravadas.
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm import busca
+from crm.models import Barbearia, Usuario
+
+
+class Command(BaseCommand):
+    help = 'Recalcula a coluna de busca de usuários e barbearias.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote', type=int, default=2000,
+            help='Linhas lidas e gravadas por vez (padrão: 2000).'
+        )
+
+    def handle(self, *args, **options):
+        if options['lote'] < 1:
+            raise CommandError('--lote deve ser maior que zero.')
+        inicio = time.monotonic()
+        for modelo in (Usuario, Barbearia):
+            alteradas = busca.reindexar(modelo, options['lote'])
+            self.stdout.write(f'{modelo._meta.verbose_name_plural}: {alteradas} linha(s) atualizada(s).')
+        self.stdout.write(self.style.SUCCESS(f'Concluído em {time.monotonic() - inicio:.2f}s.'))
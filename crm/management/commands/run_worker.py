@@ -0,0 +1,205 @@
+"""
+Executa as tarefas da fila do banco (crm/fila.py), como os envios de e-mail
+de crm/notificacoes.py.
+
+Roda até receber SIGTERM/SIGINT (Ctrl+C), terminando as tarefas em
+andamento. Cada processo roda --threads trabalhadores, cada um com a sua
+conexão com o banco e a sua conexão SMTP:
+
+    python manage.py run_worker --processos 2 --threads 4
+
+Com --uma-vez, esvazia a fila e termina (útil no cron ou em testes). Ao
+final, mostra quantas tarefas e itens foram tratados e a vazão.
+
+Se um processo filho morrer (falta de memória, kill -9), os outros são
+avisados para parar e o comando termina com erro, para que o supervisor
+(systemd, Docker) o reinicie inteiro.
+"""
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from crm.fila import Trabalhador
+
+logger = logging.getLogger('crm.fila')
+
+# A cada quantos segundos cada processo registra a vazão no log.
+INTERVALO_RELATORIO = 60
+# A cada quantos segundos o processo principal confere se algum filho morreu.
+INTERVALO_VERIFICACAO = 1
+# A cada quantos segundos quem espera confere se foi pedido para parar.
+INTERVALO_PARADA = 0.1
+
+
+class Parada:
+    """
+    O mesmo que um multiprocessing.Event (set, is_set, wait), mas só com um
+    byte compartilhado, sem trava. O set() do Event espera cada processo
+    parado no wait() confirmar que acordou: se um deles morreu ali dentro,
+    o set() não volta nunca, e os demais não seriam avisados para parar.
+    """
+
+    def __init__(self, contexto):
+        self._valor = contexto.RawValue('b', 0)
+
+    def set(self):
+        self._valor.value = 1
+
+    def is_set(self):
+        return bool(self._valor.value)
+
+    def wait(self, timeout=None):
+        fim = None if timeout is None else time.monotonic() + timeout
+        while not self.is_set():
+            restante = INTERVALO_PARADA if fim is None else fim - time.monotonic()
+            if restante <= 0:
+                return False
+            time.sleep(min(restante, INTERVALO_PARADA))
+        return True
+
+
+def executar_processo(indice, threads, espera, uma_vez, parar):
+    """
+    Roda 'threads' trabalhadores neste processo (o primeiro na thread atual)
+    e retorna (tarefas, itens). Uma thread à parte registra a vazão no log.
+    """
+    trabalhadores = [
+        Trabalhador(f'{socket.gethostname()}:{os.getpid()}:{indice}.{numero}') for numero in range(threads)
+    ]
+    linhas = [
+        threading.Thread(target=trabalhador.rodar, args=(parar, espera, uma_vez), name=trabalhador.nome)
+        for trabalhador in trabalhadores[1:]
+    ]
+    terminou = threading.Event()
+    relatorio = threading.Thread(target=_relatar, args=(indice, trabalhadores, terminou), daemon=True)
+    relatorio.start()
+    for linha in linhas:
+        linha.start()
+    trabalhadores[0].rodar(parar, espera, uma_vez)
+    for linha in linhas:
+        linha.join()
+    terminou.set()
+    return sum(t.tarefas for t in trabalhadores), sum(t.itens for t in trabalhadores)
+
+
+def _relatar(indice, trabalhadores, terminou):
+    anterior, instante = 0, time.monotonic()
+    while not terminou.wait(INTERVALO_RELATORIO):
+        itens, agora = sum(t.itens for t in trabalhadores), time.monotonic()
+        logger.info('Processo %s: %.1f itens/s (%s no total).', indice, (itens - anterior) / (agora - instante), itens)
+        anterior, instante = itens, agora
+
+
+def _processo_filho(indice, threads, espera, uma_vez, parar, resultados):
+    # Quem decide a hora de parar é o processo principal, pelo 'parar'.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda numero, quadro: parar.set())
+    resultados.put(executar_processo(indice, threads, espera, uma_vez, parar))
+
+
+class Command(BaseCommand):
+    help = 'Executa as tarefas da fila em segundo plano (e-mails de notificação etc.).'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processos', type=int, default=1,
+            help='Quantos processos (padrão: 1, no próprio processo do comando).'
+        )
+        parser.add_argument(
+            '--threads', type=int, default=getattr(settings, 'CRM_FILA_THREADS', 2),
+            help='Trabalhadores (threads) por processo (padrão: CRM_FILA_THREADS).'
+        )
+        parser.add_argument(
+            '--espera', type=float, default=1.0,
+            help='Segundos entre uma consulta e outra à fila vazia (padrão: 1).'
+        )
+        parser.add_argument(
+            '--uma-vez', action='store_true',
+            help='Esvazia a fila e termina, em vez de ficar esperando novas tarefas.'
+        )
+
+    def handle(self, *args, **options):
+        processos, threads = options['processos'], options['threads']
+        if processos < 1 or threads < 1:
+            raise CommandError('--processos e --threads devem ser maiores que zero.')
+        argumentos = (threads, options['espera'], options['uma_vez'])
+        inicio = time.monotonic()
+
+        if processos == 1:
+            parar = threading.Event()
+            with self._ao_sinal(parar):
+                tarefas, itens = executar_processo(0, *argumentos, parar)
+        else:
+            contexto = multiprocessing.get_context('fork')
+            parar, resultados = Parada(contexto), contexto.Queue()
+            # Os filhos não podem herdar as conexões abertas do pai.
+            connections.close_all()
+            filhos = [
+                contexto.Process(target=_processo_filho, args=(indice, *argumentos, parar, resultados))
+                for indice in range(processos)
+            ]
+            with self._ao_sinal(parar):
+                for filho in filhos:
+                    filho.start()
+                totais, mortos = self._coletar(filhos, parar, resultados)
+                for filho in filhos:
+                    filho.join()
+            tarefas, itens = sum(t for t, _ in totais), sum(i for _, i in totais)
+            if mortos:
+                raise CommandError(
+                    f'{len(mortos)} processo(s) terminaram com erro '
+                    f'(códigos {", ".join(str(filho.exitcode) for filho in mortos)}); '
+                    f'os demais trataram {tarefas} tarefa(s), {itens} item(ns).'
+                )
+
+        decorrido = time.monotonic() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f'{tarefas} tarefa(s), {itens} item(ns) em {decorrido:.1f}s '
+            f'({itens / decorrido if decorrido else 0:.1f} itens/s).'
+        ))
+
+    def _coletar(self, filhos, parar, resultados):
+        """
+        Espera o resultado de cada filho. Um filho que morre não manda
+        resultado: sem o timeout, o get() esperaria por ele para sempre.
+        Retorna (resultados recebidos, filhos mortos).
+        """
+        totais, mortos = [], []
+        while len(totais) + len(mortos) < len(filhos):
+            try:
+                totais.append(resultados.get(timeout=INTERVALO_VERIFICACAO))
+            except queue.Empty:
+                for filho in filhos:
+                    if filho.exitcode not in (None, 0) and filho not in mortos:
+                        logger.error('Processo %s terminou com o código %s.', filho.pid, filho.exitcode)
+                        mortos.append(filho)
+                        parar.set()
+        return totais, mortos
+
+    @contextmanager
+    def _ao_sinal(self, parar):
+        """SIGTERM e SIGINT pedem para terminar as tarefas em andamento e sair."""
+        if threading.current_thread() is not threading.main_thread():
+            yield
+            return
+
+        def tratar(numero, quadro):
+            self.stderr.write('Terminando as tarefas em andamento...')
+            parar.set()
+
+        anteriores = {numero: signal.signal(numero, tratar) for numero in (signal.SIGTERM, signal.SIGINT)}
+        try:
+            yield
+        finally:
+            for numero, tratador in anteriores.items():
+                signal.signal(numero, tratador)
@@ -0,0 +1,134 @@
+"""
+Métricas do processo, no formato texto do Prometheus.
+
+Cada métrica é um histograma por view: quantas observações caíram em cada
+faixa ("bucket"), a soma e o total. Eventos avulsos (ex.: rejeições do
+limite de tentativas, crm/limites.py) são contadores simples. O middleware de instrumentação
+(crm/middleware.py) registra as medições e a view crm.views.metricas
+publica tudo em /metricas/ para o Prometheus coletar.
+
+Os números ficam na memória do processo: com vários workers (gunicorn,
+uvicorn), cada um expõe os seus e o Prometheus soma as séries.
+"""
+import threading
+from bisect import bisect_left
+
+# Faixas padrão, em segundos (latência, tempo de banco e de template).
+FAIXAS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Faixas para o número de consultas SQL por requisição.
+FAIXAS_CONSULTAS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+class Histograma:
+    """Histograma com rótulos, seguro para uso por várias threads."""
+
+    def __init__(self, nome, descricao, faixas, rotulos=('view',)):
+        self.nome = nome
+        self.descricao = descricao
+        self.faixas = tuple(faixas)
+        self.rotulos = tuple(rotulos)
+        self._series = {}
+        self._trava = threading.Lock()
+
+    def observar(self, valor, *valores_rotulos):
+        # Índice da primeira faixa que comporta o valor; o último é o +Inf.
+        indice = bisect_left(self.faixas, valor)
+        with self._trava:
+            serie = self._series.get(valores_rotulos)
+            if serie is None:
+                serie = self._series[valores_rotulos] = [[0] * (len(self.faixas) + 1), 0.0]
+            serie[0][indice] += 1
+            serie[1] += valor
+
+    def series(self):
+        with self._trava:
+            return {rotulos: (list(contagens), soma) for rotulos, (contagens, soma) in self._series.items()}
+
+    def zerar(self):
+        with self._trava:
+            self._series.clear()
+
+    def texto(self):
+        linhas = [
+            f'# HELP {self.nome} {self.descricao}',
+            f'# TYPE {self.nome} histogram',
+        ]
+        for valores, (contagens, soma) in sorted(self.series().items()):
+            rotulos = ','.join(f'{chave}="{_escapar(valor)}"' for chave, valor in zip(self.rotulos, valores))
+            separador = ',' if rotulos else ''
+            acumulado = 0
+            for faixa, contagem in zip(self.faixas + ('+Inf',), contagens):
+                acumulado += contagem
+                linhas.append(f'{self.nome}_bucket{{{rotulos}{separador}le="{faixa}"}} {acumulado}')
+            linhas.append(f'{self.nome}_sum{{{rotulos}}} {soma}')
+            linhas.append(f'{self.nome}_count{{{rotulos}}} {acumulado}')
+        return '\n'.join(linhas)
+
+
+class Contador:
+    """Contador com rótulos, seguro para uso por várias threads."""
+
+    def __init__(self, nome, descricao, rotulos=()):
+        self.nome = nome
+        self.descricao = descricao
+        self.rotulos = tuple(rotulos)
+        self._series = {}
+        self._trava = threading.Lock()
+
+    def incrementar(self, *valores_rotulos, quantidade=1):
+        with self._trava:
+            self._series[valores_rotulos] = self._series.get(valores_rotulos, 0) + quantidade
+
+    def series(self):
+        with self._trava:
+            return dict(self._series)
+
+    def zerar(self):
+        with self._trava:
+            self._series.clear()
+
+    def texto(self):
+        linhas = [
+            f'# HELP {self.nome} {self.descricao}',
+            f'# TYPE {self.nome} counter',
+        ]
+        for valores, total in sorted(self.series().items()):
+            rotulos = ','.join(f'{chave}="{_escapar(valor)}"' for chave, valor in zip(self.rotulos, valores))
+            linhas.append(f'{self.nome}{{{rotulos}}} {total}')
+        return '\n'.join(linhas)
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+LATENCIA = Histograma(
+    'crm_requisicao_segundos', 'Tempo total da requisição, por view.', FAIXAS_SEGUNDOS
+)
+TEMPO_BANCO = Histograma(
+    'crm_banco_segundos', 'Tempo gasto em consultas SQL por requisição, por view.', FAIXAS_SEGUNDOS
+)
+TEMPO_TEMPLATE = Histograma(
+    'crm_template_segundos', 'Tempo de renderização de templates por requisição, por view.', FAIXAS_SEGUNDOS
+)
+CONSULTAS = Histograma(
+    'crm_consultas_sql', 'Número de consultas SQL por requisição, por view.', FAIXAS_CONSULTAS
+)
+
+REGISTRO = [LATENCIA, TEMPO_BANCO, TEMPO_TEMPLATE, CONSULTAS]
+
+
+def registrar(metrica):
+    """Inclui outra métrica (qualquer objeto com texto() e zerar()) em /metricas/."""
+    if metrica not in REGISTRO:
+        REGISTRO.append(metrica)
+    return metrica
+
+
+def texto_prometheus():
+    return '\n'.join(metrica.texto() for metrica in REGISTRO) + '\n'
+
+
+def zerar():
+    for metrica in REGISTRO:
+        metrica.zerar()
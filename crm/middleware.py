@@ -0,0 +1,152 @@
+"""
+Middleware de instrumentação: quanto cada requisição custa.
+
+Para cada requisição medida, registra por view (nome da URL):
+
+- o tempo total;
+- o número de consultas SQL e o tempo gasto no banco;
+- o tempo de renderização dos templates.
+
+Os valores vão para os histogramas de crm/metricas.py (publicados em
+/metricas/) e para o cabeçalho Server-Timing da resposta, que aparece na aba
+"Rede" do navegador.
+
+Configuração (setup/settings.py):
+
+- CRM_INSTRUMENTACAO: liga o middleware. Desligado, o Django o remove da
+  pilha na inicialização (MiddlewareNotUsed) e o custo é zero.
+- CRM_INSTRUMENTACAO_AMOSTRAGEM: fração das requisições medidas (0 a 1).
+  As não sorteadas só pagam um random() e a leitura de uma ContextVar por
+  consulta SQL.
+
+A medição da requisição atual fica em uma ContextVar, então funciona tanto
+nas views comuns quanto nas async (o contexto acompanha o sync_to_async).
+"""
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.base import Template
+
+from crm import metricas
+
+_medicao_atual = ContextVar('crm_medicao', default=None)
+
+
+class Medicao:
+    __slots__ = ('consultas', 'tempo_banco', 'tempo_template', 'profundidade')
+
+    def __init__(self):
+        self.consultas = 0
+        self.tempo_banco = 0.0
+        self.tempo_template = 0.0
+        # Templates incluídos dentro de outros não são somados duas vezes.
+        self.profundidade = 0
+
+
+def _medir_consulta(execute, sql, params, many, context):
+    medicao = _medicao_atual.get()
+    if medicao is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        medicao.tempo_banco += time.perf_counter() - inicio
+        medicao.consultas += 1
+
+
+def _instalar_na_conexao(connection, **kwargs):
+    if _medir_consulta not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_medir_consulta)
+
+
+_render_original = Template.render
+
+
+def _render_medido(self, context):
+    medicao = _medicao_atual.get()
+    if medicao is None:
+        return _render_original(self, context)
+    medicao.profundidade += 1
+    inicio = time.perf_counter()
+    try:
+        return _render_original(self, context)
+    finally:
+        medicao.profundidade -= 1
+        if medicao.profundidade == 0:
+            medicao.tempo_template += time.perf_counter() - inicio
+
+
+def _instalar_ganchos():
+    """Instala, uma vez por processo, a medição de SQL e de templates."""
+    connection_created.connect(_instalar_na_conexao, dispatch_uid='crm_instrumentacao')
+    for connection in connections.all(initialized_only=True):
+        _instalar_na_conexao(connection)
+    Template.render = _render_medido
+
+
+class InstrumentacaoMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'CRM_INSTRUMENTACAO', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.amostragem = getattr(settings, 'CRM_INSTRUMENTACAO_AMOSTRAGEM', 1.0)
+        _instalar_ganchos()
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self._sortear():
+            return self.get_response(request)
+        medicao = Medicao()
+        token = _medicao_atual.set(medicao)
+        inicio = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _medicao_atual.reset(token)
+        return self._concluir(request, response, medicao, time.perf_counter() - inicio)
+
+    async def __acall__(self, request):
+        if not self._sortear():
+            return await self.get_response(request)
+        medicao = Medicao()
+        token = _medicao_atual.set(medicao)
+        inicio = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _medicao_atual.reset(token)
+        return self._concluir(request, response, medicao, time.perf_counter() - inicio)
+
+    def _sortear(self):
+        return self.amostragem >= 1 or random.random() < self.amostragem
+
+    def _concluir(self, request, response, medicao, total):
+        resolver_match = getattr(request, 'resolver_match', None)
+        view = (resolver_match and resolver_match.view_name) or 'desconhecida'
+
+        metricas.LATENCIA.observar(total, view)
+        metricas.TEMPO_BANCO.observar(medicao.tempo_banco, view)
+        metricas.TEMPO_TEMPLATE.observar(medicao.tempo_template, view)
+        metricas.CONSULTAS.observar(medicao.consultas, view)
+
+        # Server-Timing usa milissegundos.
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={medicao.tempo_banco * 1000:.2f};desc="{medicao.consultas} consultas SQL"',
+            f'tpl;dur={medicao.tempo_template * 1000:.2f};desc="Templates"',
+            f'total;dur={total * 1000:.2f}',
+        ])
+        return response
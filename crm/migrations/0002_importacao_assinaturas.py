@@ -0,0 +1,27 @@
+# Generated by Django 4.1 on 2026-10-17 03:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportacaoAssinaturas',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('arquivo', models.CharField(max_length=255, unique=True, verbose_name='Arquivo Importado')),
+                ('linhas_confirmadas', models.PositiveBigIntegerField(default=0, verbose_name='Linhas Confirmadas')),
+                ('atualizado_em', models.DateTimeField(auto_now=True, verbose_name='Atualizado em')),
+            ],
+            options={
+                'verbose_name': 'Importação de Assinaturas',
+                'verbose_name_plural': 'Importações de Assinaturas',
+                'db_table': 'crm_importacao_assinaturas',
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.1 on 2026-10-17 03:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0002_importacao_assinaturas'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='assinatura',
+            index=models.Index(fields=['status_pagamento', 'data_expiracao'], name='crm_assin_status_exp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='assinatura',
+            index=models.Index(fields=['barbearia', 'status_pagamento'], name='crm_assin_barb_status_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1 on 2026-10-17 03:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0003_indices_assinatura'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plano',
+            name='duracao_dias',
+            field=models.PositiveIntegerField(default=30, help_text='Quantos dias de acesso cada pagamento libera.', verbose_name='Duração (dias)'),
+        ),
+    ]
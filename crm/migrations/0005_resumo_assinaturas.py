@@ -0,0 +1,50 @@
+# Generated by Django 4.1 on 2026-10-17 04:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def preencher_resumo(apps, schema_editor):
+    # Contagens iniciais com um único GROUP BY; daqui em diante o resumo é
+    # mantido a cada mudança (crm/resumo.py).
+    Assinatura = apps.get_model('crm', 'Assinatura')
+    ResumoAssinaturas = apps.get_model('crm', 'ResumoAssinaturas')
+    grupos = (
+        Assinatura.objects.order_by()
+        .values_list('plano_id', 'barbearia__estado', 'status_pagamento')
+        .annotate(quantidade=models.Count('pk'))
+    )
+    ResumoAssinaturas.objects.bulk_create([
+        ResumoAssinaturas(plano_id=plano_id, estado=estado, status_pagamento=status, quantidade=quantidade)
+        for plano_id, estado, status, quantidade in grupos
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0004_plano_duracao_dias'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumoAssinaturas',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(max_length=2, verbose_name='Estado (UF)')),
+                ('status_pagamento', models.CharField(choices=[('pendente', 'Pagamento Pendente'), ('pago', 'Pago'), ('cancelado', 'Cancelado'), ('expirado', 'Expirado')], max_length=20, verbose_name='Status do Pagamento')),
+                ('quantidade', models.BigIntegerField(default=0, verbose_name='Quantidade')),
+                ('plano', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='crm.plano', verbose_name='Plano')),
+            ],
+            options={
+                'verbose_name': 'Resumo de Assinaturas',
+                'verbose_name_plural': 'Resumos de Assinaturas',
+                'db_table': 'crm_resumo_assinaturas',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='resumoassinaturas',
+            constraint=models.UniqueConstraint(fields=('plano', 'estado', 'status_pagamento'), name='crm_resumo_chave_unica'),
+        ),
+        migrations.RunPython(preencher_resumo, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.1 on 2026-10-17 09:30
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0005_resumo_assinaturas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tarefa',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(max_length=50, verbose_name='Tipo')),
+                ('dados', models.JSONField(blank=True, default=dict, verbose_name='Dados')),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('executando', 'Executando'), ('concluida', 'Concluída'), ('falhou', 'Falhou')], default='pendente', max_length=20, verbose_name='Status')),
+                ('tentativas', models.PositiveSmallIntegerField(default=0, verbose_name='Tentativas')),
+                ('max_tentativas', models.PositiveSmallIntegerField(default=5, verbose_name='Máximo de Tentativas')),
+                ('executar_em', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Executar em')),
+                ('processados', models.PositiveIntegerField(default=0, verbose_name='Itens Processados')),
+                ('trabalhador', models.CharField(blank=True, max_length=100, verbose_name='Trabalhador')),
+                ('iniciada_em', models.DateTimeField(blank=True, null=True, verbose_name='Iniciada em')),
+                ('concluida_em', models.DateTimeField(blank=True, null=True, verbose_name='Concluída em')),
+                ('ultimo_erro', models.TextField(blank=True, verbose_name='Último Erro')),
+                ('criada_em', models.DateTimeField(auto_now_add=True, verbose_name='Criada em')),
+            ],
+            options={
+                'verbose_name': 'Tarefa',
+                'verbose_name_plural': 'Tarefas',
+                'db_table': 'crm_tarefa',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='tarefa',
+            index=models.Index(fields=['status', 'executar_em'], name='crm_tarefa_status_exec_idx'),
+        ),
+    ]
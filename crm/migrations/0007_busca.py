@@ -0,0 +1,42 @@
+# Generated by Django 4.1 on 2026-10-17 05:10
+
+from django.db import migrations
+
+import crm.busca
+
+
+def preencher_busca(apps, schema_editor):
+    # Antes de criar os índices: no MySQL, montar o FULLTEXT de uma vez sobre
+    # a tabela pronta é bem mais rápido que atualizá-lo linha a linha.
+    for nome in ('Usuario', 'Barbearia'):
+        crm.busca.reindexar(apps.get_model('crm', nome))
+
+
+def criar_indices(apps, schema_editor):
+    crm.busca.criar_indices(schema_editor)
+
+
+def remover_indices(apps, schema_editor):
+    crm.busca.remover_indices(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0006_tarefa'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='barbearia',
+            name='busca',
+            field=crm.busca.CampoBusca(default='', editable=False, verbose_name='Texto de busca'),
+        ),
+        migrations.AddField(
+            model_name='usuario',
+            name='busca',
+            field=crm.busca.CampoBusca(default='', editable=False, verbose_name='Texto de busca'),
+        ),
+        migrations.RunPython(preencher_busca, migrations.RunPython.noop),
+        migrations.RunPython(criar_indices, remover_indices),
+    ]
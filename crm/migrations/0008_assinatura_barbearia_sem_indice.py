@@ -0,0 +1,19 @@
+# Generated by Django 4.1 on 2026-10-17 05:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0007_busca'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='assinatura',
+            name='barbearia',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='assinaturas', to='crm.barbearia', verbose_name='Barbearia Associada'),
+        ),
+    ]
@@ -1,5 +1,13 @@
 # models.py
-from django.db import models
+from collections import Counter
+from datetime import timedelta
+
+from django.db import connections, models, transaction
+from django.db.models import Count, ExpressionWrapper, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from crm.busca import CampoBusca
 
 class Plano(models.Model):
     # O 'id' é gerado automaticamente pelo Django como Primary Key (id).
@@ -23,6 +31,11 @@ class Plano(models.Model):
         null=True,   # Permite valores nulos no banco de dados
         blank=True   # O campo pode ser deixado em branco em formulários Django
     )
+    duracao_dias = models.PositiveIntegerField(
+        default=30,         # Plano mensal por padrão
+        verbose_name="Duração (dias)",
+        help_text="Quantos dias de acesso cada pagamento libera."
+    )
 
     class Meta:
         db_table = 'crm_plano' # Nome da tabela no banco de dados
@@ -48,7 +61,75 @@ class Plano(models.Model):
 #         return self.nome_plano
 
 
-class Barbearia(models.Model):
+class BuscaQuerySet(models.QuerySet):
+    """
+    Gravações em massa de Usuario e Barbearia que mantêm a coluna 'busca',
+    como o save(): sem ela, as linhas gravadas não aparecem na busca do
+    admin nem no autocomplete.
+    """
+
+    def _pesquisaveis(self, campos):
+        from crm import busca
+
+        return set(busca.CAMPOS[self.model._meta.db_table][0]).intersection(campos)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        from crm import busca
+
+        return super().bulk_create([busca.preencher(objeto) for objeto in objs], *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        from crm import busca
+
+        if self._pesquisaveis(fields):
+            objs = [busca.preencher(objeto) for objeto in objs]
+            fields = {*fields, 'busca'}
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+    def update(self, **kwargs):
+        """
+        Um UPDATE que muda campos pesquisáveis (que podem vir como
+        expressões, só calculadas no banco) recalcula depois a coluna das
+        linhas que mudou, lendo-as de novo em lotes.
+        """
+        from crm import busca
+        from crm.lotes import ids_por_chave
+
+        if 'busca' in kwargs or not self._pesquisaveis(kwargs):
+            return super().update(**kwargs)
+        with transaction.atomic(using=self.db, savepoint=False):
+            # Os ids antes do UPDATE: ele pode mudar os campos do filtro.
+            lotes = list(ids_por_chave(self))
+            alteradas = super().update(**kwargs)
+            for ids in lotes:
+                busca.reindexar(self.model, ids=ids)
+        return alteradas
+
+
+class ComBusca(models.Model):
+    """
+    Coluna 'busca' com o texto normalizado dos campos pesquisáveis, coberta
+    por um índice de texto (veja crm/busca.py). É atualizada a cada save() e
+    nas gravações em massa pelo manager (BuscaQuerySet).
+    """
+    busca = CampoBusca(verbose_name="Texto de busca")
+
+    objects = BuscaQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        from crm import busca
+
+        busca.preencher(self)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and set(busca.CAMPOS[self._meta.db_table][0]).intersection(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'busca'}
+        super().save(*args, **kwargs)
+
+
+class Barbearia(ComBusca):
     """
     Representa os dados específicos da barbearia.
     """
@@ -92,7 +173,7 @@ class Barbearia(models.Model):
         return self.nome_barbearia
 
 
-class Usuario(models.Model):
+class Usuario(ComBusca):
     """
     Representa o usuário/cliente principal que contrata os serviços.
     """
@@ -132,6 +213,85 @@ class Usuario(models.Model):
         return self.nome_completo
 
 
+# Para cada novo status de pagamento: de quais status a assinatura pode sair.
+TRANSICOES = {
+    'pago': ['pendente'],
+    'cancelado': ['pendente', 'pago'],
+}
+
+MICROSSEGUNDOS_POR_DIA = 24 * 60 * 60 * 10 ** 6
+
+
+class AssinaturaQuerySet(models.QuerySet):
+    """
+    Mudanças de status em massa, cada uma em um único UPDATE.
+
+    Só as assinaturas em um status de origem permitido (TRANSICOES) mudam; as
+    demais do queryset são ignoradas. Os métodos retornam quantas mudaram.
+    Como não passam por save(), não disparam os sinais pre_save/post_save;
+    o resumo do painel (crm/resumo.py) é atualizado aqui mesmo.
+    """
+
+    def transicionar(self, status, origens=None, **campos):
+        """
+        Leva para 'status' as assinaturas do queryset que estão em um dos
+        status de 'origens' (padrão: TRANSICOES[status]), gravando também os
+        'campos' extras. Retorna quantas mudaram.
+        """
+        from crm import resumo
+
+        alvo = self.filter(status_pagamento__in=TRANSICOES[status] if origens is None else origens)
+        with transaction.atomic(savepoint=False):
+            # Quantas saem de cada (plano, estado, status), numa consulta
+            # agrupada, para mover as contagens do resumo sem ler as linhas.
+            # A contagem trava as linhas (FOR UPDATE, no banco principal) até
+            # o commit: nenhuma outra transação muda o status delas no meio, e
+            # o UPDATE abaixo altera exatamente as que foram contadas.
+            contagem = alvo.order_by().select_for_update()
+            if not connections[contagem.db].features.has_select_for_update:
+                # O SQLite não tem FOR UPDATE, e uma transação que lê antes de
+                # escrever falha com "database is locked" se outra gravar no
+                # meio. Uma escrita que não muda nada pega antes a trava do banco.
+                if not alvo.update(status_pagamento=F('status_pagamento')):
+                    return 0
+            grupos = list(
+                contagem
+                .values_list('plano_id', 'barbearia__estado', 'status_pagamento')
+                .annotate(quantidade=Count('pk'))
+            )
+            if not grupos:
+                return 0
+            alteradas = alvo.update(status_pagamento=status, **campos)
+            resumo.registrar_transicoes(grupos, status, alteradas)
+        return alteradas
+
+    def marcar_como_pago(self, agora=None, **campos):
+        """
+        Equivalente em massa de Assinatura.marcar_como_pago: status 'pago' e a
+        data de expiração conforme a duração do plano de cada assinatura.
+        A duração é lida de crm_plano por uma subconsulta no próprio UPDATE,
+        nunca do catálogo em cache: um plano que ainda não está no cache do
+        processo deixaria a assinatura paga sem (ou com a antiga) expiração.
+        'campos' são gravados no mesmo UPDATE (ex.: id_transacao_pagamento).
+        """
+        agora = agora or timezone.now()
+        # Mesma regra de calcular_expiracao: conta a partir do vencimento
+        # atual, se ele ainda estiver no futuro.
+        inicio = Greatest(Coalesce(F('data_expiracao'), Value(agora)), Value(agora))
+        dias = Subquery(Plano.objects.filter(pk=OuterRef('plano_id')).values('duracao_dias')[:1])
+        # No MySQL e no SQLite, uma duração é um inteiro em microssegundos.
+        duracao = ExpressionWrapper(dias * Value(MICROSSEGUNDOS_POR_DIA), output_field=models.DurationField())
+        expiracao = ExpressionWrapper(inicio + duracao, output_field=models.DateTimeField())
+        return self.transicionar('pago', data_expiracao=expiracao, **campos)
+
+    def marcar_como_cancelado(self):
+        return self.transicionar('cancelado')
+
+    def marcar_como_expirado(self):
+        """Usado pela expiração periódica (crm/expiracao.py): só as pagas expiram."""
+        return self.transicionar('expirado', origens=['pago'])
+
+
 class Assinatura(models.Model):
     """
     Representa a relação entre um Usuário, um Plano e uma Barbearia,
@@ -176,7 +336,10 @@ class Assinatura(models.Model):
         Barbearia,
         on_delete=models.CASCADE, # Se a barbearia for deletada, as assinaturas dela também
         related_name='assinaturas',
-        verbose_name="Barbearia Associada"
+        verbose_name="Barbearia Associada",
+        # Sem índice próprio: o índice composto (barbearia, status) do Meta já
+        # começa pela barbearia e atende as buscas só por ela.
+        db_index=False,
     )
 
     status_pagamento = models.CharField(
@@ -212,6 +375,8 @@ class Assinatura(models.Model):
         verbose_name="ID da Transação de Pagamento"
     )
 
+    objects = AssinaturaQuerySet.as_manager()
+
     class Meta:
         db_table = 'crm_assinatura'
         verbose_name = "Assinatura"
@@ -220,21 +385,250 @@ class Assinatura(models.Model):
         # em um determinado momento para a mesma barbearia.
         # Pode ser ajustado dependendo da lógica de negócio (ex: permitir várias assinaturas)
         # unique_together = ('usuario', 'plano', 'barbearia',) 
+        # Índices para as consultas operacionais mais comuns:
+        # - assinaturas por status e vencimento (ex.: pagas que já expiraram);
+        # - assinaturas de uma barbearia por status.
+        # O índice composto de barbearia também atende buscas só por barbearia
+        # (por isso a chave estrangeira não tem índice próprio).
+        indexes = [
+            models.Index(fields=['status_pagamento', 'data_expiracao'], name='crm_assin_status_exp_idx'),
+            models.Index(fields=['barbearia', 'status_pagamento'], name='crm_assin_barb_status_idx'),
+        ]
 
     def __str__(self):
         return f"Assinatura de {self.usuario.nome_completo} para {self.plano.nome_plano} ({self.status_pagamento})"
 
+    # Campos que definem em qual linha do resumo do painel a assinatura conta.
+    CAMPOS_RESUMO = {'plano', 'plano_id', 'barbearia', 'barbearia_id', 'status_pagamento'}
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        assinatura = super().from_db(db, field_names, values)
+        # Posição no resumo quando foi lida; None se algum campo veio adiado.
+        chave = assinatura._chave_resumo()
+        assinatura._resumo_lido = None if None in chave else chave
+        return assinatura
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        chave = self._chave_resumo()
+        self._resumo_lido = None if None in chave else chave
+
+    def _chave_resumo(self):
+        dados = self.__dict__
+        return (dados.get('plano_id'), dados.get('barbearia_id'), dados.get('status_pagamento'))
+
+    def _estado_da_barbearia(self, barbearia_id):
+        if Assinatura.barbearia.is_cached(self) and self.barbearia.pk == barbearia_id:
+            return self.barbearia.estado
+        return Barbearia.objects.values_list('estado', flat=True).get(pk=barbearia_id)
+
+    def save(self, *args, **kwargs):
+        """
+        Além de gravar, move a assinatura no resumo do painel (crm/resumo.py)
+        quando muda o status, o plano ou a barbearia, na mesma transação.
+        """
+        from crm import resumo
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and not self.CAMPOS_RESUMO.intersection(update_fields):
+            return super().save(*args, **kwargs)
+
+        # Sem a posição lida (objeto montado à mão ou com campos adiados), só
+        # contamos as criações; o comando reconciliar_resumo corrige o resto.
+        anterior = None if self._state.adding else getattr(self, '_resumo_lido', None)
+        contar = self._state.adding or anterior is not None
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            atual = self._chave_resumo()
+            if contar and atual != anterior:
+                deltas = Counter()
+                for chave, delta in ((anterior, -1), (atual, 1)):
+                    if chave is not None:
+                        plano_id, barbearia_id, status = chave
+                        deltas[plano_id, self._estado_da_barbearia(barbearia_id), status] += delta
+                resumo.aplicar(deltas)
+        self._resumo_lido = atual
+
     # Exemplo de método para atualizar o status
     def marcar_como_pago(self, transacao_id=None):
         self.status_pagamento = 'pago'
         if transacao_id:
             self.id_transacao_pagamento = transacao_id
-        # Define a data de expiração com base no plano (ex: 30 dias se for mensal)
-        # Requer lógica adicional para calcular a expiração
-        # from datetime import timedelta
-        # self.data_expiracao = self.data_inicio + timedelta(days=30)
-        self.save()
+        self.data_expiracao = self.calcular_expiracao()
+        # Grava só as colunas alteradas, não a linha inteira.
+        self.save(update_fields=['status_pagamento', 'id_transacao_pagamento', 'data_expiracao'])
+
+    def calcular_expiracao(self, agora=None):
+        """
+        Data de expiração após um pagamento: a duração do plano contada a
+        partir de agora ou, se a assinatura ainda está vigente (renovação
+        antecipada), a partir do vencimento atual.
+        """
+        agora = agora or timezone.now()
+        inicio = max(self.data_expiracao or agora, agora)
+        return inicio + timedelta(days=self.plano.duracao_dias)
 
     def marcar_como_cancelado(self):
         self.status_pagamento = 'cancelado'
-        self.save()
\ No newline at end of file
+        self.save(update_fields=['status_pagamento'])
+
+
+class ImportacaoAssinaturas(models.Model):
+    """
+    Ponto de retomada do comando import_assinaturas.
+
+    Guarda quantas linhas de um arquivo já foram gravadas. É atualizado dentro
+    da mesma transação de cada lote, então sempre reflete o último lote
+    confirmado no banco.
+    """
+    arquivo = models.CharField(
+        max_length=255,
+        unique=True,
+        verbose_name="Arquivo Importado"
+    )
+    linhas_confirmadas = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name="Linhas Confirmadas"
+    )
+    atualizado_em = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Atualizado em"
+    )
+
+    class Meta:
+        db_table = 'crm_importacao_assinaturas'
+        verbose_name = "Importação de Assinaturas"
+        verbose_name_plural = "Importações de Assinaturas"
+
+    def __str__(self):
+        return f"{self.arquivo} ({self.linhas_confirmadas} linhas)"
+
+
+class ResumoAssinaturas(models.Model):
+    """
+    Quantas assinaturas há por plano, estado (UF) da barbearia e status de
+    pagamento, para o painel da equipe.
+
+    Mantido a cada mudança de status (Assinatura.save e os métodos de
+    AssinaturaQuerySet) e conferido periodicamente pelo comando
+    reconciliar_resumo, que recalcula tudo a partir de crm_assinatura.
+    Veja crm/resumo.py.
+    """
+    plano = models.ForeignKey(
+        Plano,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name="Plano"
+    )
+    estado = models.CharField(
+        max_length=2,
+        verbose_name="Estado (UF)"
+    )
+    status_pagamento = models.CharField(
+        max_length=20,
+        choices=Assinatura.STATUS_PAGAMENTO_CHOICES,
+        verbose_name="Status do Pagamento"
+    )
+    quantidade = models.BigIntegerField(
+        default=0,
+        verbose_name="Quantidade"
+    )
+
+    class Meta:
+        db_table = 'crm_resumo_assinaturas'
+        verbose_name = "Resumo de Assinaturas"
+        verbose_name_plural = "Resumos de Assinaturas"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['plano', 'estado', 'status_pagamento'], name='crm_resumo_chave_unica'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.plano_id}/{self.estado}/{self.status_pagamento}: {self.quantidade}"
+
+
+class Tarefa(models.Model):
+    """
+    Tarefa da fila de trabalho em segundo plano (crm/fila.py), executada
+    pelo comando run_worker fora do processo web.
+
+    'dados' tem o que o executor do 'tipo' precisa; tarefas que tratam uma
+    lista de itens (ex.: um lote de destinatários de uma campanha) guardam em
+    'processados' quantos já foram tratados, para uma nova tentativa continuar
+    de onde a anterior parou.
+    """
+    STATUS_CHOICES = [
+        ('pendente', 'Pendente'),
+        ('executando', 'Executando'),
+        ('concluida', 'Concluída'),
+        ('falhou', 'Falhou'),
+    ]
+
+    tipo = models.CharField(
+        max_length=50,
+        verbose_name="Tipo"
+    )
+    dados = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name="Dados"
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='pendente',
+        verbose_name="Status"
+    )
+    tentativas = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name="Tentativas"
+    )
+    max_tentativas = models.PositiveSmallIntegerField(
+        default=5,
+        verbose_name="Máximo de Tentativas"
+    )
+    executar_em = models.DateTimeField(
+        default=timezone.now,
+        verbose_name="Executar em"
+    )
+    processados = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Itens Processados"
+    )
+    trabalhador = models.CharField(
+        max_length=100,
+        blank=True,
+        verbose_name="Trabalhador"
+    )
+    iniciada_em = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Iniciada em"
+    )
+    concluida_em = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Concluída em"
+    )
+    ultimo_erro = models.TextField(
+        blank=True,
+        verbose_name="Último Erro"
+    )
+    criada_em = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="Criada em"
+    )
+
+    class Meta:
+        db_table = 'crm_tarefa'
+        verbose_name = "Tarefa"
+        verbose_name_plural = "Tarefas"
+        # A busca do trabalhador: pendentes com executar_em já vencido, em ordem.
+        indexes = [
+            models.Index(fields=['status', 'executar_em'], name='crm_tarefa_status_exec_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.tipo} #{self.pk} ({self.status})"
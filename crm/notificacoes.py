@@ -0,0 +1,131 @@
+"""
+E-mails para os usuários que aceitaram receber notificações
+(Usuario.receber_notificacoes): campanhas e lembretes de vencimento. A
+confirmação de pagamento, enfileirada pelo webhook (crm/pagamentos.py), vai
+para todos: é a resposta a uma compra, não uma notificação.
+
+Mandar milhares de e-mails dentro de uma requisição seguraria o worker web
+por minutos. Quem dispara (o comando enfileirar_notificacoes, ou uma view)
+só cria tarefas na fila (crm/fila.py), uma por lote de
+CRM_NOTIFICACOES_LOTE destinatários, lidos por chave primária
+(crm/lotes.py). O comando run_worker executa os lotes: cada thread manda os
+e-mails de um lote em sequência pela mesma conexão SMTP, aberta uma vez e
+reaproveitada entre um lote e outro.
+
+Cada e-mail enviado avança tarefa.processados. Se o SMTP falhar no meio de
+um lote, a nova tentativa continua do destinatário seguinte ao último
+enviado, sem repetir ninguém. Se o processo morrer, o progresso gravado a
+cada CRM_FILA_PROGRESSO e-mails limita quantos serão repetidos. A preferência do usuário é conferida de novo
+na hora do envio: quem desmarcou depois de a campanha ser enfileirada não
+recebe.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from crm import fila
+from crm.lotes import ids_por_chave
+from crm.models import Assinatura, Usuario
+
+
+def _tamanho_lote(tamanho_lote):
+    return tamanho_lote or getattr(settings, 'CRM_NOTIFICACOES_LOTE', 200)
+
+
+def destinatarios_campanha():
+    return Usuario.objects.filter(receber_notificacoes=True)
+
+
+def assinaturas_a_vencer(dias, agora=None):
+    """
+    Assinaturas pagas, de quem aceitou notificações, que vencem no dia que
+    começa daqui a 'dias' dias. Rodando uma vez por dia, cada assinatura
+    entra em um único lembrete.
+    """
+    inicio = (agora or timezone.now()) + timedelta(days=dias)
+    return Assinatura.objects.filter(
+        status_pagamento='pago',
+        data_expiracao__gte=inicio,
+        data_expiracao__lt=inicio + timedelta(days=1),
+        usuario__receber_notificacoes=True,
+    )
+
+
+def enfileirar_campanha(assunto, mensagem, tamanho_lote=None):
+    """Cria as tarefas de uma campanha e retorna quantas foram criadas."""
+    return fila.enfileirar_lotes(
+        'campanha',
+        ids_por_chave(destinatarios_campanha(), _tamanho_lote(tamanho_lote)),
+        {'assunto': assunto, 'mensagem': mensagem},
+    )
+
+
+def enfileirar_lembretes(dias=7, agora=None, tamanho_lote=None):
+    """Cria as tarefas de lembrete de vencimento e retorna quantas foram criadas."""
+    return fila.enfileirar_lotes(
+        'lembrete_expiracao',
+        ids_por_chave(assinaturas_a_vencer(dias, agora), _tamanho_lote(tamanho_lote)),
+    )
+
+
+def _enviar(tarefa, trabalhador, objetos, montar):
+    """Manda um e-mail por id ainda não processado da tarefa, na ordem."""
+    conexao = trabalhador.conexao_email()
+    for pk in tarefa.dados['ids'][tarefa.processados:]:
+        objeto = objetos.get(pk)
+        if objeto is not None:
+            assunto, corpo, email = montar(objeto)
+            conexao.send_messages([EmailMessage(assunto, corpo, to=[email], connection=conexao)])
+        trabalhador.contar(tarefa)
+
+
+def enviar_campanha(tarefa, trabalhador):
+    """Executor das tarefas 'campanha' (crm/fila.py)."""
+    pendentes = tarefa.dados['ids'][tarefa.processados:]
+    usuarios = destinatarios_campanha().in_bulk(pendentes)
+
+    def montar(usuario):
+        corpo = render_to_string('crm/emails/campanha.txt', {
+            'usuario': usuario, 'mensagem': tarefa.dados['mensagem'],
+        })
+        return tarefa.dados['assunto'], corpo, usuario.email
+
+    _enviar(tarefa, trabalhador, usuarios, montar)
+
+
+def enviar_lembretes(tarefa, trabalhador):
+    """Executor das tarefas 'lembrete_expiracao' (crm/fila.py)."""
+    pendentes = tarefa.dados['ids'][tarefa.processados:]
+    # Só as que continuam pagas: uma cancelada depois de enfileirada não recebe.
+    assinaturas = (
+        Assinatura.objects.filter(status_pagamento='pago', usuario__receber_notificacoes=True)
+        .select_related('usuario', 'plano', 'barbearia')
+        .in_bulk(pendentes)
+    )
+
+    def montar(assinatura):
+        corpo = render_to_string('crm/emails/lembrete_expiracao.txt', {'assinatura': assinatura})
+        return f'Sua assinatura {assinatura.plano.nome_plano} vence em breve', corpo, assinatura.usuario.email
+
+    _enviar(tarefa, trabalhador, assinaturas, montar)
+
+
+def enviar_confirmacoes_pagamento(tarefa, trabalhador):
+    """Executor das tarefas 'pagamento_confirmado' (crm/fila.py)."""
+    pendentes = tarefa.dados['ids'][tarefa.processados:]
+    # Só as que continuam pagas: um cancelamento que chegou antes do envio
+    # dispensa a confirmação.
+    assinaturas = (
+        Assinatura.objects.filter(status_pagamento='pago')
+        .select_related('usuario', 'plano', 'barbearia')
+        .in_bulk(pendentes)
+    )
+
+    def montar(assinatura):
+        corpo = render_to_string('crm/emails/pagamento_confirmado.txt', {'assinatura': assinatura})
+        return f'Pagamento confirmado: {assinatura.plano.nome_plano}', corpo, assinatura.usuario.email
+
+    _enviar(tarefa, trabalhador, assinaturas, montar)
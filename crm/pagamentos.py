@@ -0,0 +1,76 @@
+"""
+Confirmações de pagamento recebidas do gateway (webhook).
+
+O gateway reenvia o mesmo evento várias vezes e em rajadas, então cada
+evento é aplicado com um único UPDATE condicional (AssinaturaQuerySet.transicionar),
+sem carregar a assinatura antes:
+
+- o filtro por status (TRANSICOES) só deixa a transição acontecer uma vez;
+- a restrição unique de id_transacao_pagamento impede que a mesma transação
+  seja aplicada a outra assinatura;
+- no pagamento, a data de expiração é calculada no próprio UPDATE
+  (AssinaturaQuerySet.marcar_como_pago): uma assinatura nunca fica paga sem
+  data de expiração, mesmo se o processo cair logo depois.
+
+Para manter o resumo do painel em dia (crm/resumo.py), a mudança de status
+não é um UPDATE solitário: a contagem agrupada das linhas que mudam (que as
+trava) vem antes, e o ajuste do resumo depois, tudo na mesma transação. Um
+reenvio para antes do UPDATE, sem mudar nada.
+
+O trabalho que pode esperar (o e-mail de confirmação ao cliente) vai para a
+fila do banco (crm/fila.py), na mesma transação do pagamento: só é enviado
+se o pagamento foi gravado, e não se perde se o processo cair logo depois.
+O webhook responde sem esperar o envio.
+
+Sem PAGAMENTO_WEBHOOK_SEGREDO, nenhum evento é aceito, a não ser com DEBUG.
+"""
+import hashlib
+import hmac
+import logging
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from crm import fila
+from crm.models import TRANSICOES, Assinatura
+
+logger = logging.getLogger(__name__)
+
+PROCESSADO = 'processado'
+DUPLICADO = 'duplicado'
+IGNORADO = 'ignorado'
+
+
+def assinatura_valida(corpo, assinatura):
+    """
+    Confere a assinatura HMAC-SHA256 (hexadecimal) do corpo da requisição.
+    Sem PAGAMENTO_WEBHOOK_SEGREDO configurado, só aceita com DEBUG
+    (desenvolvimento); em produção, recusa tudo.
+    """
+    segredo = getattr(settings, 'PAGAMENTO_WEBHOOK_SEGREDO', '')
+    if not segredo:
+        if not settings.DEBUG:
+            logger.error('Webhook de pagamento recusado: PAGAMENTO_WEBHOOK_SEGREDO não configurado.')
+        return settings.DEBUG
+    esperado = hmac.new(segredo.encode(), corpo, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(esperado, assinatura or '')
+
+
+def aplicar_evento(assinatura_id, id_transacao, status):
+    """Aplica um evento do gateway e retorna PROCESSADO, DUPLICADO ou IGNORADO."""
+    consulta = Assinatura.objects.filter(pk=assinatura_id)
+    try:
+        with transaction.atomic():
+            if status == 'pago':
+                alteradas = consulta.marcar_como_pago(id_transacao_pagamento=id_transacao)
+                if alteradas:
+                    fila.enfileirar('pagamento_confirmado', {'ids': [assinatura_id]})
+            else:
+                alteradas = consulta.transicionar(status)
+    except IntegrityError:
+        # A transação já foi registrada em outra assinatura.
+        return DUPLICADO
+    if not alteradas:
+        # Reenvio de um evento já aplicado, ou assinatura inexistente.
+        return IGNORADO
+    return PROCESSADO
@@ -0,0 +1,61 @@
+"""
+Paginação para tabelas muito grandes no admin.
+
+O Paginator padrão do Django faz um SELECT COUNT(*) na tabela para saber
+quantas páginas existem. No InnoDB (MySQL) isso percorre um índice inteiro:
+com milhões de assinaturas, a contagem leva mais que o resto da página.
+
+Sem filtros, não precisamos do número exato: o próprio banco mantém uma
+estimativa do número de linhas de cada tabela (information_schema.TABLES no
+MySQL, pg_class no PostgreSQL), que é lida sem tocar na tabela.
+"""
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+
+CONSULTAS_ESTIMATIVA = {
+    'mysql': (
+        'SELECT TABLE_ROWS FROM information_schema.TABLES '
+        'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s'
+    ),
+    'postgresql': 'SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+}
+
+
+def estimar_linhas(model, using='default'):
+    """
+    Número aproximado de linhas da tabela do model, segundo as estatísticas
+    do banco, ou None se o banco não oferece estimativa (ex.: SQLite).
+    """
+    connection = connections[using]
+    sql = CONSULTAS_ESTIMATIVA.get(connection.vendor)
+    if sql is None:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [model._meta.db_table])
+        linha = cursor.fetchone()
+    # O PostgreSQL devolve -1 para tabelas que ainda não foram analisadas.
+    if not linha or linha[0] is None or linha[0] < 0:
+        return None
+    return int(linha[0])
+
+
+class ContagemEstimadaPaginator(Paginator):
+    """
+    Paginator que usa a estimativa do banco quando a listagem não tem filtros.
+
+    Abaixo de LIMITE_EXATO linhas a estimativa é imprecisa e contar é barato,
+    então usamos o COUNT(*) normal. Com filtros também: a contagem usa os
+    índices do filtro (ex.: status_pagamento) e o número precisa ser exato.
+    """
+    LIMITE_EXATO = 10_000
+
+    @cached_property
+    def count(self):
+        consulta = self.object_list
+        if isinstance(consulta, QuerySet) and not consulta.query.where:
+            estimativa = estimar_linhas(consulta.model, consulta.db)
+            if estimativa is not None and estimativa > self.LIMITE_EXATO:
+                return estimativa
+        return super().count
@@ -0,0 +1,225 @@
+"""
+Resumo das assinaturas para o painel da equipe.
+
+Contar as assinaturas por plano, estado e status com um GROUP BY em
+crm_assinatura a cada acesso ao painel ficaria cada vez mais lento. Em vez
+disso, a tabela crm_resumo_assinaturas guarda essas contagens prontas, uma
+linha por (plano, estado da barbearia, status de pagamento), e o painel lê
+só essas linhas: algumas dezenas, não importa quantas assinaturas existam.
+
+As contagens são ajustadas na mesma transação de cada mudança:
+
+- Assinatura.save (criação, marcar_como_pago, marcar_como_cancelado, edição
+  no admin) move a assinatura de uma linha para outra;
+- os métodos em massa de AssinaturaQuerySet (ações do admin, expiração,
+  webhook) travam as assinaturas e contam quantas saem de cada linha numa
+  consulta agrupada antes do UPDATE;
+- exclusões são descontadas pelos sinais em crm/signals.py, uma vez por
+  chamada de delete() (um queryset, ou uma barbearia com as assinaturas em
+  cascata), não uma vez por assinatura;
+- quem usa bulk_create (import_assinaturas) chama registrar_criadas().
+
+O que escapa disso (UPDATE direto no banco, mudança do estado de uma
+barbearia, corridas entre transações) é corrigido pelo comando
+reconciliar_resumo, que recalcula tudo do zero e mostra as divergências.
+"""
+import logging
+import threading
+from collections import Counter
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models import Case, Count, F, Q, Value, When
+
+from crm.catalogo import listar_planos
+from crm.models import Assinatura, Barbearia, ResumoAssinaturas
+from crm.roteamento import leitura_em_replica
+
+logger = logging.getLogger(__name__)
+
+# Base da receita mensal recorrente: planos de outra duração são convertidos
+# para 30 dias (ex.: um plano anual conta valor * 30 / 365 por mês).
+DIAS_POR_MES = 30
+
+
+def aplicar(deltas):
+    """
+    Soma a cada linha do resumo o seu delta.
+    'deltas' mapeia (plano_id, estado, status_pagamento) -> quantidade.
+    Usa no máximo três consultas, qualquer que seja o número de linhas.
+    """
+    deltas = {chave: delta for chave, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    filtro = Q()
+    for plano_id, estado, status in deltas:
+        filtro |= Q(plano_id=plano_id, estado=estado, status_pagamento=status)
+    linhas = ResumoAssinaturas.objects.filter(filtro)
+
+    existentes = set(linhas.values_list('plano_id', 'estado', 'status_pagamento'))
+    novas = [
+        ResumoAssinaturas(plano_id=plano_id, estado=estado, status_pagamento=status)
+        for plano_id, estado, status in deltas
+        if (plano_id, estado, status) not in existentes
+    ]
+    if novas:
+        # Outro processo pode ter criado a mesma linha nesse meio tempo.
+        ResumoAssinaturas.objects.bulk_create(novas, ignore_conflicts=True)
+
+    linhas.update(quantidade=F('quantidade') + Case(*[
+        When(plano_id=plano_id, estado=estado, status_pagamento=status, then=Value(delta))
+        for (plano_id, estado, status), delta in deltas.items()
+    ], default=Value(0), output_field=models.BigIntegerField()))
+
+
+def registrar_transicoes(grupos, status, alteradas):
+    """
+    Move para 'status' as contagens de uma mudança em massa.
+    'grupos' tem tuplas (plano_id, estado, status_de_origem, quantidade).
+    """
+    deltas = Counter()
+    for plano_id, estado, origem, quantidade in grupos:
+        deltas[plano_id, estado, origem] -= quantidade
+        deltas[plano_id, estado, status] += quantidade
+    contadas = sum(quantidade for *_, quantidade in grupos)
+    if contadas != alteradas:
+        # Não deveria acontecer (as linhas estão travadas), mas aplicar
+        # contagens que não batem com o UPDATE desacertaria o resumo: melhor
+        # deixá-lo para a próxima reconciliação.
+        logger.warning('Resumo de assinaturas não atualizado: %s contadas, %s alteradas.', contadas, alteradas)
+        return
+    aplicar(deltas)
+
+
+# Exclusões em andamento nesta thread, por origem (o objeto ou queryset em que
+# delete() foi chamado): a origem, quantas assinaturas ainda faltam apagar e,
+# para as já apagadas, quantas por (plano, barbearia, status).
+_exclusoes = threading.local()
+
+
+def _exclusao(origem):
+    lotes = _exclusoes.__dict__.setdefault('lotes', {})
+    lote = lotes.get(id(origem))
+    if lote is None or lote['origem'] is not origem:
+        lote = lotes[id(origem)] = {'origem': origem, 'faltam': 0, 'apagadas': Counter()}
+    return lotes, lote
+
+
+def preparar_exclusao(assinatura, origem):
+    """
+    pre_delete: conta mais uma assinatura a apagar nesta chamada de delete().
+    O Django envia o pre_delete de todas antes de apagar a primeira.
+    """
+    lotes, lote = _exclusao(origem)
+    if lote['apagadas']:
+        # Restos de um delete() da mesma origem que falhou no meio.
+        lote = lotes[id(origem)] = {'origem': origem, 'faltam': 0, 'apagadas': Counter()}
+    lote['faltam'] += 1
+
+
+def registrar_exclusao(assinatura, origem):
+    """
+    post_delete: desconta a assinatura. Só quando a última da chamada é
+    apagada o resumo é atualizado, de uma vez, ainda na mesma transação: uma
+    consulta para o estado das barbearias (que, numa cascata, ainda existem)
+    e as de aplicar().
+    """
+    lotes, lote = _exclusao(origem)
+    lote['apagadas'][assinatura.plano_id, assinatura.barbearia_id, assinatura.status_pagamento] += 1
+    lote['faltam'] -= 1
+    if lote['faltam'] > 0:
+        return
+    del lotes[id(origem)]
+    apagadas = lote['apagadas']
+    estados = dict(
+        Barbearia.objects.filter(pk__in={barbearia_id for _, barbearia_id, _ in apagadas})
+        .values_list('pk', 'estado')
+    )
+    deltas = Counter()
+    for (plano_id, barbearia_id, status), quantidade in apagadas.items():
+        deltas[plano_id, estados.get(barbearia_id), status] -= quantidade
+    aplicar(deltas)
+
+
+def registrar_criadas(chaves):
+    """
+    Conta assinaturas criadas sem save() (bulk_create).
+    'chaves' tem uma tupla (plano_id, estado, status_pagamento) por assinatura.
+    """
+    aplicar(Counter(chaves))
+
+
+def contagens_registradas():
+    return {
+        (plano_id, estado, status): quantidade
+        for plano_id, estado, status, quantidade in ResumoAssinaturas.objects.values_list(
+            'plano_id', 'estado', 'status_pagamento', 'quantidade'
+        )
+    }
+
+
+def contagens_reais():
+    """O GROUP BY completo em crm_assinatura; só a reconciliação usa."""
+    return {
+        (plano_id, estado, status): quantidade
+        for plano_id, estado, status, quantidade in Assinatura.objects.order_by()
+        .values_list('plano_id', 'barbearia__estado', 'status_pagamento')
+        .annotate(quantidade=Count('pk'))
+    }
+
+
+def reconciliar(corrigir=True):
+    """
+    Recalcula as contagens do zero e retorna as divergências, como tuplas
+    (chave, registrada, real). Com 'corrigir', ajusta o resumo.
+
+    A correção é aplicada como delta, não sobrescrevendo o valor: uma
+    mudança de status que aconteça depois da contagem continua somada.
+    """
+    with transaction.atomic():
+        reais = contagens_reais()
+        registradas = contagens_registradas()
+        divergencias = [
+            (chave, registradas.get(chave, 0), reais.get(chave, 0))
+            for chave in sorted(reais.keys() | registradas.keys())
+            if registradas.get(chave, 0) != reais.get(chave, 0)
+        ]
+        if corrigir:
+            aplicar({chave: real - registrada for chave, registrada, real in divergencias})
+    return divergencias
+
+
+def painel():
+    """
+    Dados do painel da equipe, a partir do resumo e do catálogo em cache:
+    assinaturas ativas (pagas) e receita mensal por plano, e contagens por
+    status em cada estado. O resumo pode ser lido de uma réplica.
+    """
+    planos = listar_planos()
+    status_pagamento = [status for status, _ in Assinatura.STATUS_PAGAMENTO_CHOICES]
+    ativas = Counter()
+    por_estado = {}
+    with leitura_em_replica():
+        registradas = contagens_registradas()
+    for (plano_id, estado, status), quantidade in registradas.items():
+        if status == 'pago':
+            ativas[plano_id] += quantidade
+        contagens = por_estado.setdefault(estado, dict.fromkeys(status_pagamento, 0))
+        contagens[status] = contagens.get(status, 0) + quantidade
+
+    por_plano = []
+    for plano in planos:
+        mensal = plano.valor * DIAS_POR_MES / plano.duracao_dias
+        receita = (mensal * ativas[plano.id]).quantize(Decimal('0.01'))
+        por_plano.append({'plano': plano, 'ativas': ativas[plano.id], 'receita_mensal': receita})
+
+    return {
+        'por_plano': por_plano,
+        'receita_mensal': sum((linha['receita_mensal'] for linha in por_plano), Decimal('0.00')),
+        'ativas': sum(ativas.values()),
+        'status_pagamento': Assinatura.STATUS_PAGAMENTO_CHOICES,
+        'por_estado': [
+            (estado, [contagens[status] for status in status_pagamento])
+            for estado, contagens in sorted(por_estado.items())
+        ],
+    }
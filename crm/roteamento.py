@@ -0,0 +1,134 @@
+"""
+Leituras em réplicas do banco.
+
+A exportação, o painel e as buscas do admin só leem dados, e não precisam disputar o banco principal com as gravações de
+pagamento. Com réplicas configuradas, essas leituras vão para uma delas:
+
+    DATABASES = {'default': {...}, 'replica1': {...}, 'replica2': {...}}
+    DATABASE_ROUTERS = ['crm.roteamento.RoteadorReplicas']
+    CRM_REPLICAS = ['replica1', 'replica2']
+
+O resto continua no principal. Só vai para a réplica o que for lido dentro de
+leitura_em_replica() (ou com .using(banco_de_leitura())), porque uma
+leitura logo depois de uma gravação poderia não encontrar o dado ainda
+replicado.
+
+Pelo mesmo motivo, o LeituraAposEscritaMiddleware fixa o banco principal:
+
+- durante toda requisição que não seja GET/HEAD/OPTIONS (ex.: um POST);
+- nas requisições seguintes do mesmo navegador, por CRM_REPLICA_FIXACAO_SEGUNDOS,
+  marcadas por um cookie. Assim quem acabou de gravar vê o que gravou.
+
+Sem CRM_REPLICAS, tudo vai para o 'default' e o middleware sai da pilha.
+"""
+import random
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS
+
+COOKIE_FIXACAO = 'crm_primario'
+METODOS_SEGUROS = ('GET', 'HEAD', 'OPTIONS')
+
+_em_replica = ContextVar('crm_leitura_em_replica', default=False)
+_primario_fixado = ContextVar('crm_primario_fixado', default=False)
+
+
+def replicas():
+    return getattr(settings, 'CRM_REPLICAS', [])
+
+
+def banco_de_leitura():
+    """Alias para uma leitura que aceita réplica: uma réplica qualquer ou, se
+    não houver nenhuma ou o principal estiver fixado, o 'default'."""
+    disponiveis = replicas()
+    if not disponiveis or _primario_fixado.get():
+        return DEFAULT_DB_ALIAS
+    return random.choice(disponiveis)
+
+
+@contextmanager
+def leitura_em_replica():
+    """As leituras do ORM dentro do bloco podem ir para uma réplica."""
+    token = _em_replica.set(True)
+    try:
+        yield
+    finally:
+        _em_replica.reset(token)
+
+
+@contextmanager
+def primario_fixado():
+    """Dentro do bloco, todas as leituras vão para o banco principal."""
+    token = _primario_fixado.set(True)
+    try:
+        yield
+    finally:
+        _primario_fixado.reset(token)
+
+
+class RoteadorReplicas:
+    """Roteador do Django (settings.DATABASE_ROUTERS)."""
+
+    def db_for_read(self, model, **hints):
+        if _em_replica.get():
+            return banco_de_leitura()
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # As réplicas têm os mesmos dados do principal.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # As réplicas recebem o esquema pela replicação, não pelo migrate.
+        return db not in replicas()
+
+
+class LeituraAposEscritaMiddleware:
+    """Fixa o banco principal depois de uma gravação (veja o início do módulo)."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not replicas():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with primario_fixado() if self._fixar(request) else nullcontext():
+            response = self.get_response(request)
+        return self._concluir(request, response)
+
+    async def __acall__(self, request):
+        with primario_fixado() if self._fixar(request) else nullcontext():
+            response = await self.get_response(request)
+        return self._concluir(request, response)
+
+    def _fixar(self, request):
+        if request.method not in METODOS_SEGUROS:
+            return True
+        try:
+            return float(request.COOKIES.get(COOKIE_FIXACAO, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def _concluir(self, request, response):
+        if request.method not in METODOS_SEGUROS:
+            segundos = getattr(settings, 'CRM_REPLICA_FIXACAO_SEGUNDOS', 5)
+            response.set_cookie(
+                COOKIE_FIXACAO, f'{time.time() + segundos:.3f}',
+                max_age=segundos, httponly=True, samesite='Lax',
+            )
+        return response
@@ -0,0 +1,29 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from crm import resumo
+from crm.catalogo import invalidar_catalogo
+from crm.models import Assinatura, Plano
+
+
+# Qualquer alteração em um plano gera uma nova versão do catálogo em cache.
+# A invalidação espera o commit: se ocorresse antes, outra requisição poderia
+# recarregar os dados antigos do banco e guardá-los sob a versão nova.
+@receiver(post_save, sender=Plano)
+@receiver(post_delete, sender=Plano)
+def plano_alterado(sender, **kwargs):
+    transaction.on_commit(invalidar_catalogo)
+
+
+# Assinatura apagada (inclusive em cascata, ao apagar o usuário ou a
+# barbearia) deixa de contar no resumo do painel. Os descontos de uma mesma
+# chamada de delete() ('origin') são somados e aplicados de uma vez.
+@receiver(pre_delete, sender=Assinatura)
+def assinatura_a_apagar(sender, instance, origin=None, **kwargs):
+    resumo.preparar_exclusao(instance, origin)
+
+
+@receiver(post_delete, sender=Assinatura)
+def assinatura_apagada(sender, instance, origin=None, **kwargs):
+    resumo.registrar_exclusao(instance, origin)
@@ -0,0 +1,48 @@
+"""
+{% imagem_responsiva %}: <picture> com srcset das variantes WebP de uma imagem
+estática (crm/imagens.py), para o navegador baixar só a largura de que
+precisa. Exemplo:
+
+    {% load imagens_responsivas %}
+    {% imagem_responsiva 'assets/banner2.png' sizes='100vw' class='d-block w-100 h-auto' alt='...' %}
+
+Por padrão a imagem é carregada só quando estiver para aparecer
+(loading="lazy") e decodificada fora da thread principal (decoding="async").
+Para a imagem principal da primeira dobra (ex.: o slide ativo do carrossel),
+use prioridade=True: carregamento imediato e fetchpriority="high".
+
+Largura e altura da original vão no <img>, para o navegador reservar o espaço
+antes de a imagem chegar. Sem variantes (ou sem Pillow), sai um <img> simples.
+"""
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+
+from crm import imagens
+
+register = template.Library()
+
+
+@register.simple_tag
+def imagem_responsiva(nome, sizes='100vw', alt='', prioridade=False, **atributos):
+    dados = imagens.variantes(nome)
+    if prioridade:
+        atributos['fetchpriority'] = 'high'
+    else:
+        atributos.update(loading='lazy', decoding='async')
+    if dados:
+        largura, altura, disponiveis = dados
+        atributos.update(width=largura, height=altura)
+    else:
+        disponiveis = []
+
+    img = format_html(
+        '<img src="{}" alt="{}"{}>',
+        static(nome), alt, format_html_join('', ' {}="{}"', sorted(atributos.items())),
+    )
+    if not disponiveis:
+        return img
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">{}</picture>',
+        ', '.join(f'{url} {largura}w' for largura, url in disponiveis), sizes, img,
+    )
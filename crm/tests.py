@@ -1,6 +1,44 @@
 # crm/tests.py
-from django.test import TestCase
-from crm.models import Plano
+import csv
+import hashlib
+import hmac
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.db.models import Value
+from django.db.models.functions import Concat
+from django.http import Http404, HttpResponse
+from django.middleware.csrf import get_token
+from django.template import Context, Template
+from django.template.loader import render_to_string
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import path, reverse
+from django.utils import timezone
+
+from crm import busca, ceps, estaticos, fila, imagens, limites, metricas, notificacoes, resumo, views, views_async
+from crm.cache_paginas import cache_pagina
+from crm.catalogo import estatisticas, listar_planos, versao_catalogo, zerar_estatisticas
+from crm.forms import BarbeariaForm, CheckoutForm
+from crm.management.commands import run_worker
+from crm.paginacao import ContagemEstimadaPaginator
+from crm.roteamento import COOKIE_FIXACAO, LeituraAposEscritaMiddleware, RoteadorReplicas, leitura_em_replica
+from crm.models import Assinatura, Barbearia, ImportacaoAssinaturas, Plano, ResumoAssinaturas, Tarefa, Usuario
 
 class PlanoModelTest(TestCase):
     def setUp(self):
@@ -29,6 +67,1467 @@ class PlanoModelTest(TestCase):
         self.assertEqual(plano_do_banco.valor, 10)
         self.assertEqual(plano_do_banco.descricao, 'Plano básico com recursos limitados.')
 
+class CatalogoCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        zerar_estatisticas()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.plano = Plano.objects.create(nome_plano='Plano Básico', valor=10)
+
+    def test_leituras_repetidas_nao_consultam_o_banco(self):
+        """
+        Depois da primeira carga, a home e o checkout são servidos sem SQL.
+        """
+        self.client.get(reverse('home'))
+        with self.assertNumQueries(0):
+            self.client.get(reverse('home'))
+            self.client.get(reverse('checkout', args=[self.plano.id]))
+        # A segunda visita à home sai do cache de páginas e nem lê o catálogo.
+        self.assertEqual(estatisticas(), {'acertos': 1, 'falhas': 1})
+
+    def test_alterar_plano_invalida_o_catalogo(self):
+        self.assertEqual(listar_planos(), [self.plano])
+        versao = versao_catalogo()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            premium = Plano.objects.create(nome_plano='Premium', valor=50)
+        self.assertNotEqual(versao_catalogo(), versao)
+        self.assertEqual(listar_planos(), [self.plano, premium])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            premium.delete()
+        self.assertEqual(listar_planos(), [self.plano])
+
+    def test_checkout_de_plano_inexistente_retorna_404(self):
+        response = self.client.get(reverse('checkout', args=[self.plano.id + 1]))
+        self.assertEqual(response.status_code, 404)
+
+class CachePaginasTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.plano = Plano.objects.create(nome_plano='Plano Básico', valor=10)
+
+    def test_pagina_em_cache_responde_304_para_etag_conhecida(self):
+        url = reverse('checkout', args=[self.plano.id])
+        primeira = self.client.get(url)
+        self.assertEqual(primeira.status_code, 200)
+        self.assertTrue(primeira.has_header('ETag'))
+        self.assertTrue(primeira.has_header('Last-Modified'))
+
+        revalidacao = self.client.get(url, HTTP_IF_NONE_MATCH=primeira['ETag'])
+        self.assertEqual(revalidacao.status_code, 304)
+
+    def test_query_string_nao_cria_outra_entrada(self):
+        url = reverse('home')
+        primeira = self.client.get(url)
+        with mock.patch.object(cache, 'set') as gravar:
+            for numero in range(3):
+                response = self.client.get(url, {'x': numero})
+                self.assertEqual(response['ETag'], primeira['ETag'])
+        gravar.assert_not_called()
+
+    def test_alterar_plano_purga_as_paginas(self):
+        url = reverse('home')
+        primeira = self.client.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.plano.nome_plano = 'Plano Renovado'
+            self.plano.save()
+
+        segunda = self.client.get(url, HTTP_IF_NONE_MATCH=primeira['ETag'])
+        self.assertEqual(segunda.status_code, 200)
+        self.assertContains(segunda, 'Plano Renovado')
+
+    def test_resposta_com_token_csrf_nao_e_guardada(self):
+        chamadas = []
+
+        @cache_pagina
+        def formulario(request):
+            chamadas.append(request)
+            return HttpResponse(get_token(request))
+
+        fabrica = RequestFactory()
+        primeira = formulario(fabrica.get('/formulario/'))
+        segunda = formulario(fabrica.get('/formulario/'))
+        self.assertEqual(len(chamadas), 2)
+        self.assertFalse(primeira.has_header('ETag'))
+        self.assertNotEqual(primeira.content, segunda.content)
+
+class FragmentosPlanosTest(TestCase):
+    """Cartões da home e opções do checkout em cache pela versão do catálogo."""
+
+    def setUp(self):
+        cache.clear()
+        self.planos = [Plano(id=1, nome_plano='Básico', valor=10), Plano(id=2, nome_plano='Premium', valor=50)]
+        self.request = RequestFactory().get('/')
+
+    def renderizar(self, template, contexto):
+        return render_to_string(template, contexto, self.request)
+
+    def test_cartoes_da_home_reaproveitados_ate_a_versao_mudar(self):
+        self.renderizar('crm/index.html', {'planos': self.planos, 'versao_catalogo': 1})
+        self.planos[0].nome_plano = 'Renomeado'
+
+        html = self.renderizar('crm/index.html', {'planos': self.planos, 'versao_catalogo': 1})
+        self.assertIn('Básico', html)
+        self.assertNotIn('Renomeado', html)
+
+        html = self.renderizar('crm/index.html', {'planos': self.planos, 'versao_catalogo': 2})
+        self.assertIn('Renomeado', html)
+
+    def test_opcoes_do_checkout_por_plano_selecionado(self):
+        def contexto(selecionado):
+            form = CheckoutForm(initial={'plano': selecionado.id}, planos=self.planos)
+            return views.contexto_checkout(selecionado, self.planos, form, 1)
+
+        self.renderizar('crm/checkout.html', contexto(self.planos[0]))
+        html = self.renderizar('crm/checkout.html', contexto(self.planos[1]))
+        # O fragmento do outro plano não é reaproveitado: a opção marcada muda.
+        self.assertRegex(html, r'<option value="2" selected>')
+        self.assertNotRegex(html, r'<option value="1" selected>')
+
+
+class ImportAssinaturasTest(TestCase):
+    CABECALHO = (
+        'nome_completo,email,telefone,aceite_termos,receber_notificacoes,'
+        'nome_barbearia,endereco,cidade,estado,cep,plano,status_pagamento,id_transacao_pagamento\n'
+    )
+
+    def setUp(self):
+        Plano.objects.create(nome_plano='Básico', valor=10)
+        Plano.objects.create(nome_plano='Premium', valor=50)
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(self.diretorio.cleanup)
+
+    def _arquivo(self, linhas):
+        caminho = os.path.join(self.diretorio.name, 'revenda.csv')
+        with open(caminho, 'w', encoding='utf-8') as arquivo:
+            arquivo.write(self.CABECALHO + ''.join(linhas))
+        return caminho
+
+    def _importar(self, caminho, *args):
+        saida, erros = StringIO(), StringIO()
+        call_command('import_assinaturas', caminho, *args, stdout=saida, stderr=erros)
+        return saida.getvalue(), erros.getvalue()
+
+    def test_importa_em_lotes_e_deduplica(self):
+        caminho = self._arquivo([
+            'Ana,ana@x.com,1199,true,false,Barbearia A,Rua 1,São Paulo,SP,01000-000,Básico,pago,tx-1\n',
+            'Ana,ANA@x.com,1199,true,false,Barbearia A2,Rua 2,São Paulo,SP,01000-001,Premium,,\n',
+            'Bia,bia@x.com,2199,0,1,Barbearia B,Rua 3,Rio,RJ,20000-000,Premium,pago,tx-1\n',
+            'Caio,email-invalido,3199,1,0,Barbearia C,Rua 4,BH,MG,30000-000,Básico,,\n',
+            'Duda,duda@x.com,4199,1,0,Barbearia D,Rua 5,BH,MG,30000-001,Inexistente,,\n',
+        ])
+        saida, erros = self._importar(caminho, '--lote', '2')
+
+        self.assertEqual(Usuario.objects.count(), 1)
+        self.assertEqual(Barbearia.objects.count(), 2)
+        self.assertEqual(Assinatura.objects.count(), 2)
+        ana = Usuario.objects.get(email='ana@x.com')
+        self.assertEqual(
+            sorted(ana.assinaturas.values_list('plano__nome_plano', 'barbearia__nome_barbearia', 'status_pagamento')),
+            [('Básico', 'Barbearia A', 'pago'), ('Premium', 'Barbearia A2', 'pendente')],
+        )
+        self.assertIn('Linha 4 ignorada', erros)
+        self.assertIn('Linha 5 ignorada', erros)
+        self.assertIn('linhas/s', saida)
+
+    def test_backend_sem_returning_recupera_ids_das_barbearias(self):
+        """Simula o MySQL, que não devolve os ids gerados pelo bulk_create."""
+        caminho = self._arquivo([
+            'Ana,ana@x.com,11,1,0,Mesmo Nome,Rua 1,Natal,RN,59000-000,Básico,,\n',
+            'Bia,bia@x.com,11,1,0,Mesmo Nome,Rua 1,Natal,RN,59000-000,Premium,,\n',
+        ])
+        with mock.patch.object(
+            type(connection.features), 'can_return_rows_from_bulk_insert', False
+        ):
+            self._importar(caminho)
+        self.assertEqual(
+            sorted(Assinatura.objects.values_list('usuario__email', 'barbearia_id')),
+            sorted(zip(['ana@x.com', 'bia@x.com'], Barbearia.objects.values_list('id', flat=True))),
+        )
+
+    def test_retoma_do_ultimo_lote_confirmado(self):
+        caminho = self._arquivo([
+            f'Pessoa {i},p{i}@x.com,11,1,0,Barbearia {i},Rua {i},Recife,PE,50000-00{i},Básico,,tx-{i}\n'
+            for i in range(5)
+        ])
+        # Simula uma execução interrompida depois do primeiro lote de 2 linhas.
+        ImportacaoAssinaturas.objects.create(arquivo=os.path.realpath(caminho), linhas_confirmadas=2)
+
+        saida, _ = self._importar(caminho, '--lote', '2')
+        self.assertIn('Retomando a partir da linha 3', saida)
+        self.assertEqual(
+            sorted(Assinatura.objects.values_list('id_transacao_pagamento', flat=True)),
+            ['tx-2', 'tx-3', 'tx-4'],
+        )
+        self.assertEqual(ImportacaoAssinaturas.objects.get().linhas_confirmadas, 5)
+
+class ExportacaoAssinaturasTest(TestCase):
+    def setUp(self):
+        plano = Plano.objects.create(nome_plano='Básico', valor=10)
+        for numero, status in enumerate(['pago', 'pendente', 'pago']):
+            usuario = Usuario.objects.create(
+                nome_completo=f'Pessoa {numero}', email=f'p{numero}@x.com', telefone='11'
+            )
+            barbearia = Barbearia.objects.create(
+                nome_barbearia=f'Barbearia {numero}', endereco='Rua 1',
+                cidade='Recife', estado='PE', cep='50000-000'
+            )
+            Assinatura.objects.create(
+                usuario=usuario, plano=plano, barbearia=barbearia, status_pagamento=status
+            )
+        self.equipe = User.objects.create_user('equipe', password='senha', is_staff=True)
+
+    def test_somente_equipe_pode_exportar(self):
+        response = self.client.get(reverse('exportar_assinaturas'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_exporta_csv_em_fluxo_com_filtro_de_status(self):
+        self.client.force_login(self.equipe)
+        response = self.client.get(reverse('exportar_assinaturas'), {'status': 'pago'})
+        self.assertTrue(response.streaming)
+        linhas = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(linhas[0][:2], ['id', 'status_pagamento'])
+        self.assertEqual([linha[7] for linha in linhas[1:]], ['p0@x.com', 'p2@x.com'])
+
+    def test_comando_exporta_jsonl_lendo_em_lotes(self):
+        saida = StringIO()
+        # Com lotes de 2 linhas, 3 assinaturas exigem 2 consultas com dados e 1 vazia.
+        with self.assertNumQueries(3):
+            call_command('export_assinaturas', '--formato', 'jsonl', '--lote', '2', stdout=saida)
+        registros = [json.loads(linha) for linha in saida.getvalue().splitlines()]
+        self.assertEqual(len(registros), 3)
+        self.assertEqual(registros[0]['barbearia_estado'], 'PE')
+        self.assertEqual(registros[0]['plano_valor'], '10.00')
+
+class IndicesAssinaturaTest(TestCase):
+    """
+    Confere, pelo EXPLAIN do banco configurado, que as consultas operacionais
+    sobre Assinatura usam os índices compostos em vez de varrer a tabela.
+    """
+    def setUp(self):
+        plano = Plano.objects.create(nome_plano='Básico', valor=10)
+        usuario = Usuario.objects.create(nome_completo='Ana', email='ana@x.com', telefone='11')
+        self.barbearia, outra = [
+            Barbearia.objects.create(
+                nome_barbearia=nome, endereco='Rua 1', cidade='Recife', estado='PE', cep='50000-000'
+            )
+            for nome in ('Barbearia', 'Outra')
+        ]
+        for status in ['pago', 'pendente', 'cancelado', 'expirado']:
+            Assinatura.objects.create(
+                usuario=usuario, plano=plano, barbearia=self.barbearia, status_pagamento=status
+            )
+        # Numa tabela de poucas linhas, o MySQL pode preferir varrê-la inteira:
+        # as consultas abaixo precisam ser seletivas, como em produção (o
+        # otimizador estima cada faixa do índice, sem depender de ANALYZE).
+        Assinatura.objects.bulk_create([
+            Assinatura(usuario=usuario, plano=plano, barbearia=outra, status_pagamento='cancelado')
+            for _ in range(2000)
+        ])
+
+    def assertUsaIndice(self, queryset, indice):
+        plano = queryset.explain()
+        self.assertIn(indice, plano, f'A consulta não usa {indice}:\n{plano}')
+
+    def test_status_e_expiracao(self):
+        self.assertUsaIndice(
+            Assinatura.objects.filter(status_pagamento='pago', data_expiracao__lt=timezone.now()),
+            'crm_assin_status_exp_idx',
+        )
+        self.assertUsaIndice(
+            Assinatura.objects.filter(status_pagamento='pendente'),
+            'crm_assin_status_exp_idx',
+        )
+
+    def test_barbearia_e_status(self):
+        self.assertUsaIndice(
+            Assinatura.objects.filter(barbearia=self.barbearia, status_pagamento='pago'),
+            'crm_assin_barb_status_idx',
+        )
+        # Só pela barbearia: o mesmo índice, já que a chave estrangeira não tem um próprio.
+        self.assertUsaIndice(Assinatura.objects.filter(barbearia=self.barbearia), 'crm_assin_barb_status_idx')
+
+class ExpiracaoAssinaturasTest(TestCase):
+    def setUp(self):
+        self.plano = Plano.objects.create(nome_plano='Trimestral', valor=90, duracao_dias=90)
+        self.usuario = Usuario.objects.create(nome_completo='Ana', email='ana@x.com', telefone='11')
+        self.barbearia = Barbearia.objects.create(
+            nome_barbearia='Barbearia', endereco='Rua 1', cidade='Recife', estado='PE', cep='50000-000'
+        )
+
+    def _assinatura(self, **campos):
+        return Assinatura.objects.create(
+            usuario=self.usuario, plano=self.plano, barbearia=self.barbearia, **campos
+        )
+
+    def test_pagamento_define_expiracao_pela_duracao_do_plano(self):
+        assinatura = self._assinatura()
+        antes = timezone.now()
+        assinatura.marcar_como_pago('tx-1')
+        assinatura.refresh_from_db()
+        self.assertEqual(assinatura.status_pagamento, 'pago')
+        self.assertGreaterEqual(assinatura.data_expiracao, antes + timedelta(days=90))
+
+    def test_renovacao_antecipada_soma_ao_vencimento_atual(self):
+        vencimento = timezone.now() + timedelta(days=10)
+        assinatura = self._assinatura(status_pagamento='pago', data_expiracao=vencimento)
+        assinatura.marcar_como_pago()
+        self.assertEqual(assinatura.data_expiracao, vencimento + timedelta(days=90))
+
+    def test_comando_expira_somente_pagas_vencidas_em_lotes(self):
+        ontem = timezone.now() - timedelta(days=1)
+        vencidas = [self._assinatura(status_pagamento='pago', data_expiracao=ontem) for _ in range(3)]
+        vigente = self._assinatura(status_pagamento='pago', data_expiracao=timezone.now() + timedelta(days=1))
+        pendente = self._assinatura(status_pagamento='pendente', data_expiracao=ontem)
+
+        saida = StringIO()
+        # Lotes de 2: SELECT ids, UPDATE que pega a trava do SQLite, contagem agrupada,
+        # UPDATE e o resumo (leitura, INSERT da linha 'expirado' no primeiro
+        # lote, UPDATE), mais um SELECT final vazio.
+        with self.assertNumQueries(14):
+            call_command('expirar_assinaturas', '--lote', '2', stdout=saida)
+        self.assertIn('3 assinaturas expiradas', saida.getvalue())
+
+        status = dict(Assinatura.objects.values_list('id', 'status_pagamento'))
+        self.assertEqual({status[a.id] for a in vencidas}, {'expirado'})
+        self.assertEqual(status[vigente.id], 'pago')
+        self.assertEqual(status[pendente.id], 'pendente')
+
+@override_settings(PAGAMENTO_WEBHOOK_SEGREDO='segredo')
+class WebhookPagamentoTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        plano = Plano.objects.create(nome_plano='Básico', valor=10, duracao_dias=30)
+        usuario = Usuario.objects.create(nome_completo='Ana', email='ana@x.com', telefone='11')
+        barbearia = Barbearia.objects.create(
+            nome_barbearia='Barbearia', endereco='Rua 1', cidade='Recife', estado='PE', cep='50000-000'
+        )
+        self.assinaturas = [
+            Assinatura.objects.create(usuario=usuario, plano=plano, barbearia=barbearia)
+            for _ in range(2)
+        ]
+
+    def _enviar(self, assinatura, id_transacao, status='pago', segredo='segredo'):
+        corpo = json.dumps({
+            'assinatura_id': assinatura.id, 'id_transacao': id_transacao, 'status': status,
+        }).encode()
+        return self.client.post(
+            reverse('webhook_pagamento'), corpo, content_type='application/json',
+            HTTP_X_WEBHOOK_ASSINATURA=hmac.new(segredo.encode(), corpo, hashlib.sha256).hexdigest(),
+        )
+
+    def test_pagamento_e_aplicado_uma_unica_vez(self):
+        assinatura = self.assinaturas[0]
+        # Savepoint, UPDATE que pega a trava do SQLite, contagem agrupada, UPDATE
+        # condicional já com a expiração (a duração vem de crm_plano numa
+        # subconsulta), resumo (leitura, INSERT da linha 'pago', UPDATE), a
+        # tarefa do e-mail de confirmação e fim do savepoint.
+        with self.assertNumQueries(9):
+            resposta = self._enviar(assinatura, 'tx-1')
+        self.assertEqual(resposta.json(), {'resultado': 'processado'})
+
+        assinatura.refresh_from_db()
+        self.assertEqual(assinatura.status_pagamento, 'pago')
+        self.assertEqual(assinatura.id_transacao_pagamento, 'tx-1')
+        self.assertIsNotNone(assinatura.data_expiracao)
+
+        # O reenvio para no UPDATE que pega a trava do SQLite, que não encontra nada.
+        with self.assertNumQueries(3):
+            self.assertEqual(self._enviar(assinatura, 'tx-1').json(), {'resultado': 'ignorado'})
+
+    def test_confirmacao_por_email_vai_para_a_fila(self):
+        self._enviar(self.assinaturas[0], 'tx-1')
+        self._enviar(self.assinaturas[0], 'tx-1')
+        self._enviar(self.assinaturas[1], 'tx-1')  # duplicada: nada a confirmar
+        tarefa = Tarefa.objects.get()
+        self.assertEqual((tarefa.tipo, tarefa.dados), ('pagamento_confirmado', {'ids': [self.assinaturas[0].pk]}))
+        self.assertEqual(mail.outbox, [])
+
+        trabalhador = fila.Trabalhador('teste')
+        self.addCleanup(trabalhador.fechar)
+        self.assertEqual(trabalhador.executar_pendentes(), 1)
+        self.assertEqual([m.to for m in mail.outbox], [['ana@x.com']])
+        self.assertIn('Pagamento confirmado', mail.outbox[0].subject)
+
+    def test_transacao_repetida_em_outra_assinatura_e_duplicada(self):
+        self._enviar(self.assinaturas[0], 'tx-1')
+        resposta = self._enviar(self.assinaturas[1], 'tx-1')
+        self.assertEqual(resposta.json(), {'resultado': 'duplicado'})
+        self.assertEqual(Assinatura.objects.get(pk=self.assinaturas[1].pk).status_pagamento, 'pendente')
+
+    def test_rejeita_assinatura_hmac_invalida_e_evento_malformado(self):
+        self.assertEqual(self._enviar(self.assinaturas[0], 'tx-1', segredo='errado').status_code, 403)
+        resposta = self._enviar(self.assinaturas[0], 'tx-1', status='estornado')
+        self.assertEqual(resposta.status_code, 400)
+
+    @override_settings(PAGAMENTO_WEBHOOK_SEGREDO='', DEBUG=False)
+    def test_sem_segredo_configurado_recusa_tudo(self):
+        with self.assertLogs('crm.pagamentos', 'ERROR'):
+            resposta = self._enviar(self.assinaturas[0], 'tx-1', segredo='')
+        self.assertEqual(resposta.status_code, 403)
+        self.assertEqual(Assinatura.objects.get(pk=self.assinaturas[0].pk).status_pagamento, 'pendente')
+
+class CheckoutTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.plano = Plano.objects.create(nome_plano='Plano Básico', valor=10)
+        listar_planos()  # catálogo já em cache, como em produção
+        self.dados = {
+            'plano': self.plano.id,
+            'nome_completo': 'Ana Souza', 'email': 'Ana@Exemplo.com', 'telefone': '81 99999-0000',
+            'aceite_termos': 'on',
+            'nome_barbearia': 'Corte Fino', 'endereco': 'Rua 1, 10', 'cidade': 'Recife',
+            'estado': 'PE', 'cep': '50000-000',
+        }
+
+    def test_cadastro_completo_em_uma_requisicao(self):
+        # Savepoint, busca do e-mail, savepoint e INSERT do usuário (get_or_create),
+        # INSERT da barbearia e da assinatura, resumo do painel (leitura, INSERT da
+        # linha nova, UPDATE) e o fim do savepoint externo.
+        with self.assertNumQueries(11):
+            response = self.client.post(reverse('criar_usuario'), self.dados)
+        self.assertContains(response, 'Corte Fino')
+
+        assinatura = Assinatura.objects.select_related('usuario', 'barbearia').get()
+        self.assertEqual(assinatura.plano, self.plano)
+        self.assertEqual(assinatura.status_pagamento, 'pendente')
+        self.assertEqual(assinatura.usuario.email, 'ana@exemplo.com')
+        self.assertEqual(assinatura.barbearia.estado, 'PE')
+
+    def test_email_ja_cadastrado_reaproveita_o_usuario(self):
+        self.client.post(reverse('criar_usuario'), self.dados)
+        # A linha do resumo já existe: só leitura e UPDATE dela.
+        with self.assertNumQueries(7):
+            self.client.post(reverse('criar_usuario'), {**self.dados, 'nome_barbearia': 'Filial'})
+        self.assertEqual(Usuario.objects.count(), 1)
+        self.assertEqual(Assinatura.objects.filter(usuario__email='ana@exemplo.com').count(), 2)
+
+    def test_formulario_invalido_nao_grava_nada(self):
+        dados = {**self.dados, 'estado': 'XX'}
+        del dados['aceite_termos']
+        response = self.client.post(reverse('criar_usuario'), dados)
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'crm/checkout.html')
+        self.assertContains(response, 'value="Corte Fino"')
+        self.assertFalse(Usuario.objects.exists())
+        self.assertFalse(Barbearia.objects.exists())
+
+    def test_checkout_em_cache_traz_o_token_de_cada_visitante(self):
+        url = reverse('checkout', args=[self.plano.id])
+        primeira = self.client.get(url)
+        outro = self.client_class()
+        segunda = outro.get(url)
+
+        with self.assertNumQueries(0):
+            revalidacao = self.client.get(url, HTTP_IF_NONE_MATCH=primeira['ETag'])
+        self.assertEqual(revalidacao.status_code, 304)
+        self.assertNotEqual(primeira['ETag'], segunda['ETag'])
+        self.assertNotEqual(
+            primeira.cookies['csrftoken'].value, segunda.cookies['csrftoken'].value
+        )
+        self.assertContains(segunda, 'name="csrfmiddlewaretoken"')
+
+
+class LimiteTentativasTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        limites.REJEICOES.zerar()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.plano = Plano.objects.create(nome_plano='Plano Básico', valor=10)
+        listar_planos()
+        # Formulário incompleto: basta para contar a tentativa, sem gravar nada.
+        self.dados = {'plano': self.plano.id, 'nome_completo': 'Robô', 'email': 'robo@spam.test'}
+
+    @override_settings(CRM_LIMITES={'criar_usuario': {'ip': (100, 60), 'email': (2, 600)}})
+    def test_email_acima_do_limite_e_rejeitado_antes_da_view(self):
+        for _ in range(2):
+            self.assertEqual(self.client.post(reverse('criar_usuario'), self.dados).status_code, 200)
+
+        # Nem o formulário nem o banco: só os contadores no cache.
+        with self.assertNumQueries(0):
+            response = self.client.post(reverse('criar_usuario'), {**self.dados, 'email': 'ROBO@spam.test '})
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(response.has_header('Retry-After'))
+
+        outro = self.client.post(reverse('criar_usuario'), {**self.dados, 'email': 'ana@exemplo.com'})
+        self.assertEqual(outro.status_code, 200)
+        self.assertEqual(limites.REJEICOES.series(), {('criar_usuario', 'email'): 1})
+        self.assertIn(
+            'crm_limite_rejeicoes_total{regra="criar_usuario",chave="email"} 1', metricas.texto_prometheus()
+        )
+
+    @override_settings(CRM_LIMITES={'criar_plano': {'ip': (2, 60)}}, CRM_LIMITE_PROXIES=1)
+    def test_ip_vem_do_proxy_confiavel(self):
+        def postar(ip):
+            return self.client.post(
+                reverse('criar_plano'), {'nome_plano': ''},
+                REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR=f'1.2.3.4, {ip}',
+            )
+
+        self.assertEqual([postar('200.1.1.1').status_code for _ in range(3)], [200, 200, 429])
+        # Outro cliente atrás do mesmo proxy não é afetado.
+        self.assertEqual(postar('200.2.2.2').status_code, 200)
+        # GET não conta.
+        self.assertEqual(self.client.get(reverse('criar_plano'), REMOTE_ADDR='10.0.0.1',
+                                         HTTP_X_FORWARDED_FOR='200.1.1.1').status_code, 200)
+
+    @override_settings(CRM_LIMITES={'teste': {'ip': (2, 60)}})
+    def test_janela_deslizante(self):
+        request = RequestFactory().post('/')
+        inicio = 60 * 1000 + 30  # meio de uma janela
+        self.assertIsNone(limites.verificar(request, 'teste', agora=inicio))
+        self.assertIsNone(limites.verificar(request, 'teste', agora=inicio + 1))
+        # Na virada da janela as duas ainda valem inteiras: libera um segundo depois.
+        self.assertEqual(limites.verificar(request, 'teste', agora=inicio + 2), ('ip', 29))
+
+        # Na janela seguinte, na metade dela, as duas tentativas anteriores valem por uma.
+        self.assertIsNone(limites.verificar(request, 'teste', agora=inicio + 60))
+        self.assertEqual(limites.verificar(request, 'teste', agora=inicio + 60)[0], 'ip')
+        # Uma janela inteira depois, só resta a tentativa da janela anterior.
+        self.assertIsNone(limites.verificar(request, 'teste', agora=inicio + 90))
+
+    @override_settings(CRM_LIMITES={'teste': {'ip': (10, 60)}})
+    def test_retry_after_e_quando_a_estimativa_cai_abaixo_do_limite(self):
+        request = RequestFactory().post('/')
+        inicio = 60 * 1000
+        for segundo in range(10):
+            self.assertIsNone(limites.verificar(request, 'teste', agora=inicio + segundo))
+        # No meio da janela seguinte, as dez anteriores valem por cinco: cabem mais cinco.
+        for _ in range(5):
+            self.assertIsNone(limites.verificar(request, 'teste', agora=inicio + 90))
+        # 5 + 10 * (1 - decorrido) fica abaixo de 10 logo depois da metade da janela,
+        # e não só quando ela termina.
+        self.assertEqual(limites.verificar(request, 'teste', agora=inicio + 90), ('ip', 1))
+        self.assertIsNone(limites.verificar(request, 'teste', agora=inicio + 91))
+
+    @override_settings(CRM_LIMITES={'teste': {'ip': (2, 60), 'email': (2, 600)}})
+    def test_retry_after_e_o_da_chave_que_demora_mais(self):
+        request = RequestFactory().post('/', {'email': 'robo@spam.test'})
+        inicio = 600 * 100
+        self.assertIsNone(limites.verificar(request, 'teste', agora=inicio))
+        self.assertIsNone(limites.verificar(request, 'teste', agora=inicio))
+        self.assertEqual(limites.verificar(request, 'teste', agora=inicio + 30), ('email', 571))
+        # Esperar só o da chave de IP não basta.
+        self.assertEqual(limites.verificar(request, 'teste', agora=inicio + 61)[0], 'email')
+        self.assertIsNone(limites.verificar(request, 'teste', agora=inicio + 601))
+
+
+@override_settings(CRM_INSTRUMENTACAO=True, CRM_INSTRUMENTACAO_AMOSTRAGEM=1)
+class InstrumentacaoTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        metricas.zerar()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.plano = Plano.objects.create(nome_plano='Plano Básico', valor=10)
+
+    def test_server_timing_e_histogramas_por_view(self):
+        response = self.client.get(reverse('home'))
+        # Cache vazio: a versão do catálogo já existe, só a lista de planos vai ao banco.
+        self.assertIn('desc="1 consultas SQL"', response['Server-Timing'])
+        self.assertIn('tpl;dur=', response['Server-Timing'])
+        self.assertIn('total;dur=', response['Server-Timing'])
+
+        self.client.get(reverse('home'))
+        self.client.force_login(User.objects.create_user('equipe', is_staff=True))
+        texto = self.client.get(reverse('metricas')).content.decode()
+        self.assertIn('crm_requisicao_segundos_count{view="home"} 2', texto)
+        self.assertIn('crm_consultas_sql_bucket{view="home",le="0"} 1', texto)
+        self.assertIn('crm_consultas_sql_sum{view="home"} 1', texto)
+        self.assertIn('# TYPE crm_template_segundos histogram', texto)
+
+    def test_amostragem_zero_nao_mede(self):
+        with self.settings(CRM_INSTRUMENTACAO_AMOSTRAGEM=0):
+            response = self.client.get(reverse('home'))
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(metricas.LATENCIA.series(), {})
+
+    @override_settings(CRM_INSTRUMENTACAO=False)
+    def test_desligado_por_padrao(self):
+        response = self.client.get(reverse('home'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    def test_metricas_sem_token_so_para_a_equipe(self):
+        self.assertEqual(self.client.get(reverse('metricas')).status_code, 403)
+        self.client.force_login(User.objects.create_user('equipe', is_staff=True))
+        self.assertEqual(self.client.get(reverse('metricas')).status_code, 200)
+
+    @override_settings(CRM_METRICAS_TOKEN='segredo')
+    def test_metricas_exigem_token(self):
+        self.assertEqual(self.client.get(reverse('metricas')).status_code, 403)
+        response = self.client.get(reverse('metricas'), HTTP_AUTHORIZATION='Bearer segredo')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+
+
+class AdminAssinaturaTest(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('equipe', 'equipe@x.com', 'senha')
+        self.client.force_login(self.admin)
+        self.plano = Plano.objects.create(nome_plano='Mensal', valor=49)
+        self.barbearias = [
+            Barbearia.objects.create(
+                nome_barbearia=f'Barbearia {i}', endereco='Rua 1', cidade='Recife', estado='PE', cep='50000-000'
+            )
+            for i in range(2)
+        ]
+        self.criar_assinaturas(3)
+
+    def criar_assinaturas(self, quantidade):
+        inicio = Usuario.objects.count()
+        # bulk_create não passa por save(): a coluna de busca é preenchida aqui.
+        usuarios = Usuario.objects.bulk_create([
+            busca.preencher(Usuario(nome_completo=f'Cliente {i}', email=f'cliente{i}@x.com', telefone='81'))
+            for i in range(inicio, inicio + quantidade)
+        ])
+        Assinatura.objects.bulk_create([
+            Assinatura(usuario=usuario, plano=self.plano, barbearia=self.barbearias[i % 2])
+            for i, usuario in enumerate(Usuario.objects.filter(email__in=[u.email for u in usuarios]))
+        ])
+
+    def consultas_da_listagem(self, url):
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(consultas)
+
+    def test_numero_de_consultas_nao_cresce_com_as_linhas(self):
+        url = reverse('admin:crm_assinatura_changelist')
+        poucas = self.consultas_da_listagem(url)
+        self.criar_assinaturas(30)
+        self.assertEqual(self.consultas_da_listagem(url), poucas)
+
+    def test_filtro_por_barbearia(self):
+        barbearia = self.barbearias[0]
+        url = reverse('admin:crm_assinatura_changelist')
+        response = self.client.get(url, {'barbearia': barbearia.pk})
+        resultado = response.context['cl'].result_list
+        self.assertEqual({a.barbearia_id for a in resultado}, {barbearia.pk})
+        self.assertContains(response, 'Barbearia 0')
+
+        lista = self.client.get(reverse('admin:crm_barbearia_changelist'))
+        self.assertContains(lista, f'?barbearia={barbearia.pk}')
+
+    def test_contagem_estimada_sem_filtros(self):
+        with mock.patch('crm.paginacao.estimar_linhas', return_value=5_000_000):
+            todas = ContagemEstimadaPaginator(Assinatura.objects.order_by('-id'), 50)
+            filtradas = ContagemEstimadaPaginator(
+                Assinatura.objects.filter(status_pagamento='pendente').order_by('-id'), 50
+            )
+            self.assertEqual(todas.count, 5_000_000)
+            self.assertEqual(filtradas.count, 3)
+        # No SQLite não há estimativa: conta normalmente.
+        self.assertEqual(ContagemEstimadaPaginator(Assinatura.objects.order_by('-id'), 50).count, 3)
+
+    def test_autocomplete_de_usuario(self):
+        response = self.client.get(reverse('admin:autocomplete'), {
+            'term': 'cliente1', 'app_label': 'crm', 'model_name': 'assinatura', 'field_name': 'usuario',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['text'] for r in response.json()['results']], ['Cliente 1'])
+
+
+class AcoesEmMassaTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.mensal = Plano.objects.create(nome_plano='Mensal', valor=49, duracao_dias=30)
+            self.anual = Plano.objects.create(nome_plano='Anual', valor=490, duracao_dias=365)
+        usuario = Usuario.objects.create(nome_completo='Ana', email='ana@x.com', telefone='81')
+        barbearia = Barbearia.objects.create(
+            nome_barbearia='Corte Fino', endereco='Rua 1', cidade='Recife', estado='PE', cep='50000-000'
+        )
+        self.agora = timezone.now()
+
+        def nova(plano, status='pendente', **extra):
+            return Assinatura.objects.create(
+                usuario=usuario, barbearia=barbearia, plano=plano, status_pagamento=status, **extra
+            )
+        self.pendente_mensal = nova(self.mensal)
+        self.pendente_anual = nova(self.anual, data_expiracao=self.agora + timedelta(days=10))
+        self.paga = nova(self.mensal, 'pago', id_transacao_pagamento='tx-1')
+        self.cancelada = nova(self.anual, 'cancelado')
+
+    def test_marcar_como_pago_em_um_unico_update(self):
+        # UPDATE que pega a trava do SQLite, contagem agrupada, o UPDATE e o resumo
+        # (leitura, INSERT de 'Anual/pago', UPDATE). No MySQL, a contagem é que
+        # trava as linhas (FOR UPDATE): uma consulta a menos.
+        with self.assertNumQueries(6):
+            alteradas = Assinatura.objects.all().marcar_como_pago(agora=self.agora)
+        self.assertEqual(alteradas, 2)
+
+        self.pendente_mensal.refresh_from_db()
+        self.pendente_anual.refresh_from_db()
+        self.paga.refresh_from_db()
+        self.assertEqual(self.pendente_mensal.status_pagamento, 'pago')
+        self.assertEqual(self.pendente_mensal.data_expiracao, self.agora + timedelta(days=30))
+        # Ainda vigente: a duração conta a partir do vencimento atual.
+        self.assertEqual(self.pendente_anual.data_expiracao, self.agora + timedelta(days=375))
+        self.assertIsNone(self.paga.data_expiracao)
+
+    def test_duracao_vem_do_plano_mesmo_fora_do_catalogo_em_cache(self):
+        listar_planos()
+        # Plano criado sem passar pelo catálogo deste processo (ex.: em outro
+        # servidor, antes de a versão nova chegar ao cache).
+        semestral = Plano.objects.create(nome_plano='Semestral', valor=150, duracao_dias=180)
+        Assinatura.objects.filter(pk=self.pendente_mensal.pk).update(plano=semestral)
+        with mock.patch('crm.catalogo.listar_planos', side_effect=AssertionError('catálogo consultado')):
+            Assinatura.objects.filter(pk=self.pendente_mensal.pk).marcar_como_pago(agora=self.agora)
+        self.pendente_mensal.refresh_from_db()
+        self.assertEqual(self.pendente_mensal.data_expiracao, self.agora + timedelta(days=180))
+
+    def test_marcar_como_cancelado_respeita_o_status_de_origem(self):
+        # UPDATE que pega a trava do SQLite, contagem agrupada, o UPDATE e o resumo
+        # (leitura, INSERT de 'Mensal/cancelado', UPDATE).
+        with self.assertNumQueries(6):
+            alteradas = Assinatura.objects.all().marcar_como_cancelado()
+        self.assertEqual(alteradas, 3)
+        self.assertEqual(Assinatura.objects.filter(status_pagamento='cancelado').count(), 4)
+
+    def test_acao_do_admin(self):
+        self.client.force_login(User.objects.create_superuser('equipe', 'equipe@x.com', 'senha'))
+        response = self.client.post(reverse('admin:crm_assinatura_changelist'), {
+            'action': 'marcar_como_pago',
+            '_selected_action': [self.pendente_mensal.pk, self.paga.pk],
+        }, follow=True)
+        self.assertContains(response, '1 assinatura(s) marcada(s) como paga(s)')
+        self.pendente_mensal.refresh_from_db()
+        self.assertEqual(self.pendente_mensal.status_pagamento, 'pago')
+
+
+class ResumoAssinaturasTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.mensal = Plano.objects.create(nome_plano='Mensal', valor=30, duracao_dias=30)
+            self.anual = Plano.objects.create(nome_plano='Anual', valor=365, duracao_dias=365)
+        listar_planos()  # catálogo em cache
+        self.usuario = Usuario.objects.create(nome_completo='Ana', email='ana@x.com', telefone='81')
+        self.pe = self._barbearia('PE')
+        self.sp = self._barbearia('SP')
+
+    def _barbearia(self, estado):
+        return Barbearia.objects.create(
+            nome_barbearia=f'Barbearia {estado}', endereco='Rua 1', cidade='Cidade', estado=estado, cep='00000-000'
+        )
+
+    def _assinatura(self, plano, barbearia, **campos):
+        return Assinatura.objects.create(usuario=self.usuario, plano=plano, barbearia=barbearia, **campos)
+
+    def assertResumoEmDia(self):
+        reais = resumo.contagens_reais()
+        registradas = {chave: n for chave, n in resumo.contagens_registradas().items() if n}
+        self.assertEqual(registradas, reais)
+
+    def test_resumo_acompanha_todas_as_mudancas(self):
+        a = self._assinatura(self.mensal, self.pe)
+        b = self._assinatura(self.anual, self.sp)
+        c = self._assinatura(self.mensal, self.sp, status_pagamento='pago',
+                             data_expiracao=timezone.now() - timedelta(days=1))
+        self.assertResumoEmDia()
+
+        a.marcar_como_pago('tx-1')
+        Assinatura.objects.get(pk=b.pk).marcar_como_cancelado()
+        self.assertResumoEmDia()
+
+        call_command('expirar_assinaturas', stdout=StringIO())
+        self.assertEqual(Assinatura.objects.get(pk=c.pk).status_pagamento, 'expirado')
+        Assinatura.objects.filter(pk=c.pk).marcar_como_cancelado()  # expirada não cancela
+        Assinatura.objects.all().marcar_como_cancelado()
+        self.assertResumoEmDia()
+
+        # Edição no admin: troca de plano e de barbearia.
+        assinatura = Assinatura.objects.get(pk=a.pk)
+        assinatura.plano, assinatura.barbearia = self.anual, self.pe
+        assinatura.save()
+        self.sp.delete()
+        self.assertResumoEmDia()
+
+    def test_exclusao_em_massa_atualiza_o_resumo_uma_vez(self):
+        def consultas_para_apagar(quantidade):
+            barbearia = self._barbearia('RJ')
+            for _ in range(quantidade):
+                self._assinatura(self.mensal, barbearia)
+                self._assinatura(self.anual, barbearia, status_pagamento='pago')
+            with CaptureQueriesContext(connection) as consultas:
+                barbearia.delete()
+            self.assertResumoEmDia()
+            return len(consultas)
+
+        self.assertEqual(consultas_para_apagar(10), consultas_para_apagar(1))
+        self._assinatura(self.mensal, self.pe)
+        self._assinatura(self.mensal, self.sp)
+        Assinatura.objects.all().delete()
+        self.assertResumoEmDia()
+
+    def test_contagem_que_nao_bate_com_o_update_nao_e_aplicada(self):
+        self._assinatura(self.mensal, self.pe)
+        grupos = [(self.mensal.id, 'PE', 'pendente', 1)]
+        with self.assertLogs('crm.resumo', 'WARNING'):
+            resumo.registrar_transicoes(grupos, 'pago', 0)
+        self.assertResumoEmDia()
+
+    def test_reconciliacao_corrige_divergencias(self):
+        self._assinatura(self.mensal, self.pe)
+        # Mudanças feitas por fora (UPDATE direto) não passam pelo resumo.
+        Assinatura.objects.update(status_pagamento='pago')
+        ResumoAssinaturas.objects.create(plano=self.anual, estado='RJ', status_pagamento='pago', quantidade=3)
+
+        with self.assertRaises(CommandError):
+            call_command('reconciliar_resumo', '--somente-verificar', stdout=StringIO())
+
+        saida = StringIO()
+        call_command('reconciliar_resumo', stdout=saida)
+        self.assertIn(f'plano={self.mensal.id} estado=PE status=pago: resumo 0, real 1 (+1)', saida.getvalue())
+        self.assertIn('3 divergência(s) corrigida(s)', saida.getvalue())
+        self.assertResumoEmDia()
+        self.assertEqual(resumo.reconciliar(), [])
+
+    def test_painel_le_somente_o_resumo(self):
+        self._assinatura(self.mensal, self.pe, status_pagamento='pago')
+        self._assinatura(self.mensal, self.sp, status_pagamento='pago')
+        self._assinatura(self.anual, self.sp, status_pagamento='pago')
+        self._assinatura(self.anual, self.sp)
+
+        with self.assertNumQueries(1):
+            dados = resumo.painel()
+        self.assertEqual(dados['ativas'], 3)
+        # Plano anual convertido para 30 dias: 365 * 30 / 365 = 30 por mês.
+        self.assertEqual(dados['receita_mensal'], 90)
+        self.assertEqual(dados['por_estado'], [('PE', [0, 1, 0, 0]), ('SP', [1, 2, 0, 0])])
+
+        self.assertEqual(self.client.get(reverse('painel')).status_code, 302)
+        self.client.force_login(User.objects.create_user('equipe', password='senha', is_staff=True))
+        self.assertContains(self.client.get(reverse('painel')), 'R$ 90,00')
+
+
+@skipUnless('replica' in settings.DATABASES, 'Requer o banco "replica": use --settings=setup.settings_teste.')
+@override_settings(CRM_REPLICAS=['replica'])
+class RoteamentoReplicasTest(TestCase):
+    # Condicional: com as configurações sem réplica, a classe é pulada, mas o
+    # executor de testes ainda lê 'databases' para montar os bancos de teste.
+    databases = {'default', 'replica'} if 'replica' in settings.DATABASES else {'default'}
+
+    def setUp(self):
+        cache.clear()
+        # Os dois bancos são independentes: cada leitura mostra de onde veio.
+        Plano.objects.create(nome_plano='Principal', valor=10)
+        Plano.objects.using('replica').create(nome_plano='Réplica', valor=20)
+
+    def test_le_da_replica_so_quando_pedido(self):
+        with leitura_em_replica():
+            self.assertEqual(Plano.objects.get().nome_plano, 'Réplica')
+        self.assertEqual(Plano.objects.get().nome_plano, 'Principal')
+
+    def test_catalogo_recarrega_do_principal(self):
+        # Uma réplica atrasada deixaria a lista antiga no cache por um dia.
+        with leitura_em_replica():
+            self.assertEqual([plano.nome_plano for plano in listar_planos()], ['Principal'])
+
+    def test_gravacoes_e_migracoes_somente_no_principal(self):
+        roteador = RoteadorReplicas()
+        with leitura_em_replica():
+            self.assertEqual(roteador.db_for_write(Plano), 'default')
+        self.assertTrue(roteador.allow_migrate('default', 'crm'))
+        self.assertFalse(roteador.allow_migrate('replica', 'crm'))
+
+    def test_le_do_principal_depois_de_gravar(self):
+        def banco_lido(request):
+            with leitura_em_replica():
+                return HttpResponse(Plano.objects.all().db)
+        middleware = LeituraAposEscritaMiddleware(banco_lido)
+        fabrica = RequestFactory()
+
+        self.assertEqual(middleware(fabrica.get('/')).content, b'replica')
+        gravacao = middleware(fabrica.post('/'))
+        self.assertEqual(gravacao.content, b'default')
+
+        # O mesmo navegador continua no principal enquanto o cookie vale.
+        seguinte = fabrica.get('/')
+        seguinte.COOKIES[COOKIE_FIXACAO] = gravacao.cookies[COOKIE_FIXACAO].value
+        self.assertEqual(middleware(seguinte).content, b'default')
+        vencido = fabrica.get('/')
+        vencido.COOKIES[COOKIE_FIXACAO] = str(time.time() - 1)
+        self.assertEqual(middleware(vencido).content, b'replica')
+
+    def test_post_real_marca_o_navegador(self):
+        response = self.client.post(reverse('criar_plano'), {
+            'nome_plano': 'Novo', 'valor': '30.00', 'descricao': '', 'duracao_dias': '',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(COOKIE_FIXACAO, response.cookies)
+        self.assertTrue(Plano.objects.filter(nome_plano='Novo').exists())
+
+
+try:
+    import PIL
+except ImportError:
+    PIL = None
+
+
+class EstaticosTest(TestCase):
+    """collectstatic com ArmazenamentoEstatico e a view servir_estatico."""
+
+    def setUp(self):
+        origem = tempfile.TemporaryDirectory()
+        destino = tempfile.TemporaryDirectory()
+        self.addCleanup(origem.cleanup)
+        self.addCleanup(destino.cleanup)
+        self.origem, self.destino = origem.name, destino.name
+        os.makedirs(os.path.join(self.origem, 'assets'))
+        with open(os.path.join(self.origem, 'site.css'), 'w') as arquivo:
+            arquivo.write('.card { margin: 0 auto; padding: 1rem; }\n' * 200)
+
+    def coletar(self):
+        with override_settings(
+            STATIC_ROOT=self.destino, STATICFILES_DIRS=[self.origem],
+            STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+            STATICFILES_STORAGE='crm.estaticos.ArmazenamentoEstatico',
+            CRM_IMAGENS_VARIANTES=['assets/banner*.png'], CRM_LARGURAS_IMAGENS=[100],
+        ):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            from django.contrib.staticfiles.storage import staticfiles_storage
+            staticfiles_storage._setup()
+            return dict(staticfiles_storage.hashed_files)
+
+    def test_nomes_com_hash_e_copias_comprimidas(self):
+        manifesto = self.coletar()
+        com_hash = manifesto['site.css']
+        self.assertRegex(com_hash, r'^site\.[0-9a-f]{12}\.css$')
+        self.assertTrue(os.path.isfile(os.path.join(self.destino, com_hash + '.gz')))
+
+        with override_settings(STATIC_ROOT=self.destino):
+            response = estaticos.servir_estatico(
+                RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip, deflate'), com_hash
+            )
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+            self.assertIn('Accept-Encoding', response['Vary'])
+            response.close()
+
+            # Sem hash no nome, o arquivo pode mudar: cache curto e sem compressão.
+            response = estaticos.servir_estatico(RequestFactory().get('/'), 'site.css')
+            self.assertNotIn('Content-Encoding', response)
+            self.assertEqual(response['Cache-Control'], 'public, max-age=300')
+            response.close()
+
+            with self.assertRaises(Http404):
+                estaticos.servir_estatico(RequestFactory().get('/'), '../settings.py')
+
+    @skipUnless(PIL, 'Pillow não instalado')
+    def test_variantes_webp_das_imagens(self):
+        from PIL import Image
+
+        Image.new('RGB', (300, 150), 'navy').save(os.path.join(self.origem, 'assets', 'banner1.png'))
+        manifesto = self.coletar()
+        for largura in (100, 300):
+            variante = manifesto[f'assets/banner1-{largura}w.webp']
+            with Image.open(os.path.join(self.destino, variante)) as imagem:
+                self.assertEqual(imagem.format, 'WEBP')
+                self.assertEqual(imagem.width, largura)
+        # Só as imagens configuradas ganham variantes.
+        self.assertNotIn('site-100w.webp', manifesto)
+
+
+@skipUnless(PIL, 'Pillow não instalado')
+class ImagemResponsivaTest(TestCase):
+    """Comando gerar_variantes_imagens e a tag {% imagem_responsiva %}."""
+
+    def setUp(self):
+        from PIL import Image
+
+        origem = tempfile.TemporaryDirectory()
+        self.addCleanup(origem.cleanup)
+        self.origem = origem.name
+        os.makedirs(os.path.join(self.origem, 'assets'))
+        Image.new('RGB', (300, 150), 'navy').save(os.path.join(self.origem, 'assets', 'banner1.png'))
+        Image.new('RGB', (30, 30), 'navy').save(os.path.join(self.origem, 'assets', 'icone.png'))
+
+        configuracao = override_settings(
+            STATIC_URL='/static/', STATICFILES_DIRS=[self.origem],
+            STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+            CRM_IMAGENS_VARIANTES=['assets/banner*.png'], CRM_LARGURAS_IMAGENS=[100],
+        )
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        imagens.variantes.cache_clear()
+        self.addCleanup(imagens.variantes.cache_clear)
+
+    def renderizar(self, argumentos):
+        return Template(
+            '{% load imagens_responsivas %}{% imagem_responsiva ' + argumentos + ' %}'
+        ).render(Context())
+
+    def test_comando_gera_variantes_e_pula_as_em_dia(self):
+        saida = StringIO()
+        call_command('gerar_variantes_imagens', stdout=saida)
+        self.assertIn('2 variante(s) gerada(s), 0 imagem(ns) em dia.', saida.getvalue())
+        for largura in (100, 300):
+            self.assertTrue(os.path.isfile(os.path.join(self.origem, 'assets', f'banner1-{largura}w.webp')))
+        self.assertFalse(os.path.exists(os.path.join(self.origem, 'assets', 'icone-100w.webp')))
+
+        saida = StringIO()
+        call_command('gerar_variantes_imagens', stdout=saida)
+        self.assertIn('0 variante(s) gerada(s), 1 imagem(ns) em dia.', saida.getvalue())
+
+    def test_srcset_com_variantes_e_carregamento_preguicoso(self):
+        call_command('gerar_variantes_imagens', stdout=StringIO())
+        html = self.renderizar("'assets/banner1.png' sizes='100vw' class='w-100' alt='Banner'")
+        self.assertIn(
+            'srcset="/static/assets/banner1-100w.webp 100w, /static/assets/banner1-300w.webp 300w"', html
+        )
+        self.assertIn('<img src="/static/assets/banner1.png" alt="Banner"', html)
+        self.assertIn('class="w-100" decoding="async" height="150" loading="lazy" width="300"', html)
+
+        # A imagem da primeira dobra não espera: sem lazy, com prioridade alta.
+        html = self.renderizar("'assets/banner1.png' prioridade=True")
+        self.assertIn('fetchpriority="high"', html)
+        self.assertNotIn('loading=', html)
+
+    def test_sem_variantes_sai_img_simples(self):
+        html = self.renderizar("'assets/icone.png'")
+        self.assertNotIn('<picture>', html)
+        self.assertIn('<img src="/static/assets/icone.png" alt="" decoding="async" height="30"', html)
+
+
+class FilaNotificacoesTest(TestCase):
+    def setUp(self):
+        self.plano = Plano.objects.create(nome_plano='Mensal', valor=30)
+        self.barbearia = Barbearia.objects.create(
+            nome_barbearia='Corte Fino', endereco='Rua 1', cidade='Recife', estado='PE', cep='50000-000'
+        )
+        self.usuarios = [
+            Usuario.objects.create(
+                nome_completo=f'Cliente {i}', email=f'c{i}@x.com', telefone='81', receber_notificacoes=i != 3
+            )
+            for i in range(5)
+        ]
+
+    def _executar(self):
+        trabalhador = fila.Trabalhador('teste')
+        try:
+            return trabalhador.executar_pendentes(quantidade=2)
+        finally:
+            trabalhador.fechar()
+
+    def test_campanha_em_lotes_so_para_quem_aceitou(self):
+        self.assertEqual(notificacoes.enfileirar_campanha('Novidade', 'Templates novos!', tamanho_lote=2), 2)
+        self.assertEqual(
+            sorted(len(t.dados['ids']) for t in Tarefa.objects.filter(tipo='campanha')), [2, 2]
+        )
+
+        # Uma única conexão de e-mail para todos os lotes.
+        with mock.patch.object(fila.mail, 'get_connection', wraps=fila.mail.get_connection) as conexao:
+            self.assertEqual(self._executar(), 2)
+        conexao.assert_called_once()
+
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ['c0@x.com', 'c1@x.com', 'c2@x.com', 'c4@x.com'])
+        self.assertIn('Templates novos!', mail.outbox[0].body)
+        self.assertEqual(set(Tarefa.objects.values_list('status', flat=True)), {'concluida'})
+        self.assertEqual(sum(Tarefa.objects.values_list('processados', flat=True)), 4)
+
+    def test_preferencia_conferida_na_hora_do_envio(self):
+        notificacoes.enfileirar_campanha('Novidade', 'Oi', tamanho_lote=10)
+        Usuario.objects.filter(email='c0@x.com').update(receber_notificacoes=False)
+        self._executar()
+        self.assertNotIn('c0@x.com', [m.to[0] for m in mail.outbox])
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_falha_reagenda_e_retoma_do_ultimo_enviado(self):
+        notificacoes.enfileirar_campanha('Novidade', 'Oi', tamanho_lote=10)
+        envio = 'django.core.mail.backends.locmem.EmailBackend.send_messages'
+        with mock.patch(envio, side_effect=[1, ConnectionError('SMTP caiu')]):
+            with self.assertLogs('crm.fila', 'WARNING') as logs:
+                self._executar()
+        self.assertIn('falhou (tentativa 1): ConnectionError: SMTP caiu', logs.output[0])
+
+        tarefa = Tarefa.objects.get()
+        self.assertEqual(tarefa.status, 'pendente')
+        self.assertEqual(tarefa.tentativas, 1)
+        self.assertEqual(tarefa.processados, 1)
+        self.assertIn('SMTP caiu', tarefa.ultimo_erro)
+        self.assertGreater(tarefa.executar_em, timezone.now())
+        self.assertEqual(self._executar(), 0)  # ainda não venceu
+
+        Tarefa.objects.update(executar_em=timezone.now())
+        self._executar()
+        tarefa.refresh_from_db()
+        self.assertEqual((tarefa.status, tarefa.tentativas, tarefa.processados), ('concluida', 2, 4))
+        # O primeiro destinatário não recebe de novo.
+        self.assertEqual([m.to[0] for m in mail.outbox], ['c1@x.com', 'c2@x.com', 'c4@x.com'])
+
+    @override_settings(CRM_FILA_PROGRESSO=2)
+    def test_progresso_gravado_durante_o_lote(self):
+        notificacoes.enfileirar_campanha('Novidade', 'Oi', tamanho_lote=10)
+        gravados = []
+
+        def enviar(mensagens):
+            gravados.append(Tarefa.objects.get().processados)
+            return len(mensagens)
+
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=enviar):
+            self._executar()
+        # Se o processo morresse antes do 4º e-mail, a tarefa voltaria do 3º.
+        self.assertEqual(gravados, [0, 0, 2, 2])
+        self.assertEqual(Tarefa.objects.get().processados, 4)
+
+    def test_trabalhador_sobrevive_a_erro_do_banco(self):
+        class Parar:
+            def __init__(self):
+                self.esperas = []
+
+            def is_set(self):
+                return False
+
+            def wait(self, segundos):
+                self.esperas.append(segundos)
+
+        parar = Parar()
+        fila.enfileirar('campanha', {'ids': [], 'assunto': 'Oi', 'mensagem': 'Oi'})
+        reservar, erros = fila.reservar, [OperationalError('MySQL server has gone away')] * 2
+
+        def reservar_apos_erros(*args, **kwargs):
+            if erros:
+                raise erros.pop()
+            return reservar(*args, **kwargs)
+
+        with mock.patch.object(fila, 'reservar', side_effect=reservar_apos_erros):
+            with self.assertLogs('crm.fila', 'ERROR') as logs:
+                fila.Trabalhador('teste').rodar(parar, uma_vez=True)
+        self.assertEqual(parar.esperas, [1, 2])
+        self.assertEqual(len(logs.output), 2)
+        self.assertIn('(2 seguido(s)); tentando de novo em 2s', logs.output[1])
+        self.assertEqual(Tarefa.objects.get().status, 'concluida')
+
+    def test_processo_filho_morto_nao_trava_o_comando(self):
+        resultados = queue.Queue()
+        resultados.put((3, 30))
+        filhos = [SimpleNamespace(pid=1, exitcode=0), SimpleNamespace(pid=2, exitcode=-9)]
+        parar = threading.Event()
+        with mock.patch.object(run_worker, 'INTERVALO_VERIFICACAO', 0.01):
+            with self.assertLogs('crm.fila', 'ERROR') as logs:
+                totais, mortos = run_worker.Command()._coletar(filhos, parar, resultados)
+        self.assertEqual((totais, mortos), ([(3, 30)], [filhos[1]]))
+        self.assertTrue(parar.is_set())
+        self.assertIn('Processo 2 terminou com o código -9', logs.output[0])
+
+    def test_esgotadas_as_tentativas_a_tarefa_falha(self):
+        tarefa = fila.enfileirar('campanha', {'ids': [self.usuarios[0].pk], 'assunto': 'Oi', 'mensagem': 'Oi'})
+        Tarefa.objects.filter(pk=tarefa.pk).update(max_tentativas=1)
+        envio = 'django.core.mail.backends.locmem.EmailBackend.send_messages'
+        with mock.patch(envio, side_effect=ConnectionError('SMTP caiu')):
+            with self.assertLogs('crm.fila', 'ERROR') as logs:
+                self._executar()
+        self.assertEqual(Tarefa.objects.get().status, 'falhou')
+        self.assertIn('falhou de vez após 1 tentativas: ConnectionError: SMTP caiu', logs.output[0])
+
+    def test_reserva_nao_devolve_tarefa_ja_reservada(self):
+        fila.enfileirar('campanha', {'ids': []})
+        self.assertEqual(len(fila.reservar('a')), 1)
+        self.assertEqual(fila.reservar('b'), [])
+
+        # Presa em 'executando' além do limite: volta para a fila.
+        Tarefa.objects.update(iniciada_em=timezone.now() - timedelta(hours=1))
+        self.assertEqual(fila.liberar_travadas(), 1)
+        self.assertEqual(len(fila.reservar('b')), 1)
+
+    def test_lembretes_somente_pagas_que_vencem_no_dia(self):
+        agora = timezone.now()
+        vence = agora + timedelta(days=7, hours=2)
+
+        def assinatura(usuario, **campos):
+            return Assinatura.objects.create(usuario=usuario, plano=self.plano, barbearia=self.barbearia, **campos)
+
+        avisada = assinatura(self.usuarios[0], status_pagamento='pago', data_expiracao=vence)
+        assinatura(self.usuarios[1], status_pagamento='pendente', data_expiracao=vence)
+        assinatura(self.usuarios[2], status_pagamento='pago', data_expiracao=vence + timedelta(days=2))
+        assinatura(self.usuarios[3], status_pagamento='pago', data_expiracao=vence)  # sem notificações
+
+        self.assertEqual(notificacoes.enfileirar_lembretes(dias=7, agora=agora), 1)
+        self.assertEqual(Tarefa.objects.get().dados['ids'], [avisada.pk])
+
+        saida = StringIO()
+        call_command('run_worker', '--uma-vez', '--threads', '1', stdout=saida)
+        self.assertIn('1 tarefa(s), 1 item(ns)', saida.getvalue())
+        self.assertEqual(mail.outbox[0].to, ['c0@x.com'])
+        self.assertIn('Corte Fino', mail.outbox[0].body)
+
+    def test_comando_enfileirar_notificacoes(self):
+        saida = StringIO()
+        call_command(
+            'enfileirar_notificacoes', 'campanha', '--assunto', 'Oi', '--mensagem', 'Olá', '--lote', '3',
+            stdout=saida,
+        )
+        self.assertIn('2 tarefa(s) enfileirada(s)', saida.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('enfileirar_notificacoes', 'campanha', stdout=StringIO())
+
+
+class CepTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        self.indice = os.path.join(diretorio.name, 'ceps.idx')
+        ceps.gravar_indice(
+            self.indice,
+            [
+                (1001000, 'Praça da Sé', 'Sé', 'São Paulo', 'SP'),
+                (50030230, 'Rua da Aurora', 'Boa Vista', 'Recife', 'PE'),
+                (1001000, 'Praça da Sé - lado ímpar', 'Sé', 'São Paulo', 'SP'),
+            ],
+            [(56900000, 56919999, '', '', 'Serra Talhada', 'PE')],
+        )
+        configuracao = override_settings(CRM_CEP_INDICE=self.indice)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        ceps.recarregar()
+        self.addCleanup(ceps.recarregar)
+
+    def test_consulta_por_cep_e_por_faixa(self):
+        self.assertEqual(ceps.consultar('01001000'), {
+            'cep': '01001-000', 'logradouro': 'Praça da Sé - lado ímpar', 'bairro': 'Sé',
+            'cidade': 'São Paulo', 'estado': 'SP',
+        })
+        self.assertEqual(ceps.consultar('56909-123')['cidade'], 'Serra Talhada')
+        self.assertIsNone(ceps.consultar('56920-000'))
+        self.assertIsNone(ceps.consultar('00000-001'))
+        self.assertIsNone(ceps.consultar('123'))
+
+        ceps.consultar('50030-230')
+        with self.assertNumQueries(0):
+            self.assertEqual(ceps.consultar('50030230')['logradouro'], 'Rua da Aurora')
+        self.assertGreaterEqual(ceps._buscar.cache_info().hits, 1)
+
+    def test_sem_indice_nenhum_cep_e_encontrado(self):
+        with override_settings(CRM_CEP_INDICE=self.indice + '.inexistente'):
+            ceps.recarregar()
+            with self.assertLogs('crm.ceps', 'WARNING'):
+                self.assertIsNone(ceps.consultar('01001-000'))
+
+    def test_indice_importado_depois_passa_a_valer(self):
+        caminho = self.indice + '.novo'
+        with override_settings(CRM_CEP_INDICE=caminho):
+            ceps.recarregar()
+            with self.assertLogs('crm.ceps', 'WARNING') as logs:
+                response = self.client.get(reverse('consultar_cep', args=['01001000']))
+                # Sem índice, o 404 não fica guardado em CDN nem no navegador.
+                self.assertEqual(response.status_code, 404)
+                self.assertNotIn('public', response['Cache-Control'])
+                self.assertIn('no-store', response['Cache-Control'])
+                self.assertIsNone(ceps.consultar('01001-000'))
+            self.assertEqual(len(logs.output), 1)  # o arquivo só é procurado de novo depois da espera
+
+            os.replace(self.indice, caminho)
+            self.assertIsNone(ceps.consultar('01001-000'))
+            agora = time.monotonic() + ceps.ESPERA_SEM_INDICE
+            with mock.patch.object(ceps.time, 'monotonic', return_value=agora):
+                self.assertEqual(ceps.consultar('01001-000')['cidade'], 'São Paulo')
+            response = self.client.get(reverse('consultar_cep', args=['99999999']))
+            self.assertEqual(response.status_code, 404)
+            self.assertIn('public', response['Cache-Control'])
+
+    def test_endpoint_json(self):
+        response = self.client.get(reverse('consultar_cep', args=['50030230']))
+        self.assertEqual(response.json()['cidade'], 'Recife')
+        self.assertIn('max-age=86400', response['Cache-Control'])
+
+        response = self.client.get(reverse('consultar_cep', args=['99999999']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_checkout_consulta_o_cep(self):
+        plano = Plano.objects.create(nome_plano='Mensal', valor=30)
+        response = self.client.get(reverse('checkout', args=[plano.id]))
+        self.assertContains(response, f'data-consulta="{reverse("consultar_cep", args=["00000000"])}"')
+
+    def test_formulario_normaliza_o_cep(self):
+        dados = {'nome_barbearia': 'B', 'endereco': 'Rua 1', 'cidade': 'Recife', 'estado': 'PE'}
+        form = BarbeariaForm({**dados, 'cep': '50030230'})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data['cep'], '50030-230')
+        self.assertIn('cep', BarbeariaForm({**dados, 'cep': '5003-023'}).errors)
+
+    def test_comando_importar_ceps(self):
+        diretorio = os.path.dirname(self.indice)
+        logradouros = os.path.join(diretorio, 'logradouros.csv')
+        with open(logradouros, 'w', encoding='utf-8') as arquivo:
+            arquivo.write(
+                'cep,logradouro,bairro,cidade,uf\n'
+                '69005-010,Avenida Eduardo Ribeiro,Centro,Manaus,AM\n'
+                '123,Rua Errada,Centro,Manaus,AM\n'
+                '69005-020,Rua Sem Estado,Centro,Manaus,XX\n'
+            )
+        localidades = os.path.join(diretorio, 'localidades.csv')
+        with open(localidades, 'w', encoding='utf-8') as arquivo:
+            arquivo.write('cep_inicial,cep_final,cidade,uf\n56900-000,56919-999,Serra Talhada,PE\n')
+
+        saida, erros = StringIO(), StringIO()
+        call_command('importar_ceps', logradouros, localidades, stdout=saida, stderr=erros)
+        self.assertIn('1 CEPs e 1 faixas', saida.getvalue())
+        self.assertIn('2 linha(s) inválida(s)', saida.getvalue())
+        self.assertIn('linha 3 ignorada', erros.getvalue())
+        # O índice do processo é recarregado: o CEP novo já é encontrado.
+        self.assertEqual(ceps.consultar('69005010')['cidade'], 'Manaus')
+        self.assertIsNone(ceps.consultar('01001000'))
+
+        with open(localidades, 'a', encoding='utf-8') as arquivo:
+            arquivo.write('56910-000,56929-999,Outra,PE\n')
+        with self.assertRaises(CommandError):
+            call_command('importar_ceps', localidades, stdout=StringIO(), stderr=StringIO())
+
+
+# TransactionTestCase: no MySQL, o índice FULLTEXT só enxerga o que já foi
+# confirmado (commit), e o TestCase nunca confirma.
+class BuscaTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.ana = Usuario.objects.create(
+            nome_completo='Ana Conceição Silva', email='ana.silva@exemplo.com', telefone='(81) 99999-0000'
+        )
+        self.bruno = Usuario.objects.create(nome_completo='Bruno Souza', email='bruno@x.com', telefone='11')
+        self.barbearia = Barbearia.objects.create(
+            nome_barbearia='Barbearia do Zé', endereco='Rua 1', cidade='São Paulo', estado='SP', cep='01001-000'
+        )
+
+    def _usuarios(self, texto):
+        return set(busca.filtrar(Usuario.objects.all(), texto))
+
+    def test_texto_normalizado_no_save(self):
+        self.assertEqual(busca.normalizar('São Paulo - SP'), 'sao paulo sp')
+        self.assertEqual(
+            self.ana.busca, 'ana conceicao silva ana silva exemplo com 81 99999 0000 81999990000'
+        )
+        self.barbearia.cidade = 'Olinda'
+        self.barbearia.save(update_fields=['cidade'])
+        self.barbearia.refresh_from_db()
+        self.assertIn('olinda', self.barbearia.busca)
+
+    def test_termos_casam_com_o_inicio_das_palavras(self):
+        self.assertEqual(self._usuarios('ana sil'), {self.ana})
+        self.assertEqual(self._usuarios('SILVA Conceição'), {self.ana})
+        self.assertEqual(self._usuarios('ana.silva@exemplo'), {self.ana})
+        self.assertEqual(self._usuarios('8199999'), {self.ana})
+        self.assertEqual(self._usuarios('bru'), {self.bruno})
+        self.assertEqual(self._usuarios('ilva'), set())  # meio da palavra
+        self.assertEqual(self._usuarios('ana bruno'), set())
+        self.assertEqual(self._usuarios(' - '), set())
+        self.assertEqual(
+            list(busca.filtrar(Barbearia.objects.all(), 'barbearia sao paulo 01001')), [self.barbearia]
+        )
+
+    def test_admin_e_autocomplete_usam_o_indice(self):
+        Plano.objects.create(nome_plano='Premium Anual', valor=500)
+        self.client.force_login(User.objects.create_superuser('equipe', 'equipe@x.com', 'senha'))
+
+        response = self.client.get(reverse('admin:crm_usuario_changelist'), {'q': 'conceicao'})
+        self.assertContains(response, 'Ana Conceição Silva')
+        self.assertNotContains(response, 'Bruno Souza')
+
+        response = self.client.get(reverse('busca'), {'q': 'sao paulo', 'tipo': 'barbearia'})
+        self.assertEqual(response.json()['resultados'], [{
+            'tipo': 'barbearia', 'id': self.barbearia.pk, 'texto': 'Barbearia do Zé (São Paulo/SP)',
+            'url': reverse('admin:crm_barbearia_change', args=[self.barbearia.pk]),
+        }])
+        self.assertIn('private', response['Cache-Control'])
+
+        tipos = [r['tipo'] for r in self.client.get(reverse('busca'), {'q': 'an'}).json()['resultados']]
+        self.assertEqual(tipos, ['usuario', 'plano'])
+        self.assertEqual(self.client.get(reverse('busca'), {'q': 'a'}).json()['resultados'], [])
+
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('busca'), {'q': 'ana'}).status_code, 302)
+
+    def test_gravacoes_em_massa_mantem_a_busca(self):
+        Usuario.objects.bulk_create([
+            Usuario(nome_completo='Carla Dias', email='carla@x.com', telefone='21'),
+            Usuario(nome_completo='Davi Lima', email='davi@x.com', telefone='31'),
+        ])
+        carla, davi = Usuario.objects.filter(email__in=['carla@x.com', 'davi@x.com']).order_by('email')
+        self.client.force_login(User.objects.create_superuser('equipe', 'equipe@x.com', 'senha'))
+        response = self.client.get(reverse('admin:crm_usuario_changelist'), {'q': 'carla'})
+        self.assertContains(response, 'Carla Dias')
+
+        # Expressão calculada no banco: a coluna é refeita depois do UPDATE.
+        self.assertEqual(
+            Usuario.objects.filter(email='carla@x.com').update(nome_completo=Concat('nome_completo', Value(' Rocha'))),
+            1,
+        )
+        self.assertEqual(self._usuarios('carla rocha'), {carla})
+
+        # O filtro deixa de casar depois do UPDATE, e mesmo assim as linhas são refeitas.
+        Barbearia.objects.filter(cidade='São Paulo').update(cidade='Olinda')
+        self.assertEqual(list(busca.filtrar(Barbearia.objects.all(), 'olinda')), [self.barbearia])
+
+        davi.nome_completo = 'Davi Nogueira'
+        Usuario.objects.bulk_update([davi], ['nome_completo'])
+        self.assertEqual(self._usuarios('nogueira'), {davi})
+        self.assertEqual(self._usuarios('lima'), set())
+
+    def test_reindexar_busca(self):
+        Usuario.objects.update(busca='')
+        saida = StringIO()
+        call_command('reindexar_busca', stdout=saida)
+        self.assertIn('Usuários: 2 linha(s) atualizada(s)', saida.getvalue())
+        self.assertEqual(self._usuarios('bruno souza'), {self.bruno})
+
+
+class UrlsAsync:
+    """URLconf de teste que aponta as páginas públicas para as views async."""
+    urlpatterns = [
+        path('', views_async.index, name='home'),
+        path('checkout/<int:plano_id>/', views_async.checkout_plano, name='checkout'),
+        path('criar/', views_async.criar_plano, name='criar_plano'),
+        path('criar_usuario/', views_async.criar_usuario, name='criar_usuario'),
+        path('cep/<str:cep>/', views.consultar_cep, name='consultar_cep'),
+    ]
+
+
+@override_settings(ROOT_URLCONF=UrlsAsync)
+class ViewsAsyncTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.plano = Plano.objects.create(nome_plano='Plano Básico', valor=10)
+
+    async def test_home_e_checkout_async(self):
+        response = await self.async_client.get('/')
+        self.assertContains(response, 'Plano Básico')
+        self.assertTrue(response.has_header('ETag'))
+
+        response = await self.async_client.get(f'/checkout/{self.plano.id}/')
+        self.assertContains(response, 'Plano - Plano Básico')
+
+        response = await self.async_client.get(f'/checkout/{self.plano.id + 1}/')
+        self.assertEqual(response.status_code, 404)
+
+    async def test_criar_plano_async(self):
+        dados = urlencode({'nome_plano': 'Premium', 'valor': '50.00', 'descricao': '', 'duracao_dias': ''})
+        response = await self.async_client.post(
+            '/criar/', dados, content_type='application/x-www-form-urlencoded'
+        )
+        self.assertRedirects(response, '/', fetch_redirect_response=False)
+        self.assertEqual(await Plano.objects.filter(nome_plano='Premium', duracao_dias=30).acount(), 1)
+
+    async def test_criar_usuario_async(self):
+        dados = urlencode({
+            'plano': self.plano.id, 'nome_completo': 'Ana', 'email': 'ana@x.com', 'telefone': '81',
+            'aceite_termos': 'on', 'nome_barbearia': 'Corte Fino', 'endereco': 'Rua 1',
+            'cidade': 'Recife', 'estado': 'PE', 'cep': '50000-000',
+        })
+        response = await self.async_client.post(
+            '/criar_usuario/', dados, content_type='application/x-www-form-urlencoded'
+        )
+        self.assertContains(response, 'Corte Fino')
+        self.assertEqual(await Assinatura.objects.filter(usuario__email='ana@x.com').acount(), 1)
+
+    @override_settings(CRM_INSTRUMENTACAO=True)
+    async def test_instrumentacao_nas_views_async(self):
+        response = await self.async_client.get('/')
+        self.assertIn('desc="1 consultas SQL"', response['Server-Timing'])
+
 # Como executar esse teste no Visual Studio Code
 # Para executar os testes,
 # você pode usar o terminal integrado do Visual Studio Code.
@@ -1,18 +1,34 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path
-from . import views
+from . import views, views_async
 
+# Com CRM_VIEWS_ASYNC ligado (ex.: servindo via ASGI), as páginas públicas
+# usam as versões async de crm/views_async.py.
+paginas = views_async if settings.CRM_VIEWS_ASYNC else views
 
 urlpatterns = [
     # Rota para a página inicial, que lista os planos.
     # Nome 'home' é uma convenção comum para a página principal.
-    path('', views.index, name='home'), 
+    path('', paginas.index, name='home'), 
     # Rota para a página de checkout.
     # Aceita um ID de plano inteiro na URL, que é passado para a view.
     # Nome 'checkout' é usado na tag {% url %} do template.
-    path('checkout/<int:plano_id>/', views.checkout_plano,name='checkout'),
+    path('checkout/<int:plano_id>/', paginas.checkout_plano,name='checkout'),
     path('admin/', admin.site.urls),
-    path('plano/', views.plano_form, name='plano_form'),
-    path('criar/', views.criar_plano, name='criar_plano'),
-    path('criar_usuario/', views.criar_usuario, name='criar_usuario'), # URL para processar o formulário
+    path('plano/', paginas.plano_form, name='plano_form'),
+    path('criar/', paginas.criar_plano, name='criar_plano'),
+    path('criar_usuario/', paginas.criar_usuario, name='criar_usuario'), # URL para processar o formulário
+    # Exportação de assinaturas (somente equipe), enviada em fluxo.
+    path('exportar/assinaturas/', views.exportar_assinaturas, name='exportar_assinaturas'),
+    # Painel da equipe (assinaturas por plano, status e estado).
+    path('painel/', views.painel, name='painel'),
+    # Endereço de um CEP (JSON), usado pelo checkout.
+    path('cep/<str:cep>/', views.consultar_cep, name='consultar_cep'),
+    # Autocomplete da equipe (usuários, barbearias e planos), em JSON.
+    path('busca/', views.autocompletar, name='busca'),
+    # Notificações do gateway de pagamento.
+    path('webhooks/pagamento/', views.webhook_pagamento, name='webhook_pagamento'),
+    # Métricas de latência e de consultas SQL, para o Prometheus.
+    path('metricas/', views.metricas, name='metricas'),
 ]
\ No newline at end of file
@@ -1,49 +1,71 @@
-from django.shortcuts import get_object_or_404, render,redirect
+import hmac
+import json
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import (
+    Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse,
+    StreamingHttpResponse,
+)
+from django.shortcuts import render,redirect
+from django.utils.cache import add_never_cache_headers, patch_cache_control
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from crm.models import Plano
-from crm.forms import PlanoForms
+from crm.forms import CheckoutForm, ExportacaoForm, PlanoForms
+from crm import busca, ceps, exportacao, metricas as registro_metricas, pagamentos, resumo
+from crm.catalogo import listar_planos, obter_plano, versao_catalogo
+from crm.cache_paginas import cache_pagina
+from crm.limites import limitar
 
+@cache_pagina
 def index(request):
     """
     Renderiza a página inicial (Home) exibindo todos os planos disponíveis.
-    Os planos são ordenados pelo valor.
+    Os planos são ordenados pelo valor e vêm do cache do catálogo.
     """
-    planos = Plano.objects.all().order_by('valor')
+    # A versão é lida antes dos planos: se o catálogo mudar entre as duas
+    # leituras, o fragmento em cache fica sob a versão antiga, que ninguém
+    # mais procura, e nunca o contrário.
+    versao = versao_catalogo()
+    planos = listar_planos()
     context = {
         'planos': planos,
+        # Chave do cache dos cartões de planos no template.
+        'versao_catalogo': versao,
     }
     return render(request, 'crm/index.html', context)
 
+@cache_pagina
 def checkout_plano(request, plano_id):
-    plano_selecionado = get_object_or_404(Plano, id=plano_id)
-    todos_os_planos = Plano.objects.all().order_by('valor')
-
-    # Prepare os dados para preencher o formulário usando 'initial'
-    # As chaves aqui (ex: 'nome_do_campo_no_form') devem ser os nomes exatos
-    # dos campos definidos em sua classe PlanoForms
-    dados_iniciais_para_form = {
-        'nome_do_campo_no_form_nome': plano_selecionado.nome_plano,
-        'nome_do_campo_no_form_valor': plano_selecionado.valor,
-        # Adicione mais campos conforme o seu PlanoForms está definido,
-        # mapeando do objeto 'plano_selecionado' para os campos do formulário.
-        # Por exemplo, se seu formulário tem um campo 'descricao', e seu modelo Plano tem 'descricao':
-        # 'descricao': plano_selecionado.descricao,
-    }
+    # O plano selecionado e a lista completa saem do cache do catálogo,
+    # sem nenhuma consulta ao banco enquanto os planos não mudarem.
+    versao = versao_catalogo()
+    todos_os_planos = listar_planos()
+    plano_selecionado = obter_plano(plano_id, todos_os_planos)
+    if plano_selecionado is None:
+        raise Http404('Plano não encontrado.')
 
-    # Agora instancie o formulário usando 'initial'
-    form = PlanoForms(initial=dados_iniciais_para_form)
+    # O formulário do checkout já vem com o plano escolhido marcado.
+    form = CheckoutForm(initial={'plano': plano_selecionado.id}, planos=todos_os_planos)
+    return render(request, 'crm/checkout.html', contexto_checkout(plano_selecionado, todos_os_planos, form, versao))
 
-    context = {
+
+def contexto_checkout(plano_selecionado, todos_os_planos, form, versao):
+    return {
         'plano_selecionado': plano_selecionado,
         'todos_os_planos': todos_os_planos,
         'form': form, # Passe o formulário para o contexto
+        # Chave do cache das opções de plano no template.
+        'versao_catalogo': versao,
     }
-    return render(request, 'crm/checkout.html', context)
 
 
 def plano_form(request):
     form = PlanoForms()
     return render(request, 'crm/plano.html', {'form': form})
 # função para criar um novo plano.
+@limitar('criar_plano')
 def criar_plano(request): # Renomeei a função para deixar o propósito mais claro
     if request.method == 'POST':
         form = PlanoForms(request.POST) # Instancia o formulário com os dados enviados
@@ -51,12 +73,14 @@ def criar_plano(request): # Renomeei a função para deixar o propósito mais cl
             nome_plano = form.cleaned_data['nome_plano']
             valor = form.cleaned_data['valor']
             descricao = form.cleaned_data['descricao']
+            duracao_dias = form.cleaned_data['duracao_dias'] or 30
 
             # Crie uma nova instância do modelo Plano com os dados
             novo_plano = Plano(
                 nome_plano=nome_plano,
                 valor=valor,
-                descricao=descricao
+                descricao=descricao,
+                duracao_dias=duracao_dias
             )
             novo_plano.save() # Salva a nova instância no banco de dados
 
@@ -67,5 +91,153 @@ def criar_plano(request): # Renomeei a função para deixar o propósito mais cl
     return render(request, 'crm/plano.html', {'form': form})
 
 
+@require_POST
+@limitar('criar_usuario')
 def criar_usuario(request):
-    return render(request, 'crm/confirma_usuario.html')
+    """
+    Processa o formulário do checkout: cria Usuario, Barbearia e Assinatura
+    de uma vez (veja CheckoutForm.save). Se houver erros, mostra o checkout
+    de novo com as mensagens.
+    """
+    versao = versao_catalogo()
+    todos_os_planos = listar_planos()
+    form = CheckoutForm(request.POST, planos=todos_os_planos)
+    if form.is_valid():
+        assinatura = form.save()
+        return render(request, 'crm/confirma_usuario.html', {'assinatura': assinatura})
+
+    plano_selecionado = form.plano_escolhido or obter_plano(
+        _inteiro(request.POST.get('plano')), todos_os_planos
+    )
+    if plano_selecionado is None:
+        raise Http404('Plano não encontrado.')
+    return render(request, 'crm/checkout.html', contexto_checkout(plano_selecionado, todos_os_planos, form, versao))
+
+
+def _inteiro(valor):
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return None
+
+
+@staff_member_required
+def exportar_assinaturas(request):
+    """
+    Baixa as assinaturas em CSV ou JSONL, para a equipe financeira.
+    Filtros pela query string: formato, status (pode repetir), desde e ate.
+    A resposta é enviada aos poucos, conforme as linhas são lidas do banco.
+    """
+    form = ExportacaoForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest(form.errors.as_text())
+
+    formato = form.cleaned_data['formato'] or 'csv'
+    assinaturas = exportacao.filtrar_assinaturas(
+        status=form.cleaned_data['status'],
+        desde=form.cleaned_data['desde'],
+        ate=form.cleaned_data['ate'],
+    )
+    response = StreamingHttpResponse(
+        exportacao.gerar(formato, assinaturas),
+        content_type=exportacao.FORMATOS[formato],
+    )
+    response['Content-Disposition'] = f'attachment; filename="assinaturas.{formato}"'
+    return response
+
+
+@staff_member_required
+def painel(request):
+    """
+    Painel da equipe: assinaturas ativas e receita mensal por plano, e
+    assinaturas por status em cada estado. Lê só o resumo mantido em
+    crm/resumo.py, nunca a tabela de assinaturas inteira.
+    """
+    return render(request, 'crm/painel.html', resumo.painel())
+
+
+def consultar_cep(request, cep):
+    """
+    Endereço de um CEP, para o checkout preencher cidade, estado e
+    logradouro: {"cep", "logradouro", "bairro", "cidade", "estado"}, ou 404.
+    Vem do índice local de crm/ceps.py, sem consultar o banco.
+    """
+    endereco = ceps.consultar(cep)
+    if endereco is None:
+        response = JsonResponse({'erro': 'CEP não encontrado.'}, status=404)
+        if ceps.indice() is None:
+            # Sem o índice, todo CEP dá 404: uma CDN não pode guardar isso
+            # para depois de ele ser importado.
+            add_never_cache_headers(response)
+        else:
+            patch_cache_control(response, public=True, max_age=60 * 60)
+    else:
+        response = JsonResponse(endereco)
+        # A base de CEPs muda pouco: o navegador e CDNs podem guardar por um dia.
+        patch_cache_control(response, public=True, max_age=24 * 60 * 60)
+    return response
+
+
+@staff_member_required
+def autocompletar(request):
+    """
+    Autocomplete da equipe: ?q=<texto>&tipo=usuario&tipo=barbearia&tipo=plano
+    (sem 'tipo', todos). Responde {"resultados": [{"tipo", "id", "texto",
+    "url"}]}, com a URL do objeto no admin. Usa o índice de texto de
+    crm/busca.py; com menos de CRM_BUSCA_MIN_CARACTERES letras, não consulta.
+    """
+    texto = request.GET.get('q', '')
+    tipos = [tipo for tipo in request.GET.getlist('tipo') if tipo in busca.TIPOS] or busca.TIPOS
+    resultados = []
+    if len(busca.normalizar(texto).replace(' ', '')) >= getattr(settings, 'CRM_BUSCA_MIN_CARACTERES', 2):
+        resultados = busca.autocompletar(texto, tipos, getattr(settings, 'CRM_BUSCA_LIMITE', 10))
+    response = JsonResponse({'resultados': resultados})
+    # Cada tecla repete a consulta do prefixo: o navegador guarda por pouco tempo.
+    patch_cache_control(response, private=True, max_age=30)
+    return response
+
+
+@csrf_exempt
+@require_POST
+def webhook_pagamento(request):
+    """
+    Recebe as notificações do gateway de pagamento.
+
+    Corpo JSON: {"assinatura_id": 1, "id_transacao": "...", "status": "pago"}.
+    Eventos repetidos são confirmados com 200 (senão o gateway reenviaria),
+    sem alterar nada.
+    """
+    if not pagamentos.assinatura_valida(request.body, request.headers.get('X-Webhook-Assinatura')):
+        return HttpResponseForbidden('Assinatura do webhook inválida.')
+    try:
+        evento = json.loads(request.body)
+        assinatura_id = int(evento['assinatura_id'])
+        id_transacao = str(evento['id_transacao'])
+        status = evento['status']
+        if status not in pagamentos.TRANSICOES:
+            raise ValueError(status)
+    except (ValueError, KeyError, TypeError):
+        return HttpResponseBadRequest('Evento inválido.')
+
+    resultado = pagamentos.aplicar_evento(assinatura_id, id_transacao, status)
+    return JsonResponse({'resultado': resultado})
+
+
+def metricas(request):
+    """
+    Métricas do processo no formato texto do Prometheus (crm/metricas.py).
+    Com CRM_METRICAS_TOKEN configurado, exige o cabeçalho
+    "Authorization: Bearer <token>". Sem ele, só a equipe logada vê (ou
+    qualquer um, com DEBUG).
+    """
+    token = getattr(settings, 'CRM_METRICAS_TOKEN', '')
+    if token:
+        enviado = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if not hmac.compare_digest(enviado, token):
+            return HttpResponseForbidden('Token inválido.')
+    elif not (settings.DEBUG or request.user.is_staff):
+        return HttpResponseForbidden('Configure CRM_METRICAS_TOKEN ou entre como equipe.')
+    return HttpResponse(
+        registro_metricas.texto_prometheus(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
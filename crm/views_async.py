@@ -0,0 +1,87 @@
+"""
+Versões assíncronas (ASGI) das views públicas do crm.
+
+Fazem o mesmo que as views de crm/views.py, mas acessam o banco com os
+métodos async do ORM (acreate, iteração com async for), então, rodando sob
+ASGI (setup/asgi.py), uma requisição esperando o banco não ocupa uma thread
+do servidor.
+
+Para usá-las no lugar das views comuns, defina CRM_VIEWS_ASYNC=1 no
+ambiente (veja crm/urls.py).
+"""
+from asgiref.sync import sync_to_async
+
+from django.http import Http404, HttpResponseNotAllowed
+from django.shortcuts import redirect, render
+
+from crm.cache_paginas import cache_pagina
+from crm.catalogo import alistar_planos, aversao_catalogo, obter_plano
+from crm.forms import CheckoutForm, PlanoForms
+from crm.limites import limitar
+from crm.models import Plano
+from crm.views import _inteiro, contexto_checkout
+
+
+@cache_pagina
+async def index(request):
+    """Página inicial com todos os planos, ordenados pelo valor."""
+    # A versão antes dos planos, como em crm/views.py.
+    versao = await aversao_catalogo()
+    planos = await alistar_planos()
+    return render(request, 'crm/index.html', {'planos': planos, 'versao_catalogo': versao})
+
+
+@cache_pagina
+async def checkout_plano(request, plano_id):
+    versao = await aversao_catalogo()
+    todos_os_planos = await alistar_planos()
+    plano_selecionado = obter_plano(plano_id, todos_os_planos)
+    if plano_selecionado is None:
+        raise Http404('Plano não encontrado.')
+
+    form = CheckoutForm(initial={'plano': plano_selecionado.id}, planos=todos_os_planos)
+    return render(request, 'crm/checkout.html', contexto_checkout(plano_selecionado, todos_os_planos, form, versao))
+
+
+async def plano_form(request):
+    return render(request, 'crm/plano.html', {'form': PlanoForms()})
+
+
+@limitar('criar_plano')
+async def criar_plano(request):
+    if request.method == 'POST':
+        form = PlanoForms(request.POST)
+        if form.is_valid():
+            await Plano.objects.acreate(
+                nome_plano=form.cleaned_data['nome_plano'],
+                valor=form.cleaned_data['valor'],
+                descricao=form.cleaned_data['descricao'],
+                duracao_dias=form.cleaned_data['duracao_dias'] or 30,
+            )
+            return redirect('home')
+    else:
+        form = PlanoForms()
+
+    return render(request, 'crm/plano.html', {'form': form})
+
+
+@limitar('criar_usuario')
+async def criar_usuario(request):
+    # require_POST ainda não aceita views async nesta versão do Django.
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    versao = await aversao_catalogo()
+    todos_os_planos = await alistar_planos()
+    form = CheckoutForm(request.POST, planos=todos_os_planos)
+    if form.is_valid():
+        # CheckoutForm.save usa transaction.atomic, que só existe no modo
+        # síncrono: a transação inteira roda em uma thread.
+        assinatura = await sync_to_async(form.save)()
+        return render(request, 'crm/confirma_usuario.html', {'assinatura': assinatura})
+
+    plano_selecionado = form.plano_escolhido or obter_plano(
+        _inteiro(request.POST.get('plano')), todos_os_planos
+    )
+    if plano_selecionado is None:
+        raise Http404('Plano não encontrado.')
+    return render(request, 'crm/checkout.html', contexto_checkout(plano_selecionado, todos_os_planos, form, versao))
@@ -17,6 +17,9 @@ from dotenv import load_dotenv
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Variáveis do arquivo .env (se existir); as já definidas no ambiente valem mais.
+load_dotenv(BASE_DIR / '.env')
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/4.1/howto/deployment/checklist/
@@ -25,9 +28,12 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = str(os.getenv('SECRET_KEY'))
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.getenv('DEBUG', '1') == '1'
 
-ALLOWED_HOSTS = []
+# Os sites das barbearias (cms/tenants.py) também precisam estar aqui: o
+# domínio dos subdomínios com um ponto na frente (.barbersites.com.br) e cada
+# domínio próprio cadastrado.
+ALLOWED_HOSTS = [host.strip() for host in os.getenv('ALLOWED_HOSTS', '').split(',') if host.strip()]
 
 
 # Application definition
@@ -44,7 +50,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Primeiro da lista, para medir a requisição inteira (crm/middleware.py).
+    'crm.middleware.InstrumentacaoMiddleware',
+    # Leitura da réplica só quando não há gravação recente (crm/roteamento.py).
+    'crm.roteamento.LeituraAposEscritaMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # Troca as rotas quando o host é o de um site de barbearia (cms/middleware.py).
+    'cms.middleware.SiteBarbeariaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -55,12 +67,22 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'setup.urls'
 
+# Fora do DEBUG, cada template é lido e compilado uma vez por processo
+# (cached.Loader) e só renderizado a cada requisição. Com DEBUG, os templates
+# são relidos a cada renderização, para as edições aparecerem na hora.
+_CARREGADORES_TEMPLATES = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR,'templates')],
-        'APP_DIRS': True,
         'OPTIONS': {
+            'loaders': _CARREGADORES_TEMPLATES if DEBUG else [
+                ('django.template.loaders.cached.Loader', _CARREGADORES_TEMPLATES),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -76,57 +98,174 @@ WSGI_APPLICATION = 'setup.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
-# Build paths inside the project like this: BASE_DIR / 'subdir'.
-#BASE_DIR = Path(__file__).resolve().parent.parent # Esta é a linha crucial para BASE_DIR
-#DATABASES = {
- #   'default': {
- #       'ENGINE': 'django.db.backends.sqlite3',  # Define o motor do banco de dados como SQLite
- #       'NAME': BASE_DIR / 'db.sqlite3',       # Define o caminho completo para o arquivo do banco de dados SQLite.
- #                                              # BASE_DIR é uma variável do Django que aponta para a raiz do seu projeto.
- #                                              # Isso criará (ou usará) um arquivo chamado db.sqlite3 na raiz do seu projeto.
- #   }
-#}
-
-# Seu arquivo settings.py
-
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.mysql',
-        'NAME': 'barbearia_db',
-        'USER': 'root',
-        'PASSWORD': 'senac',
-        'HOST': 'localhost',  # Ou o IP do seu servidor MySQL, se não for local
-        'PORT': '3307',      # A porta padrão do MySQL. Mude se for diferente
-        'OPTIONS': {
-            'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
-        },
-         'test': { # Adicione esta seção para o banco de dados de teste
+# Tudo vem do ambiente (ou do arquivo .env na raiz; veja .env.exemplo).
+# DB_ENGINE=sqlite usa um arquivo local (DB_NAME, padrão db.sqlite3).
+#
+# Conexões persistentes: cada processo/thread reaproveita a sua conexão por
+# até DB_CONN_MAX_AGE segundos, em vez de abrir uma nova a cada requisição.
+# CONN_HEALTH_CHECKS confere, no início de cada requisição, se a conexão
+# reaproveitada ainda responde (ex.: depois do wait_timeout do MySQL) e a
+# reabre se preciso. Sob ASGI (CRM_VIEWS_ASYNC), use DB_CONN_MAX_AGE=0.
+DB_ENGINE = os.getenv('DB_ENGINE', 'mysql')
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', '60'))
+
+
+def _banco(host=None, port=None):
+    conexao = {
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS', '1') == '1',
+    }
+    if DB_ENGINE == 'sqlite':
+        return {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / os.getenv('DB_NAME', 'db.sqlite3'),
+            **conexao,
+        }
+    return {
         'ENGINE': 'django.db.backends.mysql',
-        'NAME': 'barbearia_db_test',  # <--- MUITO IMPORTANTE: UM NOME DIFERENTE PARA O BANCO DE DADOS DE TESTE
-        'USER': 'root',
-        'PASSWORD': 'senac',
-        'HOST': 'localhost',
-        'PORT': '3307',
+        'NAME': os.getenv('DB_NAME', 'barbearia_db'),
+        'USER': os.getenv('DB_USER', 'root'),
+        'PASSWORD': os.getenv('DB_PASSWORD', ''),
+        'HOST': host or os.getenv('DB_HOST', 'localhost'),
+        'PORT': port or os.getenv('DB_PORT', '3307'),
+        **conexao,
         'OPTIONS': {
             'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
         },
         'TEST': {
-            'NAME': 'barbearia_db_test', # Garante que o Django use este banco para testes
-            # Opcional: Adicione charset e collation se tiver problemas de codificação
+            'NAME': os.getenv('DB_TEST_NAME', 'barbearia_db_test'),
             'CHARSET': 'utf8mb4',
             'COLLATION': 'utf8mb4_unicode_ci',
         },
-      }
     }
-}
 
 
+DATABASES = {'default': _banco()}
 
+# Réplicas de leitura, como "host:porta" separados por vírgula, com as mesmas
+# credenciais do principal: DB_REPLICAS=replica1.interna:3306,replica2.interna
+# Viram os aliases 'replica1', 'replica2'... (veja CRM_REPLICAS abaixo).
+for _numero, _endereco in enumerate(filter(None, os.getenv('DB_REPLICAS', '').split(',')), start=1):
+    _host, _, _port = _endereco.strip().partition(':')
+    DATABASES[f'replica{_numero}'] = _banco(_host, _port)
+    # Nos testes, a réplica aponta para o mesmo banco de teste do principal.
+    DATABASES[f'replica{_numero}']['TEST'] = {'MIRROR': 'default'}
 
 
+# Réplicas de leitura (crm/roteamento.py), configuradas por DB_REPLICAS.
+# Catálogo de planos, exportação e painel passam a ler delas; o resto
+# continua no 'default'.
+DATABASE_ROUTERS = ['crm.roteamento.RoteadorReplicas']
+CRM_REPLICAS = [alias for alias in DATABASES if alias.startswith('replica')]
+# Depois de uma gravação (POST etc.), por quantos segundos o mesmo navegador
+# continua lendo do banco principal, para ver o que acabou de gravar.
+CRM_REPLICA_FIXACAO_SEGUNDOS = 5
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+# Por padrão usamos o cache em memória local (um por processo). Em produção,
+# basta trocar o BACKEND por Redis ou Memcached pelo ambiente; o código não muda:
+#   CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+#   CACHE_LOCATION=redis://127.0.0.1:6379/1
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'barbersites'),
+    }
+}
 
+# Alias (em CACHES) usado pelo cache do catálogo de planos (crm/catalogo.py).
+CRM_CACHE_CATALOGO = 'default'
+# Alias usado pelo cache das páginas renderizadas (crm/cache_paginas.py).
+CRM_CACHE_PAGINAS = 'default'
+
+# Segredo compartilhado com o gateway para validar o webhook de pagamento
+# (HMAC-SHA256 do corpo, no cabeçalho X-Webhook-Assinatura).
+PAGAMENTO_WEBHOOK_SEGREDO = os.getenv('PAGAMENTO_WEBHOOK_SEGREDO', '')
+
+# Limite de tentativas nos formulários públicos (crm/limites.py): por regra,
+# (tentativas, janela em segundos) por IP e por valor de campo do POST.
+# Excedido o limite, a view nem roda: a resposta é 429 com Retry-After.
+CRM_LIMITES = {
+    'criar_usuario': {'ip': (10, 60), 'email': (3, 600)},
+    'criar_plano': {'ip': (5, 60)},
+}
+# Alias (em CACHES) dos contadores; com vários processos, use um cache
+# compartilhado (Redis/Memcached), senão cada processo conta à parte.
+CRM_CACHE_LIMITES = 'default'
+# Quantos proxies confiáveis (nginx, balanceador) acrescentam o
+# X-Forwarded-For; 0 usa o REMOTE_ADDR.
+CRM_LIMITE_PROXIES = int(os.getenv('CRM_LIMITE_PROXIES', '0'))
+
+# Índice local de CEPs (crm/ceps.py), gerado por manage.py importar_ceps, e
+# quantas consultas recentes cada processo guarda em memória.
+CRM_CEP_INDICE = os.getenv('CRM_CEP_INDICE') or str(BASE_DIR / 'dados' / 'ceps.idx')
+CRM_CEP_CACHE = 4096
+
+# Sites das barbearias (cms/). Cada site responde em <endereço>.CMS_DOMINIO_SITES
+# e no domínio próprio, se tiver; os hosts de CMS_HOSTS_PRINCIPAIS (além do
+# próprio CMS_DOMINIO_SITES e do www dele) são os da aplicação (home,
+# checkout, admin) e nunca são procurados como site.
+CMS_DOMINIO_SITES = os.getenv('CMS_DOMINIO_SITES', '')
+CMS_HOSTS_PRINCIPAIS = {
+    host.strip().lower()
+    for host in (os.getenv('CMS_HOSTS_PRINCIPAIS') or 'localhost,127.0.0.1,testserver').split(',')
+    if host.strip()
+}
+# Cache em memória, por processo, de host -> site (cms/tenants.py).
+CMS_TENANTS_SEGUNDOS = 30
+CMS_TENANTS_MAXIMO = 10000
+# Alias (em CACHES) das páginas renderizadas dos sites (cms/paginas.py) e por
+# quanto tempo navegadores e CDNs podem guardá-las.
+CMS_CACHE_PAGINAS = 'default'
+CMS_PAGINA_MAX_AGE = 60
+# Onde manage.py build_sites grava os sites gerados (cms/geracao.py).
+CMS_SITES_ESTATICOS = os.getenv('CMS_SITES_ESTATICOS') or str(BASE_DIR / 'sites_estaticos')
+
+# Busca da equipe (crm/busca.py). No MySQL, CRM_BUSCA_MIN_TOKEN deve ser o
+# innodb_ft_min_token_size do servidor: termos menores ficam fora do índice.
+CRM_BUSCA_MIN_TOKEN = int(os.getenv('CRM_BUSCA_MIN_TOKEN', '3'))
+# Autocomplete em /busca/: letras mínimas para consultar e resultados por tipo.
+CRM_BUSCA_MIN_CARACTERES = 2
+CRM_BUSCA_LIMITE = 10
+
+# Fila de tarefas no banco (crm/fila.py), executada por manage.py run_worker:
+# trabalhadores (threads) por processo e em quantos segundos uma tarefa presa
+# em 'executando' (processo morto) volta para a fila.
+CRM_FILA_THREADS = int(os.getenv('CRM_FILA_THREADS', '2'))
+CRM_FILA_TEMPO_TRAVADA = 15 * 60
+# A cada quantos itens tratados uma tarefa grava o progresso no banco.
+CRM_FILA_PROGRESSO = int(os.getenv('CRM_FILA_PROGRESSO', '100'))
+# Destinatários por tarefa de notificação (crm/notificacoes.py).
+CRM_NOTIFICACOES_LOTE = 200
+
+# E-mail (notificações). Sem EMAIL_BACKEND, com DEBUG, os e-mails só aparecem
+# no console.
+EMAIL_BACKEND = os.getenv('EMAIL_BACKEND') or (
+    'django.core.mail.backends.console.EmailBackend' if DEBUG else 'django.core.mail.backends.smtp.EmailBackend'
+)
+EMAIL_HOST = os.getenv('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.getenv('EMAIL_PORT', '587'))
+EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', '1') == '1'
+EMAIL_TIMEOUT = 30
+DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'BarberSites <nao-responda@barbersites.com.br>')
+
+# Usa as views async de crm/views_async.py nas páginas públicas. Ligue ao
+# servir a aplicação via ASGI (setup/asgi.py): CRM_VIEWS_ASYNC=1
+CRM_VIEWS_ASYNC = os.getenv('CRM_VIEWS_ASYNC') == '1'
+
+# Instrumentação das requisições (crm/middleware.py): consultas SQL, tempo de
+# banco, de templates e total, no cabeçalho Server-Timing e em /metricas/.
+# Ligue por ambiente com CRM_INSTRUMENTACAO=1; a amostragem (0 a 1) define a
+# fração das requisições medidas.
+CRM_INSTRUMENTACAO = os.getenv('CRM_INSTRUMENTACAO') == '1'
+CRM_INSTRUMENTACAO_AMOSTRAGEM = float(os.getenv('CRM_INSTRUMENTACAO_AMOSTRAGEM', '1'))
+# Se definido, /metricas/ exige "Authorization: Bearer <token>"; senão, fora
+# do DEBUG, só a equipe logada a vê.
+CRM_METRICAS_TOKEN = os.getenv('CRM_METRICAS_TOKEN', '')
 
 # Esta linha é opcional, mas recomendada se estiver usando Django 3.2 ou superior.
 # Garante que os campos de chave primária auto-gerados sejam BigAutoField (64-bit inteiro)
@@ -175,6 +314,24 @@ STATICFILES_DIRS = [
 ]
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
+# Em produção (DEBUG=0) o collectstatic põe o hash do conteúdo no nome de cada
+# arquivo, gera variantes WebP das imagens grandes e cópias .gz/.br dos
+# arquivos de texto (crm/estaticos.py). Com DEBUG, os arquivos são servidos
+# como estão, direto de STATICFILES_DIRS.
+if not DEBUG:
+    STATICFILES_STORAGE = 'crm.estaticos.ArmazenamentoEstatico'
+# Imagens que ganham variantes WebP redimensionadas (crm/imagens.py), e as
+# larguras geradas (nunca maiores que a original).
+CRM_IMAGENS_VARIANTES = ['assets/banner*.png', 'assets/template*.png']
+CRM_LARGURAS_IMAGENS = [480, 960, 1600]
+# Sem um servidor web na frente, a própria aplicação serve STATIC_ROOT, com
+# as cópias comprimidas e cache imutável para os nomes com hash:
+# CRM_SERVIR_ESTATICOS=1
+CRM_SERVIR_ESTATICOS = os.getenv('CRM_SERVIR_ESTATICOS') == '1'
+
+MEDIA_URL = 'media/'
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 
@@ -0,0 +1,24 @@
+"""
+Configuração para rodar os testes sem o MySQL, com dois bancos SQLite:
+o principal e uma "réplica" separada, usada pelos testes de roteamento
+(crm/roteamento.py).
+
+    python manage.py test --settings=setup.settings_teste
+"""
+from setup.settings import *  # noqa: F401,F403
+from setup.settings import BASE_DIR
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'teste.sqlite3',
+    },
+    # Não é espelho do 'default' de propósito: os testes conferem de qual
+    # banco cada leitura veio.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'teste_replica.sqlite3',
+    },
+}
+# Os testes de roteamento ligam a réplica com override_settings.
+CRM_REPLICAS = []
@@ -1,10 +1,17 @@
 from django.contrib import admin
-from django.urls import path,include
+from django.urls import path,include,re_path
 from django.conf import settings
 from django.conf.urls.static import static
 
+from crm.estaticos import servir_estatico
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('sites/', include('cms.urls')),
     path('',include('crm.urls')),  
        
 ]+ static(settings.MEDIA_URL,document_root=settings.MEDIA_ROOT)
+
+# Arquivos do collectstatic servidos pela aplicação (crm/estaticos.py).
+if settings.CRM_SERVIR_ESTATICOS:
+    urlpatterns.insert(0, re_path(r'^%s(?P<caminho>.*)$' % settings.STATIC_URL.lstrip('/'), servir_estatico))